@@ -0,0 +1,29 @@
+//SPDX-License-Identifier: UNLICENSED
+pragma solidity ^0.8;
+
+// Generic batch query contract: runs any list of view calls in a single eth_call.
+// A call that reverts, runs out of gas or targets an address without code does not make the batch fail,
+// its success flag is set to false instead.
+contract BatchQuery {
+    struct Call {
+        address target;
+        bytes callData;
+    }
+
+    struct Result {
+        bool success;
+        bytes returnData;
+    }
+
+    // gasPerCall bounds the gas of each call, so that a single bad token cannot use up the gas of the whole batch
+    function batchCall(Call[] calldata calls, uint256 gasPerCall) external view returns (Result[] memory results) {
+        results = new Result[](calls.length);
+        for (uint i = 0; i < calls.length; i++) {
+            address target = calls[i].target;
+            if (target.code.length == 0) {
+                continue;
+            }
+            (results[i].success, results[i].returnData) = target.staticcall{gas: gasPerCall}(calls[i].callData);
+        }
+    }
+}
\ No newline at end of file
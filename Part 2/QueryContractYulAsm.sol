@@ -20,7 +20,14 @@ contract UniswapFlashQuery {
                 let pair := calldataload(add(_pairs.offset, mul(i, 0x20)))
                     
                 // Call the getReserves() function, write the return data to the preallocated memory for the "result" array.
-                let success := staticcall(gas(), pair, callData, 0x04, add(add(result, 0x20),mul(i, size)), size)
+                let slot := add(add(result, 0x20), mul(i, size))
+                let success := staticcall(gas(), pair, callData, 0x04, slot, size)
+
+                // Mark failed calls (reverts, or addresses that return less than 3 words) by setting blockTimestampLast to 2^256-1.
+                // A real blockTimestampLast is a uint32, so the caller can tell them apart from pools with zero reserves.
+                if or(iszero(success), lt(returndatasize(), size)) {
+                    mstore(add(slot, 0x40), not(0))
+                }
             }
 
             // Update the free memory pointer
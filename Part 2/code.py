@@ -1,8 +1,15 @@
 # %%
 # The following script reads the event PairCreacted from the Uniswap V2 Factory contract and prints the list of all pairs created on the Uniswap V2 protocol.
 # Imports
+import os
+import sys
 from web3 import Web3
 
+# Modules shared with Part 3 (rpc_transport.py, contract_cache.py), next to this file, or to the current directory in
+# a notebook
+PART3_DIR = os.path.join(os.path.dirname(os.path.abspath(globals().get("__file__", "code.py"))), "..", "Part 3")
+sys.path.append(PART3_DIR)
+
 # Connect to a local node
 NODE_URI = 'https://mainnet.infura.io/v3/0ce674ab414048f580429a5bca905096'
 w3 = Web3(Web3.HTTPProvider(NODE_URI))
@@ -160,28 +167,21 @@ contract UniswapFlashQuery {
 """
 
 # %%
-import solcx
+from contract_cache import compile_source_cached
 version = "0.8.0"
 filename = "UniswapFlashQuery.sol"
 Output = "ir"
 
-compiled_sol = solcx.compile_standard(
-    {
-        "language": "Solidity",
-        "sources": {filename: {"content": contractContent}},
-        "settings": {
-            "outputSelection": {
-                "*": {"*": ["abi", "metadata", "evm.bytecode", "evm.sourceMap",Output]}
-            }
-        },
-    },
-    solc_version=version,
-)
-
+# The compiler output is cached in the build/ directory of Part 3 (see contract_cache.py), under a key made of the
+# source and of the compiler settings, so that running the script again does not compile the contract again. solcx is
+# only imported when compiling.
 name = filename.split('.')[0]
-res_bytecode = compiled_sol["contracts"][filename][name]["evm"]["bytecode"]["object"]
-queryAbi = compiled_sol["contracts"][filename][name]["abi"]
-# print(compiled_sol["contracts"][filename][name][Output])
+compiled_contract = compile_source_cached(
+    contractContent, filename, name, ["abi", "metadata", "evm.bytecode", "evm.sourceMap", Output], version
+)
+res_bytecode = compiled_contract["evm"]["bytecode"]["object"]
+queryAbi = compiled_contract["abi"]
+# print(compiled_contract[Output])
 
 # Export the bytecode
 print(f"Bytecode: {res_bytecode[:100]}...")
@@ -231,17 +231,19 @@ queryContractAddress = "0x6c618c74235c70DF9F6AD47c6b5E9c8D3876432B"
 # %%
 # This code splits the request into chunks that are sent concurrently to the node.
 import asyncio
-from web3 import AsyncHTTPProvider
 from web3.eth import AsyncEth
 import time
+from rpc_transport import BatchingProvider
 # If you test this code in a Jupyter notebook, sligh modifications are needed like nest_asyncio.apply() (google for more info)
 # [...]
 
 # Create a function that takes a list of pair data, and returns a list of reserves for each pair
-async def getReservesAsync(pairs, chunkSize=1000):
-    # Create an async web3 provider instance
-    w3Async = Web3(AsyncHTTPProvider(NODE_URI), modules={'eth': (AsyncEth)})
+# Create an async web3 provider instance, once: its HTTP session and connections are reused by every call.
+# The batching transport of Part 3 sends the concurrent eth_call of the chunks together as one JSON-RPC batch, over a
+# keep-alive session. Web3(AsyncHTTPProvider(NODE_URI), modules={'eth': (AsyncEth)}) works too.
+w3Async = Web3(BatchingProvider(NODE_URI), modules={'eth': (AsyncEth)})
 
+async def getReservesAsync(pairs, chunkSize=1000):
     # Create contract object
     queryContract = w3Async.eth.contract(address=queryContractAddress, abi=queryAbi)
 
@@ -276,7 +278,7 @@ NODE_URIS = [
     "https://mainnet.infura.io/v3/<YOUR_INFURA_ID>",
     "https://mainnet.infura.io/v3/<YOUR_INFURA_ID>"
 ]
-providerList = [Web3(AsyncHTTPProvider(uri), modules={'eth': (AsyncEth)}) for uri in NODE_URIS]
+providerList = [Web3(BatchingProvider(uri), modules={'eth': (AsyncEth)}) for uri in NODE_URIS]
 
 async def getReservesParallel(pairs, providers, chunkSize=1000):
     # Create the contract objects
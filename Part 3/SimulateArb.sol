@@ -0,0 +1,51 @@
+// SPDX-License-Identifier: MIT
+pragma solidity ^0.8.0;
+
+interface IUniswapV2Pair {
+    function token0() external view returns (address);
+    function getReserves() external view returns (uint112 reserve0, uint112 reserve1, uint32 blockTimestampLast);
+    function swap(uint amount0Out, uint amount1Out, address to, bytes calldata data) external;
+}
+
+interface IWETH {
+    function deposit() external payable;
+}
+
+interface IERC20 {
+    function transfer(address recipient, uint256 amount) external returns (bool);
+    function balanceOf(address account) external view returns (uint256);
+}
+
+// Executes a two-pool arbitrage (WETH -> token on poolA, token -> WETH on poolB) inside an eth_call.
+// The code is never deployed: simulator.py injects it at a fixed address with a state override, and sends the input
+// as msg.value from an account whose balance is overridden too.
+contract SimulateArb {
+    address constant WETH = 0xC02aaA39b223FE8D0A0e5C4F27eAD9083C756Cc2;
+
+    function getAmountOut(uint amountIn, uint reserveIn, uint reserveOut) internal pure returns (uint) {
+        uint amountInWithFee = amountIn * 997;
+        return amountInWithFee * reserveOut / (reserveIn * 1000 + amountInWithFee);
+    }
+
+    // Swap the tokenIn that the pair received on top of its reserves, sending the output to `to`.
+    // The input is measured from the balance of the pair, so fee-on-transfer tokens are accounted for.
+    function swapReceived(IUniswapV2Pair pair, address tokenIn, address to) internal returns (uint amountIn, uint amountOut) {
+        (uint reserve0, uint reserve1, ) = pair.getReserves();
+        bool zeroForOne = pair.token0() == tokenIn;
+        (uint reserveIn, uint reserveOut) = zeroForOne ? (reserve0, reserve1) : (reserve1, reserve0);
+        amountIn = IERC20(tokenIn).balanceOf(address(pair)) - reserveIn;
+        amountOut = getAmountOut(amountIn, reserveIn, reserveOut);
+        (uint amount0Out, uint amount1Out) = zeroForOne ? (uint(0), amountOut) : (amountOut, uint(0));
+        pair.swap(amount0Out, amount1Out, to, new bytes(0));
+    }
+
+    // Returns the WETH received at the end, the token amount sent by poolA and received by poolB, and the gas used
+    function simulate(IUniswapV2Pair poolA, IUniswapV2Pair poolB, address token) external payable returns (uint wethOut, uint tokenOut, uint tokenReceived, uint gasUsed) {
+        uint gasStart = gasleft();
+        IWETH(WETH).deposit{value: msg.value}();
+        IERC20(WETH).transfer(address(poolA), msg.value);
+        (, tokenOut) = swapReceived(poolA, WETH, address(poolB));
+        (tokenReceived, wethOut) = swapReceived(poolB, token, address(this));
+        gasUsed = gasStart - gasleft();
+    }
+}
\ No newline at end of file
@@ -0,0 +1,131 @@
+# Historical backtest of the two-pool strategy over a log archive (see log_archive.py), without a live node.
+# The block range is split in sub-ranges evaluated on worker processes. Each worker rebuilds the reserves at the start
+# of its range from the archive, starting from the reserves saved at the end of the previous chunk, then applies the
+# Sync logs block by block. After each block, the combinations of the pools that changed are evaluated and the best one
+# is taken as the trade of the bot (estimated profit). The trade would land in the next block: its realised profit is
+# the profit of the same input on the reserves after that block, and it counts as taken by a competitor if one of its
+# pools had a Swap in that block.
+import multiprocessing
+
+import numpy as np
+
+from log_archive import LogArchive
+from opp_index import OpportunityIndex
+from opp_scanner import FEE, evaluate_combinations, trade_profit
+from snapshot_log import words_to_float
+from stream_pipeline import TopK
+
+# Context of the worker processes, set by _init_worker() when each worker starts
+_context = {}
+
+
+def _init_worker(context):
+    _context.update(context)
+
+
+def _apply_syncs(pair_arrays, pools, words):
+    # Keep the last Sync of each pool of the block
+    last = len(pools) - 1 - np.unique(pools[::-1], return_index=True)[1]
+    pools = pools[last]
+    pair_arrays.set_raw_reserves_at(pools, words_to_float(words[last]))
+    return pools
+
+
+# Backtest the blocks [fromBlock, toBlock] in this process. Returns the statistics of the range.
+def backtest_range(blockRange):
+    fromBlock, toBlock = blockRange
+    pair_arrays = _context["pair_arrays"]
+    poolCombos, poolOffsets = _context["poolCombos"], _context["poolOffsets"]
+    gasCost, fee = _context["gasCost"], _context["fee"]
+    archive = LogArchive(_context["archivePath"])
+
+    pair_arrays.set_raw_reserves(words_to_float(archive.state_at(fromBlock - 1)))
+    stats = {"blocks": 0, "opportunities": 0, "trades": 0, "estimated": 0.0, "realised": 0.0, "taken": 0}
+    best = TopK(_context["topK"])
+    pending = None # (block, poolA, poolB, input in Wei, estimated net profit in ETH)
+
+    def settle(block, swapPools):
+        nonlocal pending
+        detectedBlock, poolA, poolB, x, estimated = pending
+        realised = estimated
+        if block == detectedBlock + 1:
+            # The reserves of the pools changed in the block where the trade would have landed
+            reserves = pair_arrays.reserves
+            gross = trade_profit(x, reserves[poolA, 0], reserves[poolA, 1], reserves[poolB, 0], reserves[poolB, 1], fee)
+            realised = float(gross) / 1e18 - gasCost
+            if poolA in swapPools or poolB in swapPools:
+                stats["taken"] += 1
+        stats["trades"] += 1
+        stats["estimated"] += estimated
+        stats["realised"] += realised
+        best.push(estimated, (detectedBlock, poolA, poolB, x / 1e18, realised))
+        pending = None
+
+    # The logs of toBlock + 1 are read too, to settle the trade found at toBlock
+    for chunk in archive.chunks(fromBlock, toBlock + 1):
+        syncBlocks, syncPools, syncWords = chunk["sync_block"], chunk["sync_pool"], chunk["sync_words"]
+        swapBlocks, swapPools = chunk["swap_block"], chunk["swap_pool"]
+        starts = np.flatnonzero(np.diff(syncBlocks, prepend=-1))
+        ends = np.append(starts[1:], len(syncBlocks))
+        for start, end in zip(starts.tolist(), ends.tolist()):
+            block = int(syncBlocks[start])
+            dirty = _apply_syncs(pair_arrays, syncPools[start:end], syncWords[start:end])
+            if pending is not None:
+                lo, hi = np.searchsorted(swapBlocks, [block, block + 1])
+                settle(block, set(swapPools[lo:hi].tolist()))
+            if block > toBlock:
+                break
+
+            # Evaluate the combinations of the pools that changed
+            stats["blocks"] += 1
+            combos = np.unique(np.concatenate([poolCombos[poolOffsets[p]:poolOffsets[p + 1]] for p in dirty.tolist()]))
+            if len(combos) == 0:
+                continue
+            idx_a = pair_arrays.idx_a[combos]
+            idx_b = pair_arrays.idx_b[combos]
+            x, profit, ok = evaluate_combinations(pair_arrays.reserves, idx_a, idx_b, fee)
+            net_profit = np.where(ok, profit / 1e18 - gasCost, -np.inf)
+            stats["opportunities"] += int(np.count_nonzero(net_profit > 0))
+            k = int(np.argmax(net_profit))
+            if net_profit[k] > 0:
+                pending = (block, int(idx_a[k]), int(idx_b[k]), float(x[k]), float(net_profit[k]))
+
+    # No log after the last trade: the reserves did not change, it is realised as estimated
+    if pending is not None:
+        settle(None, set())
+    stats["top"] = best.snapshot()
+    return stats
+
+
+# Backtest the blocks [fromBlock, toBlock] of an archive whose pools are those of pair_arrays, on `workers` processes.
+# gasCost is the cost of one trade in ETH. Returns the merged statistics: blocks with Sync logs, profitable
+# combinations, trades, estimated and realised net profit in ETH, trades taken by a competitor, and the topK best
+# trades as (estimated, (block, poolA, poolB, input, realised)).
+def backtest(archivePath, pair_arrays, fromBlock, toBlock, gasCost=0.0, workers=None, rangesPerWorker=4, topK=20, fee=FEE):
+    workers = workers or multiprocessing.cpu_count()
+    index = OpportunityIndex(pair_arrays)
+    workerContext = dict(
+        pair_arrays=pair_arrays,
+        poolCombos=index.poolCombos,
+        poolOffsets=index.poolOffsets,
+        gasCost=gasCost,
+        fee=fee,
+        archivePath=archivePath,
+        topK=topK,
+    )
+    bounds = np.linspace(fromBlock, toBlock + 1, workers * rangesPerWorker + 1).astype(np.int64)
+    ranges = [(int(a), int(b) - 1) for a, b in zip(bounds[:-1], bounds[1:]) if b > a]
+
+    # The context is passed to the initializer of each worker: inherited without a copy under fork, pickled once per
+    # worker under spawn
+    context = multiprocessing.get_context("fork" if "fork" in multiprocessing.get_all_start_methods() else None)
+    with context.Pool(workers, initializer=_init_worker, initargs=(workerContext,)) as pool:
+        results = pool.map(backtest_range, ranges)
+
+    merged = {key: sum(result[key] for result in results) for key in results[0] if key != "top"} if results else {}
+    top = TopK(topK)
+    for result in results:
+        for estimated, trade in result["top"]:
+            top.push(estimated, trade)
+    merged["top"] = top.snapshot()
+    return merged
@@ -0,0 +1,153 @@
+# Client for BatchQuery.sol (article 2 folder): any list of view calls (token0(), decimals(), balanceOf(), ...) on any
+# contracts, in one eth_call per chunk. Calls are packed by hand in the ABI layout of
+# batchCall((address,bytes)[],uint256), each result carries its own success flag, and the answers are decoded in bulk
+# per return type instead of one contract object and one round-trip per call.
+import asyncio
+import functools
+import os
+import re
+
+import numpy as np
+from eth_abi import decode, encode
+from eth_utils import keccak, to_checksum_address
+
+from contract_cache import compile_cached
+
+# 4-byte selector of batchCall((address,bytes)[],uint256), i.e. keccak256("batchCall((address,bytes)[],uint256)")[:4]
+BATCH_SELECTOR = bytes.fromhex("3db2f0cb")
+
+# Return types made of a single 32-byte word, decoded without the generic ABI decoder
+WORD_TYPES = re.compile(r"^(u?int\d*|address|bool|bytes32)$")
+
+BATCH_QUERY_SOURCE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "Part 2", "BatchQuery.sol")
+
+
+def _word(value):
+    return value.to_bytes(32, "big")
+
+
+def _padded(data):
+    return data + bytes(-len(data) % 32)
+
+
+# 4-byte selector of a function signature, hashed once per signature (view_call() is built for every token)
+@functools.lru_cache(maxsize=None)
+def function_selector(signature):
+    return bytes(keccak(text=signature)[:4])
+
+
+# A view call: (target, callData, returns). signature is the function signature, e.g. "balanceOf(address)", args its
+# arguments and returns the tuple of returned types, e.g. ("uint256",).
+def view_call(target, signature, args=(), returns=("uint256",)):
+    selector = function_selector(signature)
+    argTypes = signature[signature.index("(") + 1 : -1]
+    callData = selector + (encode(argTypes.split(","), args) if argTypes else b"")
+    return target, callData, tuple(returns)
+
+
+# ABI-encode a call to batchCall(calls, gasPerCall)
+def encode_batch(calls, gasPerCall):
+    elements = [
+        bytes(12) + bytes.fromhex(target[2:]) + _word(64) + _word(len(callData)) + _padded(callData)
+        for target, callData, _ in calls
+    ]
+    offsets = []
+    position = 32 * len(elements)
+    for element in elements:
+        offsets.append(_word(position))
+        position += len(element)
+    return (
+        BATCH_SELECTOR + _word(64) + _word(gasPerCall) + _word(len(calls)) + b"".join(offsets) + b"".join(elements)
+    )
+
+
+# Decode the Result[] answer of batchCall() into a list of (success, returnData)
+def decode_batch(raw):
+    view = memoryview(bytes(raw))
+    start = int.from_bytes(view[0:32], "big")
+    n = int.from_bytes(view[start : start + 32], "big")
+    base = start + 32
+    results = []
+    for i in range(n):
+        element = base + int.from_bytes(view[base + 32 * i : base + 32 * i + 32], "big")
+        success = view[element + 31] == 1
+        data = element + int.from_bytes(view[element + 32 : element + 64], "big")
+        length = int.from_bytes(view[data : data + 32], "big")
+        results.append((success, bytes(view[data + 32 : data + 32 + length])))
+    return results
+
+
+def _decode_word(returnType, data):
+    if returnType == "address":
+        return to_checksum_address("0x" + data[12:32].hex())
+    if returnType == "bool":
+        return data[31] == 1
+    if returnType == "bytes32":
+        return data[:32]
+    value = int.from_bytes(data[:32], "big")
+    if returnType.startswith("int") and value >= 2**255:
+        value -= 2**256
+    return value
+
+
+# Decode the results of the calls, grouped by return type.
+# Returns (values, ok): values[i] is the decoded value (a tuple when several types are returned, None when the call
+# failed or its answer could not be decoded) and ok a boolean array.
+def decode_results(calls, results):
+    values = [None] * len(calls)
+    ok = np.zeros(len(calls), dtype=bool)
+    groups = {}
+    for i, ((_, _, returns), (success, data)) in enumerate(zip(calls, results)):
+        if success and len(data) >= 32 * len(returns):
+            groups.setdefault(returns, []).append(i)
+    for returns, indices in groups.items():
+        if len(returns) == 1 and WORD_TYPES.match(returns[0]):
+            for i in indices:
+                values[i] = _decode_word(returns[0], results[i][1])
+                ok[i] = True
+            continue
+        for i in indices:
+            try:
+                decoded = decode(list(returns), results[i][1])
+            except Exception:
+                continue
+            values[i] = decoded[0] if len(returns) == 1 else decoded
+            ok[i] = True
+    return values, ok
+
+
+# Run a chunk of calls through batchCall() and return the raw (success, returnData) list
+async def callBatch(provider, batchAddress, calls, gasPerCall=200000):
+    raw = await provider.eth.call({"to": batchAddress, "data": encode_batch(calls, gasPerCall)})
+    return decode_batch(raw)
+
+
+# Same approach as getReservesParallel(): the calls are split in chunks sent concurrently, assigned to the providers
+# in a round-robin fashion. Returns (values, ok) in the order of calls, see decode_results().
+async def batchCallParallel(calls, providers, batchAddress, chunkSize=500, gasPerCall=200000):
+    # Create a list of chunks of calls
+    chunks = [calls[i : i + chunkSize] for i in range(0, len(calls), chunkSize)]
+
+    # Assign each chunk to a provider in a round-robin fashion
+    tasks = [callBatch(providers[i % len(providers)], batchAddress, chunk, gasPerCall) for i, chunk in enumerate(chunks)]
+
+    # Run the tasks in parallel
+    results = await asyncio.gather(*tasks)
+
+    # Flatten the results and decode them
+    results = [item for sublist in results for item in sublist]
+    return decode_results(calls, results)
+
+
+# Compile BatchQuery.sol with solcx, as in article 2, or read it from the cache (see contract_cache.py).
+# Returns (bytecode, abi).
+def compileBatchQuery(path=BATCH_QUERY_SOURCE, version="0.8.0"):
+    contract = compile_cached(path, "BatchQuery", ["abi", "evm.bytecode"], version)
+    return contract["evm"]["bytecode"]["object"], contract["abi"]
+
+
+# Deploy the contract on a local node (anvil), from one of its unlocked accounts. Returns the contract address.
+def deployBatchQuery(provider, sender, bytecode):
+    tx_hash = provider.eth.send_transaction({"from": sender, "data": "0x" + bytecode.removeprefix("0x")})
+    receipt = provider.eth.wait_for_transaction_receipt(tx_hash)
+    return receipt.contractAddress
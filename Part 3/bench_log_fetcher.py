@@ -0,0 +1,63 @@
+# %%
+# Benchmark of the adaptive log fetcher (log_fetcher.py) against the recursive bisection of getPairEvents(),
+# on a mock RPC that serves synthetic PairCreated logs. No node is needed.
+import asyncio
+import bisect
+import random
+import time
+
+from log_fetcher import AdaptiveWindow, getLogsAdaptive
+
+BLOCK_COUNT = 2000000
+EVENT_COUNT = 200000
+LOG_LIMIT = 10000 # Same limit as Infura
+LATENCY = 0.05 # Seconds per request
+PROVIDER_COUNT = 4
+random.seed(0)
+
+
+# Minimal stand-in for Web3(AsyncHTTPProvider(...)): only eth.get_logs() is implemented.
+# The events are denser towards the end of the range, like on mainnet.
+eventBlocks = sorted(int(BLOCK_COUNT * random.random() ** 0.3) for _ in range(EVENT_COUNT))
+
+class MockEth:
+    def __init__(self):
+        self.requestCount = 0
+
+    async def get_logs(self, params):
+        self.requestCount += 1
+        await asyncio.sleep(LATENCY)
+        lo = bisect.bisect_left(eventBlocks, params["fromBlock"])
+        hi = bisect.bisect_right(eventBlocks, params["toBlock"])
+        if hi - lo > LOG_LIMIT:
+            raise ValueError({"code": -32005, "message": "query returned more than 10000 results"})
+        return [{"blockNumber": eventBlocks[i], "logIndex": 0} for i in range(lo, hi)]
+
+class MockProvider:
+    def __init__(self):
+        self.eth = MockEth()
+
+
+# Same algorithm as getEventsRecursive() in find_opps.py, sequential
+async def getLogsRecursive(provider, _from, _to):
+    try:
+        return await provider.eth.get_logs({"fromBlock": _from, "toBlock": _to})
+    except ValueError:
+        midBlock = (_from + _to) // 2
+        return await getLogsRecursive(provider, _from, midBlock) + await getLogsRecursive(provider, midBlock + 1, _to)
+
+
+# %%
+provider = MockProvider()
+t0 = time.perf_counter()
+logs = asyncio.run(getLogsRecursive(provider, 0, BLOCK_COUNT))
+print(f"Recursive bisection: {time.perf_counter() - t0:.2f} s, {provider.eth.requestCount} requests, {len(logs)} logs")
+
+providers = [MockProvider() for _ in range(PROVIDER_COUNT)]
+window = AdaptiveWindow()
+t0 = time.perf_counter()
+logs = asyncio.run(getLogsAdaptive(providers, None, None, 0, BLOCK_COUNT, window))
+requestCount = sum(p.eth.requestCount for p in providers)
+print(f"Adaptive, concurrent: {time.perf_counter() - t0:.2f} s, {requestCount} requests, {len(logs)} logs")
+assert [log["blockNumber"] for log in logs] == eventBlocks, "Logs are not in block order"
+print(f"Learned window size: {window.size} blocks")
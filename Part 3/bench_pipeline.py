@@ -0,0 +1,187 @@
+# %%
+# Benchmark suite of the reserve-fetch and opportunity pipeline, against the local mock node (mock_node.py).
+# For each pool count, every stage is run several times and the median and worst latency and the throughput (pools/s)
+# are reported, then run once more under tracemalloc for its peak Python memory (tracing slows everything down, so it
+# is kept out of the timed runs). Results are written to bench_results.json; if bench_baseline.json exists
+# (a copy of a previous bench_results.json), stages that got more than REGRESSION_THRESHOLD slower are flagged.
+import asyncio
+import json
+import os
+import time
+import tracemalloc
+
+from web3 import Web3
+from web3 import AsyncHTTPProvider
+from web3.eth import AsyncEth
+
+import reserves_decoder
+from log_fetcher import getPairEventsAll
+from mock_node import MOCK_QUERY, WETH, MockNode
+from opp_index import OpportunityIndex
+from opp_scanner import PairArrays, scan_opportunities
+from provider_pool import ProviderPool, getReservesPooled
+from reserve_store import ReserveStore
+
+POOL_COUNTS = [1000, 10000, 100000]
+REPEAT = 7
+PROVIDER_COUNT = 4
+LATENCY = 0.02 # Seconds added by the mock node to every HTTP request
+FAILURE_RATE = 0.0
+REGRESSION_THRESHOLD = 0.2
+
+queryAbi = [{"inputs": [
+            {
+                "internalType": "contract IUniswapV2Pair[]",
+                "name": "_pairs",
+                "type": "address[]",
+            }
+        ],
+        "name": "getReservesByPairs",
+        "outputs": [
+            {"internalType": "uint256[3][]", "name": "", "type": "uint256[3][]"}
+        ],
+        "stateMutability": "view",
+        "type": "function"}]
+
+
+# getReservesParallel() of find_opps.py, round-robin over the providers
+async def getReservesParallel(pairs, providers, chunkSize=1000):
+    contracts = [provider.eth.contract(address=MOCK_QUERY, abi=queryAbi) for provider in providers]
+    chunks = [pairs[i : i + chunkSize] for i in range(0, len(pairs), chunkSize)]
+    tasks = [contracts[i % len(contracts)].functions.getReservesByPairs(chunk).call() for i, chunk in enumerate(chunks)]
+    results = await asyncio.gather(*tasks)
+    return [item for sublist in results for item in sublist]
+
+
+def percentile(values, q):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+
+# Run an async stage REPEAT times, return its statistics. fn() returns the number of pools processed.
+# setup(), if given, is awaited before each run of fn(), outside of the timed section.
+# With REPEAT runs, a high percentile would only be the slowest run, so the maximum is reported as such.
+async def measure(fn, setup=None):
+    timings = []
+    for _ in range(REPEAT):
+        if setup is not None:
+            await setup()
+        t0 = time.perf_counter()
+        count = await fn()
+        timings.append(time.perf_counter() - t0)
+
+    # Separate run for the memory
+    if setup is not None:
+        await setup()
+    tracemalloc.start()
+    await fn()
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+
+    p50 = percentile(timings, 0.5)
+    return {
+        "p50": p50,
+        "max": max(timings),
+        "throughput": count / p50 if p50 else 0,
+        "peakMemory": peak,
+    }
+
+
+async def benchmark(poolCount):
+    node = MockNode(
+        poolCount=poolCount,
+        latency=LATENCY,
+        failureRate=FAILURE_RATE,
+        asmSelector=reserves_decoder.SELECTOR.hex(),
+    )
+    uri = await node.start()
+    providers = [Web3(AsyncHTTPProvider(uri), modules={"eth": (AsyncEth)}) for _ in range(PROVIDER_COUNT)]
+    pairs = [pool["pair"] for pool in node.pairDataList()]
+    results = {}
+
+    # Fetch paths
+    async def fetchParallel():
+        return len(await getReservesParallel(pairs, providers))
+    results["getReservesParallel"] = await measure(fetchParallel)
+
+    pool = ProviderPool(providers)
+    async def fetchPooled():
+        return len(await getReservesPooled(pairs, pool, MOCK_QUERY, queryAbi))
+    results["getReservesPooled"] = await measure(fetchPooled)
+
+    async def fetchAsm():
+        reserves, _, _ = await reserves_decoder.getReservesAsmParallel(pairs, providers, MOCK_QUERY)
+        return len(reserves)
+    results["getReservesAsmParallel"] = await measure(fetchAsm)
+
+    # Event scan
+    factories = {"mock": {"factory": Web3.to_checksum_address("0x" + "1".zfill(40))}}
+    async def eventScan():
+        events = await getPairEventsAll(providers, factories, {"mock": 0}, node.block)
+        return len(events["mock"])
+    results["getPairEventsAll"] = await measure(eventScan)
+
+    # Incremental reserve update from the Sync logs of one block
+    reserveList = await getReservesParallel(pairs, providers)
+    store = ReserveStore(pairs)
+    async def syncSetup():
+        store.seed(reserveList, node.block)
+        store.take_dirty()
+        node.mine(1)
+    async def syncUpdate():
+        await store.update(providers[0], node.block)
+        return len(store.take_dirty())
+    results["ReserveStore.update"] = await measure(syncUpdate, syncSetup)
+
+    # Opportunity scan, in full and incrementally
+    pool_dict = {}
+    for pool_object in node.pairDataList():
+        pool_dict.setdefault((pool_object["token0"], pool_object["token1"]), []).append(pool_object)
+    to_fetch = [pool_object["pair"] for pool_list in pool_dict.values() for pool_object in pool_list]
+    reserveList = await getReservesParallel(to_fetch, providers)
+    pair_arrays = PairArrays(pool_dict, WETH)
+    pair_arrays.set_reserves(reserveList)
+
+    async def fullScan():
+        pair_arrays.set_reserves(reserveList)
+        scan_opportunities(pair_arrays)
+        return poolCount
+    results["scan_opportunities"] = await measure(fullScan)
+
+    opp_index = OpportunityIndex(pair_arrays)
+    opp_index.build()
+    dirty = set(range(0, poolCount, 100))
+    async def incrementalScan():
+        opp_index.update(dirty)
+        opp_index.top(10)
+        return len(dirty)
+    results["OpportunityIndex.update"] = await measure(incrementalScan)
+
+    await node.stop()
+    return results
+
+
+# %%
+allResults = {}
+for poolCount in POOL_COUNTS:
+    allResults[str(poolCount)] = asyncio.run(benchmark(poolCount))
+
+baseline = None
+if os.path.exists("bench_baseline.json"):
+    with open("bench_baseline.json", "r") as f:
+        baseline = json.load(f)
+
+for poolCount, results in allResults.items():
+    print(f"--- {poolCount} pools ---")
+    for stage, stats in results.items():
+        line = (
+            f"{stage:<26} p50 {stats['p50'] * 1000:9.1f} ms   max {stats['max'] * 1000:9.1f} ms   "
+            f"{stats['throughput']:12.0f} pools/s   peak {stats['peakMemory'] / 2**20:7.1f} MiB"
+        )
+        reference = (baseline or {}).get(poolCount, {}).get(stage)
+        if reference and stats["p50"] > reference["p50"] * (1 + REGRESSION_THRESHOLD):
+            line += f"   REGRESSION (baseline p50 {reference['p50'] * 1000:.1f} ms)"
+        print(line)
+
+with open("bench_results.json", "w") as f:
+    json.dump(allResults, f, indent=4)
@@ -0,0 +1,113 @@
+# %%
+# Benchmark of the startup of the bot: cold import time of the modules and of the imports of the scripts that are run
+# (each measured in a fresh interpreter), and the time to get the pool registry, built from the pool list or restored
+# from its saved snapshot (see pool_registry.py). If a solc compiler is installed with solcx, the compilation of
+# SimulateArb.sol is timed with and without the cache of contract_cache.py.
+# No node is needed, the pools come from mock_node.py.
+import ast
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+from contract_cache import compile_cached
+from mock_node import MockNode
+from pool_registry import INDEX_ARRAYS, PoolRegistry
+from simulator import SIMULATOR_SOURCE
+
+POOL_COUNT = 200000
+REPEAT = 5
+
+IMPORTS = {
+    "web3": "import web3",
+    "pipeline modules": "import opp_scanner, pool_registry, log_fetcher, reserves_decoder, snapshot_log, backtester",
+    "contract clients": "import batch_query, simulator, token_metadata",
+    "rpc_transport": "import rpc_transport",
+}
+
+# Scripts whose top-level imports are timed together, as run
+ENTRY_POINTS = {
+    "find_opps.py": "find_opps.py",
+    "Part 2/code.py": os.path.join("..", "Part 2", "code.py"),
+}
+
+
+# Best of REPEAT runs of fn(), in seconds
+def best_time(fn):
+    timings = []
+    for _ in range(REPEAT):
+        t0 = time.perf_counter()
+        fn()
+        timings.append(time.perf_counter() - t0)
+    return min(timings)
+
+
+def import_time(statement):
+    here = os.path.dirname(os.path.abspath(__file__))
+    # Timed inside the child process, so that the start-up of the interpreter itself is not counted
+    code = f"import time; t0 = time.perf_counter(); {statement}; print(time.perf_counter() - t0)"
+    timings = []
+    for _ in range(REPEAT):
+        output = subprocess.run([sys.executable, "-c", code], cwd=here, check=True, capture_output=True, text=True)
+        timings.append(float(output.stdout))
+    return min(timings)
+
+
+# The top-level import statements of a script, in order
+def script_imports(path):
+    here = os.path.dirname(os.path.abspath(__file__))
+    with open(os.path.join(here, path), "r") as f:
+        tree = ast.parse(f.read())
+    return "; ".join(ast.unparse(node) for node in tree.body if isinstance(node, (ast.Import, ast.ImportFrom)))
+
+
+# %%
+print("--- Cold imports ---")
+for name, statement in IMPORTS.items():
+    print(f"{name:<18} {import_time(statement) * 1000:9.1f} ms")
+for name, path in ENTRY_POINTS.items():
+    try:
+        print(f"{name:<18} {import_time(script_imports(path)) * 1000:9.1f} ms")
+    except subprocess.CalledProcessError as e:
+        print(f"{name:<18} failed: {e.stderr.strip().splitlines()[-1]}")
+
+# %%
+print(f"--- Pool registry, {POOL_COUNT} pools ---")
+pairDataList = MockNode(poolCount=POOL_COUNT).pairDataList()
+directory = tempfile.mkdtemp()
+try:
+    path = os.path.join(directory, "registry")
+    registry = PoolRegistry.build(pairDataList)
+    registry.save(path)
+    print(f"build              {best_time(lambda: PoolRegistry.build(pairDataList)) * 1000:9.1f} ms")
+    restored = PoolRegistry.load(path)
+    assert np.array_equal(restored.pairPools, registry.pairPools), "Restored indexes differ"
+    print(f"load (snapshot)    {best_time(lambda: PoolRegistry.load(path)) * 1000:9.1f} ms")
+    for name in INDEX_ARRAYS:
+        os.remove(os.path.join(path, name + ".npy"))
+    print(f"load (no indexes)  {best_time(lambda: PoolRegistry.load(path)) * 1000:9.1f} ms")
+finally:
+    shutil.rmtree(directory)
+
+# %%
+try:
+    import solcx
+except ImportError:
+    solcx = None
+
+# Without an installed compiler, compile_cached() would download one first
+if solcx is not None and solcx.get_installed_solc_versions():
+    print("--- Contract compilation ---")
+    directory = tempfile.mkdtemp()
+    try:
+        t0 = time.perf_counter()
+        compile_cached(SIMULATOR_SOURCE, "SimulateArb", ["evm.deployedBytecode"], cacheDir=directory)
+        print(f"solc               {(time.perf_counter() - t0) * 1000:9.1f} ms")
+        cached = best_time(lambda: compile_cached(SIMULATOR_SOURCE, "SimulateArb", ["evm.deployedBytecode"], cacheDir=directory))
+        print(f"cached             {cached * 1000:9.1f} ms")
+    finally:
+        shutil.rmtree(directory)
@@ -0,0 +1,101 @@
+# %%
+# Benchmark of the exact integer swap math (swap_math.py) against the float path (find_opps.py / opp_scanner.py).
+# Runs on synthetic reserves, no node is needed.
+import math
+import random
+import time
+
+from opp_scanner import PairArrays, scan_opportunities
+import swap_math
+
+WETH = "0xC02aaA39b223FE8D0A0e5C4F27eAD9083C756Cc2"
+PAIR_COUNT = 5000
+random.seed(0)
+
+
+# Float helpers of find_opps.py
+def swap_output(x, a, b, fee=0.003):
+    return b * (1 - a/(a + x*(1-fee)))
+
+def trade_profit(x, reserves1, reserves2, fee=0.003):
+    a1, b1 = reserves1
+    a2, b2 = reserves2
+    return swap_output(swap_output(x, a1, b1, fee), b2, a2, fee) - x
+
+def optimal_trade_size(reserves1, reserves2, fee=0.003):
+    a1, b1 = reserves1
+    a2, b2 = reserves2
+    return (math.sqrt(a1*b1*a2*b2*(1-fee)**4 * (b1*(1-fee)+b2)**2) - a1*b2*(1-fee)*(b1*(1-fee)+b2)) / ((1-fee) * (b1*(1-fee) + b2))**2
+
+
+# %%
+# Build a synthetic pool_dict: every pair has 2 to 6 pools with slightly different prices
+pool_dict = {}
+reserveList = []
+for k in range(PAIR_COUNT):
+    token = "0x" + f"{k:040x}"
+    pair = (WETH, token) if random.random() < 0.5 else (token, WETH)
+    price = 10 ** random.uniform(-3, 6)
+    pool_list = []
+    for i in range(random.randint(2, 6)):
+        res_weth = int(10 ** random.uniform(18, 23))
+        res_token = int(res_weth * price * random.uniform(0.97, 1.03))
+        reserves = [res_weth, res_token] if pair[0] == WETH else [res_token, res_weth]
+        pool_list.append({"pair": f"{k}-{i}", "token0": pair[0], "token1": pair[1]})
+        reserveList.append(reserves + [0])
+    pool_dict[pair] = pool_list
+
+pair_arrays = PairArrays(pool_dict, WETH)
+pair_arrays.set_reserves(reserveList)
+oriented = [
+    (r[0], r[1]) if first else (r[1], r[0])
+    for r, first in zip(reserveList, pair_arrays.weth_is_token0.tolist())
+]
+print(f"{len(pair_arrays.pools)} pools, {len(pair_arrays.idx_a)} pool combinations")
+
+
+# %%
+# Float path, one combination at a time (original loop of find_opps.py)
+t0 = time.perf_counter()
+float_count = 0
+for i, j in zip(pair_arrays.idx_a.tolist(), pair_arrays.idx_b.tolist()):
+    x = optimal_trade_size(oriented[i], oriented[j])
+    if x < 0:
+        continue
+    trade_profit(x, oriented[i], oriented[j])
+    float_count += 1
+t_float = time.perf_counter() - t0
+
+# Float path, vectorized
+t0 = time.perf_counter()
+opps = scan_opportunities(pair_arrays)
+t_vector = time.perf_counter() - t0
+
+# Exact path, every combination
+t0 = time.perf_counter()
+exact = swap_math.scan_opportunities_exact(pair_arrays, reserveList)
+t_exact = time.perf_counter() - t0
+
+# Exact path, only the candidates of the vectorized float scan
+t0 = time.perf_counter()
+exact_candidates = swap_math.scan_opportunities_exact(pair_arrays, reserveList, opps)
+t_exact_candidates = time.perf_counter() - t0
+
+print(f"Float loop:               {t_float * 1000:.1f} ms ({float_count} opportunities)")
+print(f"Float vectorized:         {t_vector * 1000:.1f} ms ({len(opps)} opportunities)")
+print(f"Exact, all combinations:  {t_exact * 1000:.1f} ms ({len(exact)} opportunities)")
+print(f"Exact, float candidates:  {t_exact_candidates * 1000:.1f} ms ({len(exact_candidates)} opportunities)")
+
+
+# %%
+# Precision: compare the profit predicted by the float formula with what the pair contracts would actually pay out
+# for the same (truncated) input.
+errors = []
+for opp in opps:
+    i, j = int(opp["poolA"]), int(opp["poolB"])
+    x = int(opp["input"] * 1e18)
+    real = swap_math.trade_profit(x, *oriented[i], *oriented[j])
+    errors.append(abs(opp["profit"] * 1e18 - real))
+errors.sort()
+if errors:
+    print(f"Float profit error (Wei): median {errors[len(errors) // 2]:.0f}, max {errors[-1]:.0f}")
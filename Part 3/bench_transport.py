@@ -0,0 +1,95 @@
+# %%
+# Benchmark of the batched, keep-alive transport (rpc_transport.py) against web3's AsyncHTTPProvider, on the local
+# mock node (mock_node.py). The same fetch functions run on both: many small concurrent requests (headers), the
+# reserves of every pool in small eth_call chunks, and eth_getLogs over consecutive block windows. No node is needed.
+import asyncio
+import time
+
+import aiohttp
+from web3 import Web3
+from web3 import AsyncHTTPProvider
+from web3.eth import AsyncEth
+
+from log_fetcher import AdaptiveWindow, getLogsAdaptive
+from mock_node import MOCK_QUERY, SYNC_TOPIC, MockNode
+from provider_pool import ProviderPool, getReservesPooled
+from rpc_transport import BatchingProvider
+
+POOL_COUNT = 10000
+PROVIDER_COUNT = 2
+LATENCY = 0.05 # Seconds added by the mock node to every HTTP request
+HEADER_REQUESTS = 1000
+CHUNK_SIZE = 200
+BLOCKS = 500
+
+queryAbi = [{"inputs": [
+            {
+                "internalType": "contract IUniswapV2Pair[]",
+                "name": "_pairs",
+                "type": "address[]",
+            }
+        ],
+        "name": "getReservesByPairs",
+        "outputs": [
+            {"internalType": "uint256[3][]", "name": "", "type": "uint256[3][]"}
+        ],
+        "stateMutability": "view",
+        "type": "function"}]
+
+
+async def benchmark(node, uri, makeProvider):
+    providers = [Web3(makeProvider(uri), modules={"eth": (AsyncEth)}) for _ in range(PROVIDER_COUNT)]
+    batching = isinstance(providers[0].provider, BatchingProvider)
+    if not batching:
+        # AsyncHTTPProvider shares one cached session per URI. Give it ours, to close it before the node stops.
+        session = aiohttp.ClientSession(raise_for_status=True)
+        await providers[0].provider.cache_async_session(session)
+    pairs = [pool["pair"] for pool in node.pairDataList()]
+    requestCount = node.requestCount
+    results = {}
+
+    t0 = time.perf_counter()
+    await asyncio.gather(*[providers[i % PROVIDER_COUNT].eth.get_block("latest") for i in range(HEADER_REQUESTS)])
+    results["headers"] = time.perf_counter() - t0
+
+    t0 = time.perf_counter()
+    reserves = await getReservesPooled(pairs, ProviderPool(providers), MOCK_QUERY, queryAbi, CHUNK_SIZE)
+    results["reserves"] = time.perf_counter() - t0
+    assert reserves[0] == list(node.reserves(0)), "Wrong reserves"
+
+    t0 = time.perf_counter()
+    logs = await getLogsAdaptive(providers, None, [SYNC_TOPIC], node.block - BLOCKS + 1, node.block, AdaptiveWindow(size=10))
+    results["logs"] = time.perf_counter() - t0
+    assert len(logs) == BLOCKS * node.syncsPerBlock, "Missing logs"
+
+    # One HTTP request per JSON-RPC request, except for the batches of BatchingProvider
+    results["rpcRequests"] = node.requestCount - requestCount
+    results["httpRequests"] = results["rpcRequests"]
+    if batching:
+        results["httpRequests"] = sum(provider.provider.batchCount for provider in providers)
+        for provider in providers:
+            await provider.provider.disconnect()
+    else:
+        await session.close()
+    return results
+
+
+async def main():
+    node = MockNode(poolCount=POOL_COUNT, latency=LATENCY)
+    node.mine(BLOCKS)
+    uri = await node.start()
+    allResults = {
+        "AsyncHTTPProvider": await benchmark(node, uri, AsyncHTTPProvider),
+        "BatchingProvider": await benchmark(node, uri, BatchingProvider),
+    }
+    await node.stop()
+    return allResults
+
+
+# %%
+allResults = asyncio.run(main())
+reference = allResults["AsyncHTTPProvider"]
+for name, results in allResults.items():
+    print(f"--- {name}: {results['rpcRequests']} JSON-RPC requests in {results['httpRequests']} HTTP requests ---")
+    for stage in ("headers", "reserves", "logs"):
+        print(f"{stage:<10} {results[stage] * 1000:9.1f} ms   x{reference[stage] / results[stage]:.2f}")
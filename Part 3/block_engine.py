@@ -0,0 +1,122 @@
+# Block-driven runner for the bot.
+# New block headers come from a newHeads WebSocket subscription or from a cancellable polling loop. For each new block,
+# the engine runs the onBlock(header, deadline) coroutine (reserve update, scan, ranking...) in a task. When a newer
+# block arrives before the task is done, its work is stale: the task is cancelled and the new block is processed
+# instead. The latency of every block, from the reception of its header to the end of onBlock(), is recorded and
+# compared to a budget.
+# Against a local node that mines on demand (anvil --no-mining, or mock_node.py), each evm_mine / MockNode.mine()
+# produces exactly one block for the engine.
+import asyncio
+import collections
+import json
+import time
+
+from metrics import metrics
+
+
+def block_number(header):
+    number = header["number"]
+    return int(number, 16) if isinstance(number, str) else number
+
+
+def block_timestamp(header):
+    timestamp = header["timestamp"]
+    return int(timestamp, 16) if isinstance(timestamp, str) else timestamp
+
+
+# Async generator of new headers, polling eth_getBlockByNumber("latest") every `interval` seconds.
+# Blocks mined between two polls are skipped: the engine only cares about the latest state.
+async def pollHeads(w3Async, interval=1.0):
+    last = None
+    while True:
+        header = await w3Async.eth.get_block("latest")
+        if last is None or block_number(header) > last:
+            last = block_number(header)
+            yield header
+        await asyncio.sleep(interval)
+
+
+# Async generator of new headers from an eth_subscribe("newHeads") WebSocket subscription. Fields are hex strings.
+async def subscribeHeads(uri):
+    import websockets
+
+    async with websockets.connect(uri, max_size=None) as ws:
+        await ws.send(json.dumps({"jsonrpc": "2.0", "id": 1, "method": "eth_subscribe", "params": ["newHeads"]}))
+        subscription = json.loads(await ws.recv())["result"]
+        async for message in ws:
+            params = json.loads(message).get("params", {})
+            if params.get("subscription") == subscription:
+                yield params["result"]
+
+
+class BlockEngine:
+    # onBlock(header, deadline) is a coroutine function. deadline is the time.perf_counter() value at which the budget
+    # of the block is spent, so that optional stages can be skipped when it is close.
+    def __init__(self, onBlock, budget=1.0, history=1000):
+        self.onBlock = onBlock
+        self.budget = budget
+        self.block = None
+        self.task = None
+        # (block, latency in seconds, status) of the last blocks, status is "done", "cancelled" or "failed"
+        self.history = collections.deque(maxlen=history)
+        self.counts = collections.Counter()
+
+    async def _process(self, header, received):
+        number = block_number(header)
+        try:
+            await self.onBlock(header, received + self.budget)
+        except asyncio.CancelledError:
+            self._record(number, received, "cancelled")
+            raise
+        except Exception as e:
+            print(f"Block {number} failed: {e!r}")
+            self._record(number, received, "failed")
+        else:
+            self._record(number, received, "done")
+
+    def _record(self, number, received, status):
+        latency = time.perf_counter() - received
+        self.history.append((number, latency, status))
+        self.counts[status] += 1
+        metrics.inc("blocks_total", status=status)
+        if status == "done":
+            metrics.observe("block_seconds", latency)
+            if latency > self.budget:
+                self.counts["over_budget"] += 1
+
+    # Process the headers of `heads` (see pollHeads() and subscribeHeads()) until it ends, or for maxBlocks blocks
+    async def run(self, heads, maxBlocks=None):
+        seen = 0
+        try:
+            async for header in heads:
+                received = time.perf_counter()
+                number = block_number(header)
+                # Ignore duplicated or older headers (reorgs are handled by the next block's update)
+                if self.block is not None and number <= self.block:
+                    continue
+                self.block = number
+                if self.task is not None and not self.task.done():
+                    self.task.cancel()
+                self.task = asyncio.ensure_future(self._process(header, received))
+                seen += 1
+                if maxBlocks is not None and seen >= maxBlocks:
+                    break
+            if self.task is not None:
+                await asyncio.gather(self.task, return_exceptions=True)
+        finally:
+            if self.task is not None and not self.task.done():
+                self.task.cancel()
+
+    # Latency statistics of the completed blocks
+    def summary(self):
+        latencies = sorted(latency for _, latency, status in self.history if status == "done")
+        percentile = lambda q: latencies[min(len(latencies) - 1, int(q * len(latencies)))] if latencies else None
+        return {
+            "blocks": sum(self.counts[status] for status in ("done", "cancelled", "failed")),
+            "done": self.counts["done"],
+            "cancelled": self.counts["cancelled"],
+            "failed": self.counts["failed"],
+            "over_budget": self.counts["over_budget"],
+            "p50": percentile(0.5),
+            "p99": percentile(0.99),
+        }
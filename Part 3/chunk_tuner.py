@@ -0,0 +1,189 @@
+# Auto-tuning of the chunk size used by the batch reserve queries (getReservesByPairs).
+# Each endpoint is probed with increasing chunk sizes to measure the latency of one call. The chunk size is then chosen
+# to minimise the total wall time for the current number of pools and providers, and is lowered automatically when a
+# call hits the gas or response-size limit of the provider (other errors are retried without changing it).
+# Measurements are saved to a JSON file per endpoint.
+# Endpoints are keyed by a hash of their URI in the file, so that API keys in Infura URLs are never written to disk.
+import asyncio
+import hashlib
+import json
+import math
+import os
+import time
+
+from metrics import metrics
+
+CANDIDATE_SIZES = (250, 500, 1000, 2000, 4000, 8000)
+
+# Provider errors meaning that a call queried too many pools: it ran out of gas, took too long to execute or returned
+# too much data. Any other error (timeout, connection reset, HTTP 5xx) says nothing about the chunk size.
+LIMIT_ERRORS = (
+    "out of gas",
+    "gas required exceeds",
+    "gas limit",
+    "execution aborted",
+    "response size",
+    "response is too big",
+    "too large",
+)
+
+
+def is_limit_error(error):
+    message = str(error).lower()
+    return any(pattern in message for pattern in LIMIT_ERRORS)
+
+
+def endpoint_key(endpoint):
+    return hashlib.sha256(endpoint.encode()).hexdigest()[:16]
+
+
+class ChunkTuner:
+    def __init__(self, path="chunk_sizes.json", candidates=CANDIDATE_SIZES, maxAge=3600):
+        self.path = path
+        self.candidates = tuple(sorted(candidates))
+        self.maxAge = maxAge # Seconds before an endpoint is probed again
+        # endpoint key -> {"latency": {size: seconds}, "maxSize": largest size that did not fail, "probed": timestamp}
+        self.endpoints = {}
+        self.probeTask = None
+        if path is not None and os.path.exists(path):
+            with open(path, "r") as f:
+                for key, data in json.load(f).items():
+                    if "://" in key:
+                        continue # Raw URI written by an older version, dropped on the next save
+                    data["latency"] = {int(size): latency for size, latency in data["latency"].items()}
+                    self.endpoints[key] = data
+
+    def save(self):
+        if self.path is None:
+            return
+        with open(self.path, "w") as f:
+            json.dump(self.endpoints, f, indent=4)
+
+    def _endpoint(self, endpoint):
+        return self.endpoints.setdefault(
+            endpoint_key(endpoint), {"latency": {}, "maxSize": self.candidates[-1], "probed": 0}
+        )
+
+    # Whether the endpoint has never been probed, or was probed more than maxAge seconds ago
+    def stale(self, endpoint):
+        return time.time() - self._endpoint(endpoint)["probed"] > self.maxAge
+
+    # Measure the latency of callChunk(provider, pairs) for each candidate size, using the pool addresses in sample.
+    # Stops at the first size that hits a limit: it is above the limits of this endpoint. After any other error the
+    # previous measurements are kept, and the endpoint is probed again after maxAge seconds.
+    async def probe(self, endpoint, provider, callChunk, sample, repeat=2):
+        data = self._endpoint(endpoint)
+        latency = {}
+        maxSize = self.candidates[0]
+        for size in self.candidates:
+            if size > len(sample) and size != self.candidates[0]:
+                break
+            try:
+                timings = []
+                for _ in range(repeat):
+                    t0 = time.perf_counter()
+                    await callChunk(provider, sample[:size])
+                    timings.append(time.perf_counter() - t0)
+            except Exception as e:
+                if is_limit_error(e):
+                    break
+                data["probed"] = time.time()
+                return
+            latency[size] = min(timings)
+            maxSize = size
+        data.update(latency=latency, maxSize=maxSize, probed=time.time())
+        self.save()
+
+    # Probe every stale endpoint concurrently. endpoints and providers are parallel lists.
+    async def probe_all(self, endpoints, providers, callChunk, sample):
+        await asyncio.gather(
+            *[
+                self.probe(endpoint, provider, callChunk, sample)
+                for endpoint, provider in zip(endpoints, providers)
+                if self.stale(endpoint)
+            ]
+        )
+
+    # Start probe_all() in the background if an endpoint is stale and no probe is running. Meant to be called on every
+    # block, so that the sizes follow the load of the endpoints over a long run.
+    def reprobe(self, endpoints, providers, callChunk, sample):
+        if (self.probeTask is None or self.probeTask.done()) and any(self.stale(endpoint) for endpoint in endpoints):
+            self.probeTask = asyncio.ensure_future(self.probe_all(endpoints, providers, callChunk, sample))
+
+    # A call with `size` pools hit a limit of this endpoint (out of gas, response too large...): never go above half of
+    # it. The change is kept in memory, call save() to write it.
+    def backoff(self, endpoint, size):
+        data = self._endpoint(endpoint)
+        data["maxSize"] = max(1, min(data["maxSize"], size // 2))
+        data["latency"] = {s: latency for s, latency in data["latency"].items() if s <= data["maxSize"]}
+
+    # Chunk size minimising the estimated wall time to fetch poolCount pools over the given endpoints.
+    # With n chunks spread over p providers, the fetch takes about ceil(n / p) rounds of one call each.
+    def choose(self, endpoints, poolCount, default=1000):
+        maxSize = min(self._endpoint(endpoint)["maxSize"] for endpoint in endpoints)
+        best, bestTime = None, math.inf
+        for size in self.candidates:
+            if size > maxSize:
+                break
+            latencies = [self._endpoint(endpoint)["latency"].get(size) for endpoint in endpoints]
+            if None in latencies:
+                continue
+            rounds = math.ceil(math.ceil(poolCount / size) / len(endpoints))
+            estimate = rounds * max(latencies)
+            if estimate < bestTime:
+                best, bestTime = size, estimate
+        if best is None:
+            return min(default, maxSize)
+        return best
+
+
+# callChunk() for getReservesByPairs() of the query contract, with one contract object per provider
+def reservesCall(queryContractAddress, queryAbi):
+    contracts = {}
+
+    def callChunk(provider, pairs):
+        if id(provider) not in contracts:
+            contracts[id(provider)] = provider.eth.contract(address=queryContractAddress, abi=queryAbi)
+        return contracts[id(provider)].functions.getReservesByPairs(pairs).call()
+
+    return callChunk
+
+
+# Same as getReservesParallel(), with the chunk size chosen by the tuner.
+# A chunk that hits a limit of its endpoint is split in two and retried, and the endpoint is backed off for the next
+# fetches. After any other error, the chunk is retried as is on the next provider, at most maxRetries times.
+# The backed off sizes are saved once, at the end of the fetch.
+async def getReservesTuned(pairs, providers, endpoints, tuner, callChunk, maxRetries=3):
+    chunkSize = tuner.choose(endpoints, len(pairs))
+    backedOff = False
+
+    async def fetch(i, chunk, attempts=0):
+        nonlocal backedOff
+        try:
+            with metrics.timer("rpc_seconds", provider=i % len(providers), method="eth_call"):
+                return await callChunk(providers[i % len(providers)], chunk)
+        except Exception as e:
+            metrics.inc("rpc_errors_total", provider=i % len(providers), method="eth_call")
+            if is_limit_error(e) and len(chunk) > 1:
+                tuner.backoff(endpoints[i % len(providers)], len(chunk))
+                backedOff = True
+                half = len(chunk) // 2
+                # Retry the two halves on the next providers
+                first, second = await asyncio.gather(fetch(i + 1, chunk[:half]), fetch(i + 2, chunk[half:]))
+                return first + second
+            if attempts >= maxRetries:
+                raise
+            return await fetch(i + 1, chunk, attempts + 1)
+
+    # Create a list of chunks of pair addresses
+    chunks = [pairs[i : i + chunkSize] for i in range(0, len(pairs), chunkSize)]
+
+    # Assign each chunk to a provider in a round-robin fashion and run the tasks in parallel
+    try:
+        results = await asyncio.gather(*[fetch(i, chunk) for i, chunk in enumerate(chunks)])
+    finally:
+        if backedOff:
+            tuner.save()
+
+    # Flatten the results
+    return [item for sublist in results for item in sublist]
@@ -0,0 +1,41 @@
+# On-disk cache of solc outputs, so that a restart does not compile the contracts again.
+# The output of solcx.compile_standard() is stored as JSON under a key made of the compiler version and of the
+# standard-JSON input (source and requested outputs): editing a contract or asking for other outputs compiles it again.
+# solcx is only imported when something has to be compiled.
+import hashlib
+import json
+import os
+
+CACHE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "build")
+
+
+# Compiled contract `name` of the Solidity file at path, e.g. compiled["abi"] or compiled["evm"]["bytecode"]["object"]
+def compile_cached(path, name, outputs, version="0.8.0", cacheDir=CACHE_DIR):
+    with open(path, "r") as f:
+        source = f.read()
+    return compile_source_cached(source, os.path.basename(path), name, outputs, version, cacheDir)
+
+
+# Same from the source code itself, compiled as a file named filename (e.g. a contract kept in a Python string)
+def compile_source_cached(source, filename, name, outputs, version="0.8.0", cacheDir=CACHE_DIR):
+    standardInput = {
+        "language": "Solidity",
+        "sources": {filename: {"content": source}},
+        "settings": {"outputSelection": {"*": {"*": list(outputs)}}},
+    }
+    key = hashlib.sha256(json.dumps([version, standardInput], sort_keys=True).encode()).hexdigest()[:16]
+    cachePath = os.path.join(cacheDir, f"{name}-{key}.json")
+
+    if os.path.exists(cachePath):
+        with open(cachePath, "r") as f:
+            return json.load(f)
+
+    import solcx
+
+    compiled = solcx.compile_standard(standardInput, solc_version=version)["contracts"][filename][name]
+    os.makedirs(cacheDir, exist_ok=True)
+    temporary = cachePath + ".tmp"
+    with open(temporary, "w") as f:
+        json.dump(compiled, f)
+    os.replace(temporary, cachePath)
+    return compiled
@@ -0,0 +1,235 @@
+# Multi-hop arbitrage: cycles WETH -> token -> ... -> WETH over all the pools of every factory.
+# Tokens are interned to integer ids and the pools are edges of a token graph stored in arrays. The cycles through WETH
+# are enumerated once up to a maximum length, cached on disk, and indexed by pool so that only the cycles touching
+# pools with new reserves are re-evaluated.
+#
+# A path of constant-product swaps behaves like a single virtual pool. Composing a path with virtual reserves (Ea, Eb)
+# with a pool (a, b) gives:
+#   Ea' = Ea * a / (a + g * Eb)
+#   Eb' = g * Eb * b / (a + g * Eb)
+# with g = 1 - fee. The optimal input of the cycle is then x = (sqrt(Ea * Eb * g) - Ea) / g, the same closed form as
+# optimal_trade_size() for two pools.
+import hashlib
+import warnings
+
+import numpy as np
+
+from opp_scanner import FEE
+from pool_registry import RegistryPools
+
+
+class TokenGraph:
+    # pairDataList is the list of pools of find_opps.py ({"token0", "token1", "pair", "factory"} dicts)
+    def __init__(self, pairDataList, weth):
+        self.tokens = []
+        self.tokenIds = {}
+        token0 = []
+        token1 = []
+        for pool in pairDataList:
+            token0.append(self.intern(pool["token0"]))
+            token1.append(self.intern(pool["token1"]))
+        self.weth = self.intern(weth)
+        self.pools = pairDataList
+        self.poolKey = "".join(pool["pair"] for pool in pairDataList).encode()
+        self._setup(np.array(token0, dtype=np.int32), np.array(token1, dtype=np.int32), len(self.tokens))
+
+    # Same graph built from a PoolRegistry (see pool_registry.py), reusing its token ids
+    @classmethod
+    def from_registry(cls, registry, weth):
+        self = cls.__new__(cls)
+        self.weth = registry.token_id(weth)
+        self.pools = RegistryPools(registry, np.arange(len(registry), dtype=np.int32))
+        self.poolKey = registry.addresses.tobytes()
+        self._setup(np.asarray(registry.token0), np.asarray(registry.token1), len(registry.tokens))
+        return self
+
+    def _setup(self, token0, token1, tokenCount):
+        self.token0 = token0
+        self.token1 = token1
+        self.tokenCount = tokenCount
+
+        # Adjacency in CSR form: the pools of token t are adjacencyPools[adjacencyOffsets[t]:adjacencyOffsets[t+1]]
+        ends = np.concatenate((self.token0, self.token1))
+        poolIds = np.concatenate((np.arange(len(self.pools)), np.arange(len(self.pools))))
+        order = np.argsort(ends, kind="stable")
+        self.adjacencyPools = poolIds[order].astype(np.int32)
+        self.adjacencyOffsets = np.searchsorted(ends[order], np.arange(tokenCount + 1))
+
+        # Raw reserves [reserve0, reserve1] of each pool
+        self.reserves = np.zeros((len(self.pools), 2), dtype=np.float64)
+
+    # Pool addresses in pool order, e.g. the list of pools to fetch with getReservesPooled()
+    def addresses(self):
+        return [pool["pair"] for pool in self.pools]
+
+    def intern(self, token):
+        tokenId = self.tokenIds.get(token)
+        if tokenId is None:
+            tokenId = self.tokenIds[token] = len(self.tokens)
+            self.tokens.append(token)
+        return tokenId
+
+    # Load reserves in [reserve0, reserve1, blockTimestampLast] format, in pool order
+    def set_reserves(self, reserveList):
+        self.reserves[:] = np.array([r[:2] for r in reserveList], dtype=np.float64).reshape(-1, 2)
+
+    # Identifier of the pool list, to check that cached cycles belong to this graph
+    def fingerprint(self):
+        return hashlib.sha1(self.poolKey).hexdigest()
+
+
+class CycleSet:
+    # cyclePools[c, h] is the pool used at hop h of cycle c (-1 after the end of the cycle), zeroForOne[c, h] whether
+    # that hop sells token0 of the pool, and length[c] the number of hops.
+    # truncated is True when the enumeration stopped at maxCycles, some cycles of the graph are then missing.
+    def __init__(self, graph, cyclePools, zeroForOne, length, fee=FEE, truncated=False):
+        self.graph = graph
+        self.cyclePools = cyclePools
+        self.zeroForOne = zeroForOne
+        self.length = length
+        self.fee = fee
+        self.truncated = truncated
+
+        # Pool -> cycles index in CSR form, for the incremental updates
+        hops = cyclePools >= 0
+        pools = cyclePools[hops]
+        cycles = np.nonzero(hops)[0]
+        order = np.argsort(pools, kind="stable")
+        self.poolCycles = cycles[order]
+        self.poolOffsets = np.searchsorted(pools[order], np.arange(len(graph.pools) + 1))
+
+        # Latest evaluation of each cycle, in Wei. Unprofitable cycles have a profit of -inf.
+        self.input = np.zeros(len(length), dtype=np.float64)
+        self.profit = np.full(len(length), -np.inf)
+
+        # Gas cost of each cycle in Wei, subtracted from the profit to rank the cycles (none until set_gas_cost())
+        self.cost = np.zeros(len(length), dtype=np.float64)
+
+    # Enumerate the cycles through WETH using minLength to maxLength distinct pools, without visiting a token twice.
+    # maxCycles bounds the enumeration, the number of cycles grows combinatorially with the length.
+    @classmethod
+    def enumerate(cls, graph, maxLength=3, minLength=2, maxCycles=5000000, fee=FEE):
+        adjacency = [
+            graph.adjacencyPools[graph.adjacencyOffsets[t]:graph.adjacencyOffsets[t + 1]].tolist()
+            for t in range(graph.tokenCount)
+        ]
+        token0 = graph.token0.tolist()
+        token1 = graph.token1.tolist()
+        weth = graph.weth
+        found = []
+
+        def explore(token, path, visited):
+            for pool in adjacency[token]:
+                if pool in path:
+                    continue
+                other = token1[pool] if token0[pool] == token else token0[pool]
+                if other == weth:
+                    if len(path) + 1 >= minLength:
+                        found.append(path + [pool])
+                        if len(found) >= maxCycles:
+                            return True
+                    continue
+                if other in visited or len(path) + 1 >= maxLength:
+                    continue
+                visited.add(other)
+                if explore(other, path + [pool], visited):
+                    return True
+                visited.discard(other)
+            return False
+
+        truncated = explore(weth, [], {weth})
+        if truncated:
+            warnings.warn(f"Cycle enumeration stopped at maxCycles={maxCycles}, some cycles are missing")
+
+        cyclePools = np.full((len(found), maxLength), -1, dtype=np.int32)
+        zeroForOne = np.zeros((len(found), maxLength), dtype=bool)
+        length = np.zeros(len(found), dtype=np.int8)
+        for c, path in enumerate(found):
+            token = weth
+            for h, pool in enumerate(path):
+                cyclePools[c, h] = pool
+                zeroForOne[c, h] = token0[pool] == token
+                token = token1[pool] if zeroForOne[c, h] else token0[pool]
+            length[c] = len(path)
+        return cls(graph, cyclePools, zeroForOne, length, fee, truncated)
+
+    def save(self, path):
+        np.savez(
+            path,
+            cyclePools=self.cyclePools,
+            zeroForOne=self.zeroForOne,
+            length=self.length,
+            truncated=np.array(self.truncated),
+            fingerprint=np.array(self.graph.fingerprint()),
+        )
+
+    # Load cycles saved with save(). Returns None if they were enumerated for a different pool list.
+    @classmethod
+    def load(cls, graph, path, fee=FEE):
+        data = np.load(path)
+        if str(data["fingerprint"]) != graph.fingerprint():
+            return None
+        truncated = bool(data["truncated"]) if "truncated" in data.files else False
+        return cls(graph, data["cyclePools"], data["zeroForOne"], data["length"], fee, truncated)
+
+    # Re-evaluate the given cycles with the current reserves of the graph
+    def evaluate(self, cycles=None):
+        if cycles is None:
+            cycles = np.arange(len(self.length))
+        g = 1 - self.fee
+        for hopCount in np.unique(self.length[cycles]):
+            selected = cycles[self.length[cycles] == hopCount]
+            pools = self.cyclePools[selected, :hopCount]
+            reserves = self.graph.reserves[pools]
+            direction = self.zeroForOne[selected, :hopCount]
+            reserveIn = np.where(direction, reserves[:, :, 0], reserves[:, :, 1])
+            reserveOut = np.where(direction, reserves[:, :, 1], reserves[:, :, 0])
+
+            # Fold the hops into a single virtual pool
+            ea = reserveIn[:, 0]
+            eb = reserveOut[:, 0]
+            with np.errstate(divide="ignore", invalid="ignore"):
+                for h in range(1, hopCount):
+                    denominator = reserveIn[:, h] + g * eb
+                    ea = ea * reserveIn[:, h] / denominator
+                    eb = g * eb * reserveOut[:, h] / denominator
+                x = (np.sqrt(ea * eb * g) - ea) / g
+                profit = g * x * eb / (ea + g * x) - x
+
+            ok = np.all(reserveIn > 0, axis=1) & np.all(reserveOut > 0, axis=1) & (x > 0)
+            self.input[selected] = np.where(ok, x, 0)
+            self.profit[selected] = np.where(ok, profit, -np.inf)
+
+    # Re-evaluate only the cycles that go through one of the dirty pools (a list or an array of pool ids of the graph).
+    # Returns the number of cycles evaluated.
+    def update(self, dirty):
+        if len(dirty) == 0:
+            return 0
+        cycles = np.unique(
+            np.concatenate([self.poolCycles[self.poolOffsets[p]:self.poolOffsets[p + 1]] for p in dirty])
+        )
+        self.evaluate(cycles)
+        return len(cycles)
+
+    # Gas cost of each cycle in ETH, e.g. GasModel.cycle_gas() times the gas price / 1e18, or a single cost for all
+    def set_gas_cost(self, cost):
+        self.cost = np.broadcast_to(np.asarray(cost, dtype=np.float64) * 1e18, self.profit.shape)
+
+    # The k most profitable cycles net of gas as (cycle, input, profit, net_profit) with values in ETH, by decreasing
+    # net profit
+    def top(self, k):
+        k = min(k, len(self.profit))
+        if k == 0:
+            return []
+        net = self.profit - self.cost
+        best = np.argpartition(-net, k - 1)[:k]
+        best = best[np.argsort(-net[best])]
+        return [
+            (int(c), float(self.input[c] / 1e18), float(self.profit[c] / 1e18), float(net[c] / 1e18))
+            for c in best
+            if self.profit[c] > -np.inf
+        ]
+
+    # Pool addresses of a cycle, in trading order
+    def path(self, cycle):
+        return [self.graph.pools[p]["pair"] for p in self.cyclePools[cycle, : self.length[cycle]]]
@@ -1,315 +1,653 @@
-# %%
-# Read the list of factory contract addresses
-from web3 import Web3
-from web3 import AsyncHTTPProvider
-from web3.eth import AsyncEth
-import asyncio
-import json
-import math
-import nest_asyncio
-nest_asyncio.apply()
-
-# Read infura nodes.
-# NODE_URI = 'https://mainnet.infura.io/v3/0ce674ab414048f580429a5bca905096'
-nodes = []
-with open("infura_nodes.txt", "r") as f:
-    for line in f:
-        nodes.append(line.strip())
-
-# Define providers
-w3 = Web3(Web3.HTTPProvider(nodes[0]))
-providers = []
-providersAsync = []
-for node in nodes:
-    providers.append(Web3.HTTPProvider(node))
-    providersAsync.append(Web3(AsyncHTTPProvider(node), modules={"eth": (AsyncEth)}))
-
-# Read factory contract addresses
-# Uniswap V2 factory contract address
-# contract_address = '0x5C69bEe701ef814a2B6a3EDD4B1652CB9cc5aA6f'
-# SushiSwap factory contract address
-# contract_address = '0xC0AEe478e3658e2610c5F7A4A2E1777cE9e4f2Ac'
-with open("FactoriesV2.json", "r") as f:
-    factories = json.load(f)
-
-# Define the contract ABI
-factory_abi = [
-    {
-        "anonymous": False,
-        "inputs": [
-            {
-                "indexed": True,
-                "internalType": "address",
-                "name": "token0",
-                "type": "address",
-            },
-            {
-                "indexed": True,
-                "internalType": "address",
-                "name": "token1",
-                "type": "address",
-            },
-            {
-                "indexed": False,
-                "internalType": "address",
-                "name": "pair",
-                "type": "address",
-            },
-            {
-                "indexed": False,
-                "internalType": "uint256",
-                "name": "",
-                "type": "uint256",
-            },
-        ],
-        "name": "PairCreated",
-        "type": "event",
-    }
-]
-
-
-# %%
-# Recursive function to fetch event in incrementally smaller intervals
-def getPairEvents(contract, fromBlock, toBlock):
-    toBlockPrime = toBlock
-    fetchCount = 0
-
-    # Then, recursively fetch events in smaller time intervals
-    def getEventsRecursive(contract, _from, _to):
-        try:
-            events = (
-                contract.events.PairCreated()
-                .create_filter(fromBlock=_from, toBlock=_to)
-                .get_all_entries()
-            )
-            print("Found ", len(events), " events between blocks ", _from, " and ", _to)
-            nonlocal fetchCount
-            fetchCount += len(events)
-            return events
-        except ValueError:
-            print("Too many events found between blocks ", _from, " and ", _to)
-            midBlock = (_from + _to) // 2
-            return getEventsRecursive(contract, _from, midBlock) + getEventsRecursive(
-                contract, midBlock + 1, _to
-            )
-
-    return getEventsRecursive(contract, fromBlock, toBlockPrime)
-
-
-# %%
-# Fetch list of pools for each factory contract
-pairDataList = []
-for factoryName, factoryData in factories.items():
-    events = getPairEvents(
-        w3.eth.contract(address=factoryData["factory"], abi=factory_abi),
-        0,
-        w3.eth.block_number,
-    )
-    print(f"Found {len(events)} pools for {factoryName}")
-    for e in events:
-        pairDataList.append(
-            {
-                "token0": e["args"]["token0"],
-                "token1": e["args"]["token1"],
-                "pair": e["args"]["pair"],
-                "factory": factoryName,
-            }
-        )
-
-
-# %%
-WETH = "0xC02aaA39b223FE8D0A0e5C4F27eAD9083C756Cc2"
-pair_pool_dict = {}
-for pair_object in pairDataList:
-    # Check for ETH (WETH) in the pair.
-    pair = (pair_object['token0'], pair_object['token1'])
-    if WETH not in pair:
-        continue
-
-    # Make sure the pair is referenced in the dictionary.
-    if pair not in pair_pool_dict:
-        pair_pool_dict[pair] = []
-
-    # Add the pool to the list of pools that trade this pair.
-    pair_pool_dict[pair].append(pair_object)
-
-# Create the final dictionnary of pools that will be traded on.
-pool_dict = {}
-for pair, pool_list in pair_pool_dict.items():
-    if len(pool_list) >= 2:
-        pool_dict[pair] = pool_list
-
-
-# %%
-# Number of different pairs
-print(f'We have {len(pool_dict)} different pairs.')
-
-# Total number of pools
-print(f'We have {sum([len(pool_list) for pool_list in pool_dict.values()])} pools in total.')
-
-# Pair with the most pools
-print(f'The pair with the most pools is {max(pool_dict, key=lambda k: len(pool_dict[k]))} with {len(max(pool_dict.values(), key=len))} pools.')
-
-
-# Distribution of the number of pools per pair, deciles
-pool_count_list = [len(pool_list) for pool_list in pool_dict.values()]
-pool_count_list.sort(reverse=True)
-print(f'Number of pools per pair, in deciles: {pool_count_list[::int(len(pool_count_list)/10)]}')
-
-
-# Distribution of the number of pools per pair, percentiles (deciles of the first decile)
-pool_count_list.sort(reverse=True)
-print(f'Number of pools per pair, in percentiles: {pool_count_list[::int(len(pool_count_list)/100)][:10]}')
-
-
-# %%
-# Address of the V2 Flash query contract
-queryContractAddress = "0x6c618c74235c70DF9F6AD47c6b5E9c8D3876432B"
-queryAbi = [{"inputs": [
-            {
-                "internalType": "contract IUniswapV2Pair[]",
-                "name": "_pairs",
-                "type": "address[]",
-            }
-        ],
-        "name": "getReservesByPairs",
-        "outputs": [
-            {"internalType": "uint256[3][]", "name": "", "type": "uint256[3][]"}
-        ],
-        "stateMutability": "view",
-        "type": "function"}]
-
-# Function to perform batch parallel requests
-async def getReservesParallel(pairs, providers, chunkSize=1000):
-    # Create the contract objects
-    contracts = [
-        provider.eth.contract(address=queryContractAddress, abi=queryAbi)
-        for provider in providers
-    ]
-
-    # Create a list of chunks of pair addresses
-    chunks = [
-        [pairAddr for pairAddr in pairs[i : i + chunkSize]]
-        for i in range(0, len(pairs), chunkSize)
-    ]
-
-    # Assign each chunk to a provider in a round-robin fashion
-    tasks = [contracts[i % len(contracts)].functions.getReservesByPairs(pairs).call()
-        for i, pairs in enumerate(chunks)]
-
-    # Run the tasks in parallel
-    results = await asyncio.gather(*tasks)
-
-    # Flatten the results
-    results = [item for sublist in results for item in sublist]
-
-    return results
-
-
-# %%
-# Helper functions for calculating the optimal trade size
-# Output of a single swap
-def swap_output(x, a, b, fee=0.003):
-    return b * (1 - a/(a + x*(1-fee)))
-
-# Gross profit of two successive swaps
-def trade_profit(x, reserves1, reserves2, fee=0.003):
-    a1, b1 = reserves1
-    a2, b2 = reserves2
-    return swap_output(swap_output(x, a1, b1, fee), b2, a2, fee) - x
-
-# Optimal input amount
-def optimal_trade_size(reserves1, reserves2, fee=0.003):
-    a1, b1 = reserves1
-    a2, b2 = reserves2
-    return (math.sqrt(a1*b1*a2*b2*(1-fee)**4 * (b1*(1-fee)+b2)**2) - a1*b2*(1-fee)*(b1*(1-fee)+b2)) / ((1-fee) * (b1*(1-fee) + b2))**2
-
-
-# %%
-# Fetch the reserves of each pool in pool_dict
-to_fetch = [] # List of pool addresses for which reserves need to be fetched.
-for pair, pool_list in pool_dict.items():
-    for pair_object in pool_list:
-        to_fetch.append(pair_object["pair"]) # Add the address of the pool
-print(f"Fetching reserves of {len(to_fetch)} pools...")
-# getReservesParallel() is from article 2 in the MEV bot series
-reserveList = asyncio.get_event_loop().run_until_complete(getReservesParallel(to_fetch, providersAsync))
-
-
-# Build list of trading opportunities
-index = 0
-opps = []
-for pair, pool_list in pool_dict.items():
-    # Store the reserves in the pool objects for later use
-    for pair_object in pool_list:
-        pair_object["reserves"] = reserveList[index]
-        index += 1
-
-    # Iterate over all the pools of the pair
-    for poolA in pool_list:
-        for poolB in pool_list:
-            # Skip if it's the same pool
-            if poolA["pair"] == poolB["pair"]:
-                continue
-
-            # Skip if one of the reserves is 0 (division by 0)
-            if 0 in poolA["reserves"] or 0 in poolB["reserves"]:
-                continue
-
-            # Re-order the reserves so that WETH is always the first token
-            if poolA["token0"] == WETH:
-                res_A = (poolA["reserves"][0], poolA["reserves"][1])
-                res_B = (poolB["reserves"][0], poolB["reserves"][1])
-            else:
-                res_A = (poolA["reserves"][1], poolA["reserves"][0])
-                res_B = (poolB["reserves"][1], poolB["reserves"][0])
-            
-            # Compute value of optimal input through the formula
-            x = optimal_trade_size(res_A, res_B)
-
-            # Skip if optimal input is negative (the order of the pools is reversed)
-            if x < 0:
-                continue
-
-            # Compute gross profit in Wei (before gas cost)
-            profit = trade_profit(x, res_A, res_B)
-
-
-            # Store details of the opportunity. Values are in ETH. (1e18 Wei = 1 ETH)
-            opps.append({
-                "profit": profit / 1e18,
-                "input": x / 1e18,
-                "pair": pair,
-                "poolA": poolA,
-                "poolB": poolB,
-            })
-
-print(f"Found {len(opps)} opportunities.")
-
-
-# %%
-# Use the hard-coded gas cost of 107k gas per opportunity
-gp = w3.eth.gas_price
-for opp in opps:
-    opp["net_profit"] = opp["profit"] - 107000 * gp / 1e18
-
-# Sort by estimated net profit
-opps.sort(key=lambda x: x["net_profit"], reverse=True)
-
-# Keep positive opportunities
-positive_opps = [opp for opp in opps if opp["net_profit"] > 0]
-
-### Print stats
-# Positive opportunities
-print(f"Found {len(positive_opps)} positive opportunities.")
-
-# Details on each opportunity
-ETH_PRICE = 1900 # You should dynamically fetch the price of ETH
-for opp in positive_opps:
-    print(f"Profit: {opp['net_profit']} ETH (${opp['net_profit'] * ETH_PRICE})")
-    print(f"Input: {opp['input']} ETH (${opp['input'] * ETH_PRICE})")
-    print(f"Pool A: {opp['poolA']['pair']}")
-    print(f"Pool B: {opp['poolB']['pair']}")
-    print()
-
-# %%
+# %%
+# Read the list of factory contract addresses
+from web3 import Web3
+from web3 import AsyncHTTPProvider
+from web3.eth import AsyncEth
+import asyncio
+import json
+import logging
+import math
+import os
+import numpy as np
+import nest_asyncio
+from opp_scanner import PairArrays, scan_opportunities
+import swap_math
+from reserve_store import ReserveStore
+from opp_index import OpportunityIndex
+from pair_index import PairIndex
+from log_fetcher import getPairEventsAll
+from provider_pool import ProviderPool, getReservesPooled
+from reserves_decoder import getReservesAsmParallel
+from chunk_tuner import ChunkTuner, getReservesTuned, reservesCall
+from cycle_scanner import CycleSet, TokenGraph
+from pool_registry import PoolRegistry
+from stream_pipeline import StreamingScanner, reservesChunkFetcher, streamReserves
+from parallel_scanner import ParallelScanner
+from token_metadata import TokenMetadata, registry_tokens
+from batch_query import batchCallParallel, view_call
+from simulator import compileSimulator, simulate_opportunities
+from gas_model import FeeTracker, GasModel
+from block_engine import BlockEngine, block_number, block_timestamp, pollHeads, subscribeHeads
+from metrics import metrics
+from snapshot_log import SnapshotRecorder
+from log_archive import LogArchive, archiveLogs
+from backtester import backtest
+from pool_tiers import COLD, PoolTiers
+from rpc_transport import BatchingProvider
+nest_asyncio.apply()
+
+# Per-chunk progress messages are logged at the DEBUG level, set the level to logging.DEBUG to see them
+logging.basicConfig(level=logging.INFO, format="%(message)s")
+logger = logging.getLogger("find_opps")
+
+# Record the latency of each stage and of each RPC request (see metrics.py). Disabled, it costs almost nothing.
+metrics.enable()
+
+# Read infura nodes.
+# NODE_URI = 'https://mainnet.infura.io/v3/0ce674ab414048f580429a5bca905096'
+nodes = []
+with open("infura_nodes.txt", "r") as f:
+    for line in f:
+        nodes.append(line.strip())
+
+# Define providers
+# The async providers keep their connections alive and send the concurrent requests as JSON-RPC batches
+# (see rpc_transport.py). Web3(AsyncHTTPProvider(node), modules={"eth": (AsyncEth)}) works too.
+w3 = Web3(Web3.HTTPProvider(nodes[0]))
+providers = []
+providersAsync = []
+for node in nodes:
+    providers.append(Web3.HTTPProvider(node))
+    providersAsync.append(Web3(BatchingProvider(node), modules={"eth": (AsyncEth)}))
+
+# Read factory contract addresses
+# Uniswap V2 factory contract address
+# contract_address = '0x5C69bEe701ef814a2B6a3EDD4B1652CB9cc5aA6f'
+# SushiSwap factory contract address
+# contract_address = '0xC0AEe478e3658e2610c5F7A4A2E1777cE9e4f2Ac'
+with open("FactoriesV2.json", "r") as f:
+    factories = json.load(f)
+
+# Define the contract ABI
+factory_abi = [
+    {
+        "anonymous": False,
+        "inputs": [
+            {
+                "indexed": True,
+                "internalType": "address",
+                "name": "token0",
+                "type": "address",
+            },
+            {
+                "indexed": True,
+                "internalType": "address",
+                "name": "token1",
+                "type": "address",
+            },
+            {
+                "indexed": False,
+                "internalType": "address",
+                "name": "pair",
+                "type": "address",
+            },
+            {
+                "indexed": False,
+                "internalType": "uint256",
+                "name": "",
+                "type": "uint256",
+            },
+        ],
+        "name": "PairCreated",
+        "type": "event",
+    }
+]
+
+
+# %%
+# Recursive function to fetch event in incrementally smaller intervals
+def getPairEvents(contract, fromBlock, toBlock):
+    toBlockPrime = toBlock
+    fetchCount = 0
+
+    # Then, recursively fetch events in smaller time intervals
+    def getEventsRecursive(contract, _from, _to):
+        try:
+            events = (
+                contract.events.PairCreated()
+                .create_filter(fromBlock=_from, toBlock=_to)
+                .get_all_entries()
+            )
+            logger.debug("Found %d events between blocks %d and %d", len(events), _from, _to)
+            nonlocal fetchCount
+            fetchCount += len(events)
+            return events
+        except ValueError:
+            logger.debug("Too many events found between blocks %d and %d", _from, _to)
+            midBlock = (_from + _to) // 2
+            return getEventsRecursive(contract, _from, midBlock) + getEventsRecursive(
+                contract, midBlock + 1, _to
+            )
+
+    return getEventsRecursive(contract, fromBlock, toBlockPrime)
+
+
+# %%
+# Fetch list of pools for each factory contract.
+# The events are stored in a local index: only the blocks mined since the last run are scanned.
+# All the factories are scanned at the same time, with a block window learned per factory (see log_fetcher.py).
+# pair_index.update(w3, factories, factory_abi, getPairEvents, toBlock) does the same sequentially.
+pair_index = PairIndex("pairs.sqlite")
+toBlock = w3.eth.block_number
+fromBlocks = {factoryName: pair_index.last_block(factoryName) + 1 for factoryName in factories}
+eventsByFactory = asyncio.get_event_loop().run_until_complete(
+    getPairEventsAll(providersAsync, factories, fromBlocks, toBlock)
+)
+newCount = 0
+for factoryName, events in eventsByFactory.items():
+    pair_index.add_events(factoryName, events, toBlock)
+    newCount += len(events)
+poolCount = pair_index.count(factories.keys())
+print(f"Found {newCount} new pools, {poolCount} pools in total.")
+
+
+# %%
+WETH = "0xC02aaA39b223FE8D0A0e5C4F27eAD9083C756Cc2"
+# Store every pool in a compact registry: tokens and factories are interned to integer ids and the pools are kept in
+# arrays instead of one dict per pool (see pool_registry.py). It is saved so that it can be memory-mapped back.
+# The saved registry records the factories, and the number of pools and block of the newest pool indexed for each of
+# them. When they have not changed, it is restored as is, without loading the pool list.
+registrySource = {
+    "factories": [[factoryName, factoryData["factory"]] for factoryName, factoryData in factories.items()],
+    "lastPools": {factoryName: pair_index.last_pool(factoryName) for factoryName in factories},
+}
+if PoolRegistry.saved_source("registry") == registrySource:
+    registry = PoolRegistry.load("registry")
+else:
+    pairDataList = pair_index.load(factories.keys())
+    registry = PoolRegistry.build(pairDataList)
+    registry.save("registry", source=registrySource)
+
+# Keep the WETH pairs that are traded by at least two pools, grouped by pair.
+pair_arrays = PairArrays.from_registry(registry, WETH, minPools=2)
+pools_per_pair = np.diff(pair_arrays.offsets)
+
+
+# %%
+# Number of different pairs
+print(f'We have {len(pair_arrays.pairs)} different pairs.')
+
+# Total number of pools
+print(f'We have {len(pair_arrays.pools)} pools in total.')
+
+# Pair with the most pools
+print(f'The pair with the most pools is {pair_arrays.pairs[int(np.argmax(pools_per_pair))]} with {pools_per_pair.max()} pools.')
+
+
+# Distribution of the number of pools per pair, deciles
+pool_count_list = pools_per_pair.tolist()
+pool_count_list.sort(reverse=True)
+print(f'Number of pools per pair, in deciles: {pool_count_list[::int(len(pool_count_list)/10)]}')
+
+
+# Distribution of the number of pools per pair, percentiles (deciles of the first decile)
+pool_count_list.sort(reverse=True)
+print(f'Number of pools per pair, in percentiles: {pool_count_list[::int(len(pool_count_list)/100)][:10]}')
+
+
+# %%
+# Decimals and symbol of every token, cached in a local database: only the tokens seen for the first time are fetched,
+# 500 tokens per eth_call through Multicall3 (see token_metadata.py).
+token_metadata = TokenMetadata("tokens.sqlite")
+newTokens = asyncio.get_event_loop().run_until_complete(
+    token_metadata.refresh(registry_tokens(registry), providersAsync)
+)
+print(f"Fetched the metadata of {newTokens} new tokens, {len(token_metadata.decimals)} tokens in total.")
+
+# Drop the pairs whose token has unknown decimals or is a known fee-on-transfer token
+token_decimals, token_tradable = token_metadata.registry_arrays(registry)
+pair_tradable = token_tradable[registry.pairToken0[pair_arrays.pairIds]] & token_tradable[registry.pairToken1[pair_arrays.pairIds]]
+print(f"{np.count_nonzero(~pair_tradable)} pairs have a token that cannot be traded.")
+
+
+# %%
+# Address of the V2 Flash query contract
+queryContractAddress = "0x6c618c74235c70DF9F6AD47c6b5E9c8D3876432B"
+queryAbi = [{"inputs": [
+            {
+                "internalType": "contract IUniswapV2Pair[]",
+                "name": "_pairs",
+                "type": "address[]",
+            }
+        ],
+        "name": "getReservesByPairs",
+        "outputs": [
+            {"internalType": "uint256[3][]", "name": "", "type": "uint256[3][]"}
+        ],
+        "stateMutability": "view",
+        "type": "function"}]
+
+# Function to perform batch parallel requests
+async def getReservesParallel(pairs, providers, chunkSize=1000):
+    # Create the contract objects
+    contracts = [
+        provider.eth.contract(address=queryContractAddress, abi=queryAbi)
+        for provider in providers
+    ]
+
+    # Create a list of chunks of pair addresses
+    chunks = [
+        [pairAddr for pairAddr in pairs[i : i + chunkSize]]
+        for i in range(0, len(pairs), chunkSize)
+    ]
+
+    # Assign each chunk to a provider in a round-robin fashion
+    tasks = [contracts[i % len(contracts)].functions.getReservesByPairs(pairs).call()
+        for i, pairs in enumerate(chunks)]
+
+    # Run the tasks in parallel
+    results = await asyncio.gather(*tasks)
+
+    # Flatten the results
+    results = [item for sublist in results for item in sublist]
+
+    return results
+
+
+# %%
+# Helper functions for calculating the optimal trade size
+# Output of a single swap
+def swap_output(x, a, b, fee=0.003):
+    return b * (1 - a/(a + x*(1-fee)))
+
+# Gross profit of two successive swaps
+def trade_profit(x, reserves1, reserves2, fee=0.003):
+    a1, b1 = reserves1
+    a2, b2 = reserves2
+    return swap_output(swap_output(x, a1, b1, fee), b2, a2, fee) - x
+
+# Optimal input amount
+def optimal_trade_size(reserves1, reserves2, fee=0.003):
+    a1, b1 = reserves1
+    a2, b2 = reserves2
+    return (math.sqrt(a1*b1*a2*b2*(1-fee)**4 * (b1*(1-fee)+b2)**2) - a1*b2*(1-fee)*(b1*(1-fee)+b2)) / ((1-fee) * (b1*(1-fee) + b2))**2
+
+
+# %%
+# Fetch the reserves of each pool of the WETH pairs
+to_fetch = pair_arrays.addresses() # List of pool addresses for which reserves need to be fetched.
+print(f"Fetching reserves of {len(to_fetch)} pools...")
+
+# Pick the chunk size from per-endpoint measurements. Endpoints are only probed again once their measurements are
+# older than an hour (the block loop below starts the new probes), the results are kept in chunk_sizes.json across
+# restarts (see chunk_tuner.py).
+chunk_tuner = ChunkTuner("chunk_sizes.json")
+reservesChunk = reservesCall(queryContractAddress, queryAbi)
+asyncio.get_event_loop().run_until_complete(chunk_tuner.probe_all(nodes, providersAsync, reservesChunk, to_fetch))
+chunkSize = chunk_tuner.choose(nodes, len(to_fetch))
+print(f"Using chunks of {chunkSize} pools.")
+
+# getReservesParallel() is from article 2 in the MEV bot series. Here the chunk size comes from the tuner, and a chunk
+# that hits the gas or response-size limit of a provider is split and retried, and the provider backed off.
+# reserveList = asyncio.get_event_loop().run_until_complete(getReservesParallel(to_fetch, providersAsync))
+fetchHeader = w3.eth.get_block("latest")
+fetchBlock = fetchHeader["number"]
+reserveList = asyncio.get_event_loop().run_until_complete(
+    getReservesTuned(to_fetch, providersAsync, nodes, chunk_tuner, reservesChunk)
+)
+
+# The other fetches are routed through a provider pool that favours the fastest healthy nodes, hedges slow requests
+# and retries failed chunks (see provider_pool.py).
+provider_pool = ProviderPool(providersAsync)
+
+# Seed the reserve store. On the next blocks, only the Sync logs are needed to keep the reserves up to date.
+reserve_store = ReserveStore(to_fetch)
+reserve_store.seed(reserveList, fetchBlock)
+reserve_store.take_dirty() # Every pool is scanned below anyway
+
+
+# Sort the pools in hot, warm and cold tiers by WETH liquidity, time since their last Sync and tradability of their
+# token (see pool_tiers.py). Cold pools (dust, dead pools, broken tokens) are left out of the scan.
+pair_arrays.set_reserves(reserveList)
+pool_tiers = PoolTiers(pair_arrays)
+pool_tiers.observe_reserves(reserveList)
+pool_tiers.set_token_tradable(registry, token_tradable)
+hot, warm, cold = pool_tiers.update(fetchHeader["timestamp"])
+print(f"{hot} hot pools, {warm} warm pools, {cold} cold pools.")
+
+# Build the array of trading opportunities.
+# Every ordered (poolA, poolB) combination of two pools out of the cold tier is evaluated at once with the closed-form
+# formula.
+opps = scan_opportunities(pair_arrays, combos=pool_tiers.combos)
+
+print(f"Found {len(opps)} opportunities.")
+
+# Gas price projected for the next block from the header of the fetch block (EIP-1559 base fee plus a tip), and gas
+# used per pool and per token learned from the previous simulations (see gas_model.py)
+fee_tracker = FeeTracker()
+fee_tracker.on_header(fetchHeader)
+asyncio.get_event_loop().run_until_complete(fee_tracker.refresh_priority_fee(providersAsync[0]))
+gp = fee_tracker.gas_price()
+gas_model = GasModel("gas_model.json")
+
+
+# %%
+# Streaming alternative: evaluate each pair as soon as the reserves of its pools come back, and keep a running top 10.
+# The first opportunities are known long before the last chunk arrives (see stream_pipeline.py).
+async def streamScan():
+    scanner = StreamingScanner(pair_arrays, topK=10, gasCost=gas_model.default_cost(gp))
+    fetchChunk = reservesChunkFetcher(provider_pool, queryContractAddress, queryAbi)
+    async for start, chunk in streamReserves(to_fetch, fetchChunk, chunkSize):
+        scanner.add_chunk(start, chunk)
+        best = scanner.top()
+        if best:
+            print(f"{scanner.poolCount}/{len(to_fetch)} pools loaded, best net profit so far: {best[0][0]} ETH")
+    return scanner
+
+stream_scanner = asyncio.get_event_loop().run_until_complete(streamScan())
+print(f"Found {stream_scanner.opportunityCount} opportunities.")
+
+
+# %%
+# Faster alternative for the reserves: getReservesByPairsAsm() of QueryContractYulAsm.sol (article 2), called with
+# hand-built calldata and decoded in bulk with NumPy (see reserves_decoder.py). Deploy the contract and set its address
+# below to use it. Pools whose getReserves() call failed are reported as invalid instead of zero reserves.
+queryAsmAddress = None
+if queryAsmAddress is not None:
+    raw_reserves, timestamps, valid = asyncio.get_event_loop().run_until_complete(
+        getReservesAsmParallel(to_fetch, providersAsync, queryAsmAddress)
+    )
+    print(f"{np.count_nonzero(~valid)} pools failed to return their reserves.")
+    pair_arrays.set_raw_reserves(raw_reserves)
+    opps = scan_opportunities(pair_arrays)
+    print(f"Found {len(opps)} opportunities.")
+
+
+# %%
+# Subtract the gas cost of each opportunity, estimated from the pools and tokens it trades
+net_profit = opps["profit"] - gas_model.costs(opps, pair_arrays, WETH, gp)
+
+# Sort by estimated net profit
+with metrics.timer("stage_seconds", stage="sort"):
+    order = np.argsort(-net_profit, kind="stable")
+opps = opps[order]
+net_profit = net_profit[order]
+
+# Keep positive opportunities
+positive = (net_profit > 0) & pair_tradable[opps["pair"]]
+positive_opps = opps[positive]
+positive_net_profit = net_profit[positive]
+
+### Print stats
+# Positive opportunities
+print(f"Found {len(positive_opps)} positive opportunities.")
+
+# Price of ETH from the deepest WETH/USDC pool, with the cached decimals of USDC. DEFAULT_ETH_PRICE is used when
+# there is no WETH/USDC pool with two pools or more in the scan, or when the decimals of USDC are unknown.
+USDC = "0xA0b86991c6218b36c1d19D4a2e9Eb0cE3606eB48"
+DEFAULT_ETH_PRICE = 1900
+ETH_PRICE = None
+usdcId = registry.token_id(USDC)
+if usdcId is not None:
+    usdcPools = np.nonzero(np.isin(pair_arrays.poolIds, registry.pools_of_token(usdcId)))[0]
+    if len(usdcPools) > 0:
+        deepest = usdcPools[np.argmax(pair_arrays.reserves[usdcPools, 0])]
+        ETH_PRICE = token_metadata.eth_price(USDC, *pair_arrays.reserves[deepest])
+if ETH_PRICE is None:
+    ETH_PRICE = DEFAULT_ETH_PRICE
+
+# Details on each opportunity
+for opp, opp_net_profit in zip(positive_opps, positive_net_profit):
+    print(f"Profit: {opp_net_profit} ETH (${opp_net_profit * ETH_PRICE})")
+    print(f"Input: {opp['input']} ETH (${opp['input'] * ETH_PRICE})")
+    print(f"Pool A: {pair_arrays.pools[opp['poolA']]['pair']}")
+    print(f"Pool B: {pair_arrays.pools[opp['poolB']]['pair']}")
+    print()
+
+# %%
+# Re-evaluate the positive opportunities with the exact integer math of the pair contract.
+# The input and profit below are in Wei and are exactly what getAmountOut() would return on-chain for these reserves.
+exact_opps = swap_math.scan_opportunities_exact(pair_arrays, reserveList, positive_opps)
+for poolA_index, poolB_index, amount_in, amount_out, exact_profit in exact_opps:
+    print(f"Pool A: {pair_arrays.pools[poolA_index]['pair']}, Pool B: {pair_arrays.pools[poolB_index]['pair']}")
+    print(f"Exact input: {amount_in} Wei, exact gross profit: {exact_profit} Wei")
+
+# %%
+# Check the pools of the positive opportunities with any view call, all in a few eth_call through BatchQuery.sol
+# (article 2 folder, see batch_query.py): the tokens must match the registry and the pool must hold at least the WETH
+# reserve it reports. Deploy the contract on anvil with compileBatchQuery() and deployBatchQuery() and set its address
+# below to use it.
+batchQueryAddress = None
+if batchQueryAddress is not None:
+    check_pools = np.unique(np.concatenate((positive_opps["poolA"], positive_opps["poolB"])))
+    calls = []
+    for pool in check_pools.tolist():
+        address = pair_arrays.pools[pool]["pair"]
+        calls.append(view_call(address, "token0()", returns=("address",)))
+        calls.append(view_call(address, "token1()", returns=("address",)))
+        calls.append(view_call(WETH, "balanceOf(address)", [address]))
+    values, ok = asyncio.get_event_loop().run_until_complete(
+        batchCallParallel(calls, providersAsync, batchQueryAddress)
+    )
+    for k, pool in enumerate(check_pools.tolist()):
+        token0, token1, wethBalance = values[3 * k : 3 * k + 3]
+        expected = pair_arrays.pools[pool]
+        if not ok[3 * k : 3 * k + 3].all():
+            print(f"Pool {expected['pair']}: call failed")
+        elif (token0, token1) != (expected["token0"], expected["token1"]) or wethBalance < pair_arrays.reserves[pool, 0]:
+            print(f"Pool {expected['pair']}: inconsistent state, WETH balance {wethBalance}")
+
+# %%
+# Simulate the best candidates before acting on them: both swaps are executed in an eth_call on a local anvil fork
+# (anvil --fork-url <NODE_URI>), with the code of SimulateArb.sol injected by a state override (see simulator.py).
+# Candidates that revert or lose WETH are dropped, and the tokens found to take a fee on transfer are recorded.
+ANVIL_URI = None # e.g. "http://localhost:8545"
+if ANVIL_URI is not None:
+    anvilProviders = [Web3(AsyncHTTPProvider(ANVIL_URI), modules={"eth": (AsyncEth)}) for _ in range(4)]
+    simulated = asyncio.get_event_loop().run_until_complete(
+        simulate_opportunities(positive_opps[:20], pair_arrays, WETH, anvilProviders, compileSimulator())
+    )
+    for sim in simulated[simulated["fee_on_transfer"]]:
+        poolA = pair_arrays.pools[int(sim["poolA"])]
+        token_metadata.set_fee_on_transfer(poolA["token1"] if poolA["token0"] == WETH else poolA["token0"], True)
+        pool_tiers.mark_untradable([sim["poolA"], sim["poolB"]])
+    print(f"{np.count_nonzero(simulated['ok'])} of {len(simulated)} candidates passed the simulation.")
+    for sim in simulated[simulated["ok"]]:
+        print(f"Pool A: {pair_arrays.pools[int(sim['poolA'])]['pair']}, Pool B: {pair_arrays.pools[int(sim['poolB'])]['pair']}")
+        print(f"Simulated profit: {sim['sim_profit']} ETH for {sim['gas']} gas")
+
+    # The gas measured by the simulations refines the estimates of the next scans
+    gas_model.learn(simulated, pair_arrays, WETH)
+    gas_model.save()
+
+# %%
+# Tiered refresh without Sync logs: on each block, only the pools that are due are fetched (hot pools every block,
+# warm and cold pools spread over their interval), and the tiers are recomputed from the new reserves.
+async def refreshDue(header):
+    due = pool_tiers.due(block_number(header))
+    dueReserves = await getReservesTuned([to_fetch[i] for i in due.tolist()], providersAsync, nodes, chunk_tuner, reservesChunk)
+    pair_arrays.set_raw_reserves_at(due, np.array([r[:2] for r in dueReserves], dtype=np.float64).reshape(-1, 2))
+    pool_tiers.observe(due, [r[2] for r in dueReserves])
+    pool_tiers.update(header["timestamp"])
+    return len(due)
+
+refreshed = asyncio.get_event_loop().run_until_complete(refreshDue(w3.eth.get_block("latest")))
+print(f"Refreshed {refreshed} of {len(to_fetch)} pools.")
+
+# %%
+# Multi-process alternative: the pairs are sharded over long-lived worker processes that read the reserves from
+# shared memory (see parallel_scanner.py). Each block, write the new reserves and ask the workers for their best picks.
+# Only the combinations of the tiers are scanned. The workers stay up for the block loop below, which feeds them the
+# reserves of every block when PARALLEL_SCAN is set, and are stopped by parallel_scanner.close().
+parallel_scanner = ParallelScanner(pair_arrays, combos=pool_tiers.combos)
+parallel_scanner.update_reserves()
+parallel_scanner.set_pool_cost(gas_model.pool_gas(pair_arrays, WETH) * gp / 1e18)
+for opp in parallel_scanner.scan(k=10):
+    print(f"Net profit: {opp['net_profit']} ETH, input: {opp['input']} ETH")
+    print(f"Pool A: {pair_arrays.pools[opp['poolA']]['pair']}, Pool B: {pair_arrays.pools[opp['poolB']]['pair']}")
+
+# %%
+# Index of the opportunities of the combinations of the tiers, ranked by net profit with the gas learned for each
+# combination. It is built once from the current reserves.
+opp_index = OpportunityIndex(pair_arrays, combos=pool_tiers.combos, gas=gas_model.combo_gas(pair_arrays, WETH), gasPrice=gp)
+opp_index.build()
+
+# %%
+# On a new block, update the reserves from the Sync logs instead of re-fetching every pool.
+# Only the opportunities involving a pool whose reserves changed are recomputed.
+updated = asyncio.get_event_loop().run_until_complete(reserve_store.update(providersAsync[0]))
+dirty = reserve_store.take_dirty()
+print(f"{updated} reserves updated from Sync logs, {len(dirty)} pools changed.")
+reserveList = reserve_store.reserves
+pair_arrays.set_reserves(reserveList)
+recomputed = opp_index.update(dirty)
+print(f"Recomputed {recomputed} opportunities at block {reserve_store.block}.")
+for (pair, poolA_index, poolB_index), amount_in, gross_profit, opp_net_profit in opp_index.top(10):
+    print(f"Net profit: {opp_net_profit} ETH, input: {amount_in} ETH")
+    print(f"Pool A: {pair_arrays.pools[poolA_index]['pair']}, Pool B: {pair_arrays.pools[poolB_index]['pair']}")
+
+# %%
+# Multi-hop opportunities: cycles through WETH over every pool of every factory, not only the WETH pairs with two pools.
+# The cycles are enumerated once and cached in cycles.npz (see cycle_scanner.py).
+token_graph = TokenGraph.from_registry(registry, WETH)
+cycle_set = None
+if os.path.exists("cycles.npz"):
+    cycle_set = CycleSet.load(token_graph, "cycles.npz")
+if cycle_set is None:
+    cycle_set = CycleSet.enumerate(token_graph, maxLength=3)
+    cycle_set.save("cycles.npz")
+print(f"{len(cycle_set.length)} cycles through WETH{' (truncated at maxCycles)' if cycle_set.truncated else ''}.")
+
+allReserves = asyncio.get_event_loop().run_until_complete(
+    getReservesPooled(token_graph.addresses(), provider_pool, queryContractAddress, queryAbi, chunkSize)
+)
+token_graph.set_reserves(allReserves)
+cycle_set.evaluate()
+cycle_set.set_gas_cost(gas_model.cycle_gas(cycle_set, WETH) * gp / 1e18)
+
+# Reserves of every pool of the graph, kept up to date by the Sync logs fetched for reserve_store in the block loop
+graph_store = ReserveStore(token_graph.addresses())
+graph_store.seed(allReserves, reserve_store.block)
+graph_store.take_dirty()
+for cycle, amount_in, gross_profit, cycle_net_profit in cycle_set.top(10):
+    print(f"Profit: {cycle_net_profit} ETH, input: {amount_in} ETH")
+    print(f"Pools: {' -> '.join(cycle_set.path(cycle))}")
+
+# %%
+# Steady-state runner: on every new block, update the reserves from the Sync logs, recompute the opportunities of the
+# pools that changed and rank them. If a newer block arrives first, the work on the old one is cancelled.
+# Use subscribeHeads(WS_URI) with a WebSocket endpoint, pollHeads() otherwise. To test it, run a local node that mines
+# on demand (anvil --no-mining) and call evm_mine, or use MockNode.mine() of mock_node.py.
+# With SNAPSHOT_PATH set, the reserves of every block are recorded for an offline replay (see snapshot_log.py and
+# bench_replay.py).
+# With PARALLEL_SCAN set, the combinations are scanned by the workers of parallel_scanner instead of the incremental
+# opp_index.
+# The gas price follows each header, and the tip is refreshed from the node every PRIORITY_FEE_INTERVAL blocks. The
+# heap of opp_index is only re-ranked when the price moves by more than GAS_PRICE_TOLERANCE.
+SNAPSHOT_PATH = None # e.g. "snapshots"
+PARALLEL_SCAN = False
+PRIORITY_FEE_INTERVAL = 10
+GAS_PRICE_TOLERANCE = 0.05
+snapshot_recorder = None
+if SNAPSHOT_PATH is not None:
+    snapshot_recorder = SnapshotRecorder(SNAPSHOT_PATH, registry, pair_arrays.poolIds)
+    snapshot_recorder.record(reserve_store.block, reserve_store.reserves)
+
+async def onBlock(header, deadline):
+    number = block_number(header)
+    fee_tracker.on_header(header)
+    chunk_tuner.reprobe(nodes, providersAsync, reservesChunk, to_fetch)
+    with metrics.timer("stage_seconds", stage="sync_logs"):
+        updates = [reserve_store.update(providersAsync[0], toBlock=number, followers=[graph_store])]
+        if number % PRIORITY_FEE_INTERVAL == 0:
+            updates.append(fee_tracker.refresh_priority_fee(providersAsync[0]))
+        await asyncio.gather(*updates)
+    gasPrice = fee_tracker.gas_price()
+    # Hot pools follow their Sync logs only. Warm and cold pools are also read by eth_call once per interval, spread over
+    # the blocks: this repairs missed Sync logs and keeps the blockTimestampLast of quiet pools current for the tiers.
+    with metrics.timer("stage_seconds", stage="repair"):
+        repair = pool_tiers.due(number, hot=False)
+        repairReserves = await getReservesTuned([to_fetch[i] for i in repair.tolist()], providersAsync, nodes, chunk_tuner, reservesChunk)
+        reserve_store.refresh(repair.tolist(), repairReserves, number)
+        graph_store.refresh(pair_arrays.poolIds[repair].tolist(), repairReserves, number)
+    with metrics.timer("stage_seconds", stage="apply"):
+        dirty = reserve_store.take_dirty()
+        if snapshot_recorder is not None:
+            snapshot_recorder.record_dirty(number, reserve_store.reserves, dirty)
+        for pool in dirty:
+            pair_arrays.set_reserves_slice(pool, [reserve_store.reserves[pool]])
+    with metrics.timer("stage_seconds", stage="tiers"):
+        # Pools with a Sync at this block were active at its timestamp
+        pool_tiers.observe(sorted(dirty), block_timestamp(header))
+        pool_tiers.observe(repair, [r[2] for r in repairReserves])
+        # The tiers are recomputed every updateInterval blocks, and only the combinations that changed are evaluated
+        if pool_tiers.stale(number):
+            pool_tiers.update(block_timestamp(header), number)
+            if PARALLEL_SCAN:
+                parallel_scanner.set_combos(pool_tiers.combos)
+            else:
+                opp_index.set_combos(pool_tiers.combos)
+        # Cold pools are out of every scanned combination. Their reserves are still kept, for when they get promoted.
+        activeDirty = [pool for pool in dirty if pool_tiers.tier[pool] != COLD]
+    with metrics.timer("stage_seconds", stage="opportunities"):
+        if PARALLEL_SCAN:
+            parallel_scanner.update_reserves(dirty)
+            parallel_scanner.set_pool_cost(gas_model.pool_gas(pair_arrays, WETH) * gasPrice / 1e18)
+            best = [
+                ((int(opp["pair"]), int(opp["poolA"]), int(opp["poolB"])), opp["input"], opp["profit"], opp["net_profit"])
+                for opp in parallel_scanner.scan(k=1)
+            ]
+        else:
+            opp_index.set_gas_price(gasPrice, tolerance=GAS_PRICE_TOLERANCE)
+            opp_index.update(activeDirty)
+            best = opp_index.top(1)
+    with metrics.timer("stage_seconds", stage="cycles"):
+        # Cycles through the pools of the graph whose reserves changed, middle legs included
+        graphDirty = sorted(graph_store.take_dirty())
+        if graphDirty:
+            token_graph.reserves[graphDirty] = [graph_store.reserves[pool] for pool in graphDirty]
+            cycle_set.update(graphDirty)
+        cycle_set.set_gas_cost(gas_model.cycle_gas(cycle_set, WETH) * gasPrice / 1e18)
+        bestCycles = cycle_set.top(1)
+    for (pair, poolA, poolB), amount_in, gross_profit, opp_net_profit in best:
+        if opp_net_profit > 0:
+            print(f"Block {number}: net profit {opp_net_profit} ETH, input {amount_in} ETH, pools {poolA} -> {poolB}")
+    for cycle, amount_in, gross_profit, cycle_net_profit in bestCycles:
+        if cycle_net_profit > 0:
+            print(f"Block {number}: net profit {cycle_net_profit} ETH, input {amount_in} ETH, cycle {' -> '.join(cycle_set.path(cycle))}")
+
+WS_URI = None # e.g. "wss://mainnet.infura.io/ws/v3/<YOUR_INFURA_ID>"
+block_engine = BlockEngine(onBlock, budget=1.0)
+heads = subscribeHeads(WS_URI) if WS_URI is not None else pollHeads(providersAsync[0], interval=1.0)
+asyncio.get_event_loop().run_until_complete(block_engine.run(heads, maxBlocks=10))
+print(block_engine.summary())
+parallel_scanner.close()
+
+# %%
+# Backtest: how much the strategy would have earned over past blocks. The Sync and Swap logs of the pools are archived
+# on disk from the last block applied by the reserve store onwards, with its reserves as base (see log_archive.py), then replayed block by block on worker processes, with no
+# node involved (see backtester.py). Realised profit is the profit of each trade on the reserves of the block where it
+# would have landed.
+ARCHIVE_PATH = None # e.g. "log_archive"
+if ARCHIVE_PATH is not None:
+    if os.path.exists(os.path.join(ARCHIVE_PATH, "meta.json")):
+        log_archive = LogArchive(ARCHIVE_PATH)
+    else:
+        log_archive = LogArchive.create(ARCHIVE_PATH, to_fetch, reserve_store.block, reserve_store.reserves)
+    asyncio.get_event_loop().run_until_complete(archiveLogs(log_archive, providersAsync, w3.eth.block_number))
+    result = backtest(ARCHIVE_PATH, pair_arrays, log_archive.baseBlock + 1, log_archive.lastBlock, gas_model.default_cost(gp))
+    print(f"{result['trades']} trades over {result['blocks']} blocks with Sync logs, {result['taken']} taken by competitors.")
+    print(f"Estimated net profit: {result['estimated']} ETH, realised: {result['realised']} ETH")
+
+# %%
+# Where the time goes: latency histograms of each stage (fetch, decode, scan, sort, and in the block loop sync_logs,
+# repair, apply, tiers, opportunities, cycles), of each RPC request per provider and of each block, plus the pools
+# scanned and opportunities found. Scrape metrics.prom with the node exporter textfile collector, or read
+# metrics.json.
+with open("metrics.prom", "w") as f:
+    f.write(metrics.prometheus())
+metrics.save("metrics.json")
+for histogram in metrics.to_json()["histograms"]:
+    print(f"{histogram['name']} {histogram['labels']}: {histogram['count']} samples, mean {histogram['mean']:.6f} s")
+
+# %%
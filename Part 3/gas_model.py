@@ -0,0 +1,135 @@
+# Gas cost model for the net profit of an opportunity.
+# FeeTracker follows the EIP-1559 base fee from the block headers the bot already receives, and projects the base fee
+# of the next block, in which the transaction would be included. GasModel learns the gas used by each pool and each
+# token from the simulations (see simulator.py) and turns it into a gas estimate per opportunity, in a single NumPy pass.
+import json
+import os
+
+import numpy as np
+
+# Gas of a two-pool arbitrage when nothing better is known
+DEFAULT_GAS = 107000
+
+# EIP-1559 parameters
+ELASTICITY_MULTIPLIER = 2
+BASE_FEE_MAX_CHANGE_DENOMINATOR = 8
+
+
+# Base fee of the block following a block with the given base fee, gas used and gas limit
+def next_base_fee(baseFee, gasUsed, gasLimit):
+    target = gasLimit // ELASTICITY_MULTIPLIER
+    if target == 0 or gasUsed == target:
+        return baseFee
+    if gasUsed > target:
+        return baseFee + max(baseFee * (gasUsed - target) // target // BASE_FEE_MAX_CHANGE_DENOMINATOR, 1)
+    return baseFee - baseFee * (target - gasUsed) // target // BASE_FEE_MAX_CHANGE_DENOMINATOR
+
+
+class FeeTracker:
+    # priorityFee is the tip paid to the block builder, in Wei per gas
+    def __init__(self, priorityFee=10**9):
+        self.priorityFee = priorityFee
+        self.block = None
+        self.baseFee = None
+        self.nextBaseFee = None
+
+    # Update from a block header (a dict with number, baseFeePerGas, gasUsed and gasLimit, as returned by get_block()
+    # or a newHeads subscription). Older headers are ignored.
+    def on_header(self, header):
+        number = header["number"]
+        number = int(number, 16) if isinstance(number, str) else number
+        if self.block is not None and number < self.block:
+            return
+        field = lambda name: int(header[name], 16) if isinstance(header[name], str) else header[name]
+        self.block = number
+        self.baseFee = field("baseFeePerGas")
+        self.nextBaseFee = next_base_fee(self.baseFee, field("gasUsed"), field("gasLimit"))
+
+    # Update the tip from the node, e.g. every few blocks in the background
+    async def refresh_priority_fee(self, w3Async):
+        self.priorityFee = await w3Async.eth.max_priority_fee
+
+    # Gas price in Wei for a transaction included in the next block
+    def gas_price(self):
+        if self.nextBaseFee is None:
+            raise ValueError("No block header received yet")
+        return self.nextBaseFee + self.priorityFee
+
+
+class GasModel:
+    # alpha is the weight of a new simulation in the moving averages
+    def __init__(self, path="gas_model.json", defaultGas=DEFAULT_GAS, alpha=0.3):
+        self.path = path
+        self.defaultGas = defaultGas
+        self.alpha = alpha
+        # Gas of one swap through a pool, and of a whole two-pool trade of a token, keyed by lowercase address
+        self.poolGas = {}
+        self.tokenGas = {}
+        if path is not None and os.path.exists(path):
+            with open(path, "r") as f:
+                data = json.load(f)
+            self.poolGas = data["poolGas"]
+            self.tokenGas = data["tokenGas"]
+        self.version = 0
+        # Per-pool gas of each pool list, keyed by id(): (pools, version, gas)
+        self._cache = {}
+
+    def save(self):
+        with open(self.path, "w") as f:
+            json.dump({"poolGas": self.poolGas, "tokenGas": self.tokenGas}, f)
+
+    def _average(self, table, key, value):
+        previous = table.get(key)
+        table[key] = value if previous is None else previous + self.alpha * (value - previous)
+
+    # Learn from simulation results (an array of SIM_DTYPE). The gas of a trade is split evenly between its two pools.
+    def learn(self, simulated, pair_arrays, weth):
+        for sim in simulated[simulated["gas"] > 0]:
+            poolA = pair_arrays.pools[int(sim["poolA"])]
+            poolB = pair_arrays.pools[int(sim["poolB"])]
+            token = poolA["token1"] if poolA["token0"] == weth else poolA["token0"]
+            gas = float(sim["gas"])
+            self._average(self.tokenGas, token.lower(), gas)
+            self._average(self.poolGas, poolA["pair"].lower(), gas / 2)
+            self._average(self.poolGas, poolB["pair"].lower(), gas / 2)
+        self.version += 1
+
+    # Gas of one swap through each pool of pair_arrays (or any object with a pools list, e.g. a TokenGraph): learned
+    # for the pool, else derived from its token, else from defaultGas. Cached until the next learn().
+    def pool_gas(self, pair_arrays, weth):
+        cached = self._cache.get(id(pair_arrays))
+        if cached is not None and cached[0] is pair_arrays and cached[1] == self.version:
+            return cached[2]
+        gas = np.full(len(pair_arrays.pools), self.defaultGas / 2)
+        if self.poolGas or self.tokenGas:
+            for i, pool in enumerate(pair_arrays.pools):
+                known = self.poolGas.get(pool["pair"].lower())
+                if known is None:
+                    token = pool["token1"] if pool["token0"] == weth else pool["token0"]
+                    known = self.tokenGas.get(token.lower(), self.defaultGas) / 2
+                gas[i] = known
+        self._cache[id(pair_arrays)] = (pair_arrays, self.version, gas)
+        return gas
+
+    # Gas of every combination of pair_arrays (pair_arrays.idx_a / idx_b), e.g. for OpportunityIndex
+    def combo_gas(self, pair_arrays, weth):
+        gas = self.pool_gas(pair_arrays, weth)
+        return gas[pair_arrays.idx_a] + gas[pair_arrays.idx_b]
+
+    # Gas of every cycle of a CycleSet (see cycle_scanner.py): the gas of its pools
+    def cycle_gas(self, cycle_set, weth):
+        gas = self.pool_gas(cycle_set.graph, weth)
+        return np.where(cycle_set.cyclePools >= 0, gas[cycle_set.cyclePools], 0).sum(axis=1)
+
+    # Gas estimate of every opportunity of an array of OPP_DTYPE
+    def estimate(self, opps, pair_arrays, weth):
+        gas = self.pool_gas(pair_arrays, weth)
+        return gas[opps["poolA"]] + gas[opps["poolB"]]
+
+    # Gas cost in ETH of every opportunity, at gasPrice Wei per gas
+    def costs(self, opps, pair_arrays, weth, gasPrice):
+        return self.estimate(opps, pair_arrays, weth) * gasPrice / 1e18
+
+    # Cost in ETH of a trade through hopCount pools when nothing is known about them
+    def default_cost(self, gasPrice, hopCount=2):
+        return self.defaultGas / 2 * hopCount * gasPrice / 1e18
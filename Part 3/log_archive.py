@@ -0,0 +1,161 @@
+# On-disk archive of the Sync and Swap logs of a fixed list of pools, for backtests without a live node.
+# An archive is a directory holding:
+#   pools.npy   the (n, 20) uint8 addresses of the archived pools (the order of pair_arrays.addresses())
+#   base.npy    the (n, 4) uint64 reserve words of every pool at baseBlock (see snapshot_log.py for the layout)
+#   meta.json   baseBlock, lastBlock and the list of chunk files with their block range
+#   logs_<from>_<to>.npz  one file per block range, with the decoded logs as columns:
+#       sync_block, sync_pool, sync_words (new reserves), swap_block, swap_pool, swap_amounts
+#       (float64 amount0In, amount1In, amount0Out, amount1Out), each sorted by block and log index.
+#   state_<to>.npy  the (n, 4) uint64 reserve words of every pool at the end of each chunk, so that the reserves at
+#       any block are rebuilt from the previous chunk instead of from baseBlock.
+# Logs are fetched and written one chunk at a time, keeping only the logs of the archived pools, and read back one
+# chunk at a time, so memory stays bounded whatever the number of blocks.
+import json
+import os
+
+import numpy as np
+
+from log_fetcher import AdaptiveWindow, getLogsAdaptive
+from reserve_store import SYNC_TOPIC, decode_sync_data, to_hex, to_int
+from snapshot_log import reserves_to_words
+
+# keccak256("Swap(address,uint256,uint256,uint256,uint256,address)")
+SWAP_TOPIC = "0xd78ad95fa46c994b6551d0da85fc275fe613ce37657fb8d5e3d130840159d822"
+
+
+def decode_swap_data(data):
+    data = to_hex(data)
+    return [int(data[64 * k : 64 * k + 64], 16) for k in range(4)]
+
+
+# Apply the last Sync of each pool to the reserve words, in place
+def apply_last_syncs(words, pools, syncWords):
+    last = len(pools) - 1 - np.unique(pools[::-1], return_index=True)[1]
+    words[pools[last]] = syncWords[last]
+
+
+class LogArchive:
+    def __init__(self, path):
+        self.path = path
+        with open(os.path.join(path, "meta.json"), "r") as f:
+            self.meta = json.load(f)
+        self.addresses = np.load(os.path.join(path, "pools.npy"))
+        self.base = np.load(os.path.join(path, "base.npy"), mmap_mode="r")
+        self.index = {self.addresses[i].tobytes().hex(): i for i in range(len(self.addresses))}
+
+    # Create an archive of the given pools, starting from their reserves at baseBlock
+    # (e.g. the to_fetch list and the reserveList of find_opps.py).
+    @classmethod
+    def create(cls, path, addresses, baseBlock, baseReserves):
+        os.makedirs(path, exist_ok=True)
+        raw = np.array([list(bytes.fromhex(to_hex(address))) for address in addresses], dtype=np.uint8).reshape(-1, 20)
+        np.save(os.path.join(path, "pools.npy"), raw)
+        np.save(os.path.join(path, "base.npy"), reserves_to_words(baseReserves))
+        with open(os.path.join(path, "meta.json"), "w") as f:
+            json.dump({"baseBlock": baseBlock, "lastBlock": baseBlock, "chunks": []}, f)
+        return cls(path)
+
+    @property
+    def baseBlock(self):
+        return self.meta["baseBlock"]
+
+    @property
+    def lastBlock(self):
+        return self.meta["lastBlock"]
+
+    def _state_path(self, block):
+        return os.path.join(self.path, f"state_{block}.npy")
+
+    # Whether a log belongs to an archived pool and was not removed by a reorg
+    def keeps(self, log):
+        return to_hex(log["address"]) in self.index and not log.get("removed")
+
+    def _save_meta(self):
+        temporary = os.path.join(self.path, "meta.json.tmp")
+        with open(temporary, "w") as f:
+            json.dump(self.meta, f)
+        os.replace(temporary, os.path.join(self.path, "meta.json"))
+
+    # Decode and store the logs of the blocks [fromBlock, toBlock], which must follow the last archived block.
+    # Logs of other pools and removed logs are dropped.
+    def add_chunk(self, fromBlock, toBlock, syncLogs, swapLogs):
+        if fromBlock != self.lastBlock + 1:
+            raise ValueError(f"Chunk starts at block {fromBlock}, expected {self.lastBlock + 1}")
+
+        def rows(logs, decode):
+            selected = []
+            for log in logs:
+                if not self.keeps(log):
+                    continue
+                i = self.index[to_hex(log["address"])]
+                selected.append((to_int(log["blockNumber"]), to_int(log["logIndex"]), i, decode(log["data"])))
+            selected.sort(key=lambda row: (row[0], row[1]))
+            return selected
+
+        syncs = rows(syncLogs, decode_sync_data)
+        swaps = rows(swapLogs, decode_swap_data)
+        syncPools = np.array([row[2] for row in syncs], dtype=np.int32)
+        syncWords = reserves_to_words([row[3] for row in syncs])
+        name = f"logs_{fromBlock}_{toBlock}.npz"
+        np.savez(
+            os.path.join(self.path, name),
+            sync_block=np.array([row[0] for row in syncs], dtype=np.int64),
+            sync_pool=syncPools,
+            sync_words=syncWords,
+            swap_block=np.array([row[0] for row in swaps], dtype=np.int64),
+            swap_pool=np.array([row[2] for row in swaps], dtype=np.int32),
+            swap_amounts=np.array([row[3] for row in swaps], dtype=np.float64).reshape(-1, 4),
+        )
+        # Reserves at the end of the chunk, from those at the end of the previous one
+        words = self.state_at(fromBlock - 1)
+        apply_last_syncs(words, syncPools, syncWords)
+        np.save(self._state_path(toBlock), words)
+        self.meta["chunks"].append([fromBlock, toBlock, name])
+        self.meta["lastBlock"] = toBlock
+        self._save_meta()
+
+    # Chunks overlapping [fromBlock, toBlock], loaded one at a time and cut to that range
+    def chunks(self, fromBlock, toBlock):
+        for start, end, name in self.meta["chunks"]:
+            if end < fromBlock or start > toBlock:
+                continue
+            with np.load(os.path.join(self.path, name)) as data:
+                chunk = {key: data[key] for key in data.files}
+            for kind in ("sync", "swap"):
+                blocks = chunk[kind + "_block"]
+                lo, hi = np.searchsorted(blocks, [fromBlock, toBlock + 1])
+                for key in list(chunk):
+                    if key.startswith(kind):
+                        chunk[key] = chunk[key][lo:hi]
+            yield chunk
+
+    # Reserve words of every pool at the end of `block`: the reserves at the end of the last chunk before it (or the
+    # base reserves) with the last Sync of each pool applied
+    def state_at(self, block):
+        start, path = self.baseBlock, os.path.join(self.path, "base.npy")
+        for _, end, _ in self.meta["chunks"]:
+            if end <= block and os.path.exists(self._state_path(end)):
+                start, path = end, self._state_path(end)
+        words = np.load(path)
+        for chunk in self.chunks(start + 1, block):
+            apply_last_syncs(words, chunk["sync_pool"], chunk["sync_words"])
+        return words
+
+
+# Extend the archive up to toBlock, chunkBlocks blocks at a time, with the adaptive log fetcher (see log_fetcher.py).
+# The logs are queried by topic only, like ReserveStore.update(), and those of other pools are dropped as each window
+# arrives. Returns the number of blocks archived.
+async def archiveLogs(archive, providers, toBlock, chunkBlocks=100000, windows=None, concurrency=8):
+    if windows is None:
+        windows = {"sync": AdaptiveWindow(size=1000), "swap": AdaptiveWindow(size=1000)}
+    fromBlock = archive.lastBlock + 1
+    for start in range(fromBlock, toBlock + 1, chunkBlocks):
+        end = min(toBlock, start + chunkBlocks - 1)
+        syncLogs = await getLogsAdaptive(
+            providers, None, [SYNC_TOPIC], start, end, windows["sync"], concurrency, keep=archive.keeps
+        )
+        swapLogs = await getLogsAdaptive(
+            providers, None, [SWAP_TOPIC], start, end, windows["swap"], concurrency, keep=archive.keeps
+        )
+        archive.add_chunk(start, end, syncLogs, swapLogs)
+    return max(0, toBlock - fromBlock + 1)
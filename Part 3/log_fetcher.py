@@ -0,0 +1,168 @@
+# Adaptive, concurrent fetcher of event logs over large block ranges.
+# Instead of halving the range after each rejected query and running sequentially (getEventsRecursive), the fetcher
+# keeps a window size per contract that grows while queries return few results and shrinks when a provider rejects
+# a query. Many windows are in flight at the same time, spread over the async providers.
+import asyncio
+
+from eth_utils import to_checksum_address
+
+from metrics import metrics
+from reserve_store import to_int
+
+# keccak256("PairCreated(address,address,address,uint256)")
+PAIR_CREATED_TOPIC = "0x0d3648bd0f6ba80134a33ba9275ac585d9d315f0ad8355cddefde31afa28d0e9"
+
+
+class AdaptiveWindow:
+    # Block window size, learned from the number of results returned by each query.
+    # target is the number of logs we aim for per query, well below the 10k limit of Infura.
+    def __init__(self, size=10000, minSize=1, maxSize=1000000, target=5000):
+        self.size = size
+        self.minSize = minSize
+        self.maxSize = maxSize
+        self.target = target
+
+    # Successful query of `blocks` blocks that returned `count` logs
+    def success(self, blocks, count):
+        if count == 0:
+            self.size = min(self.maxSize, self.size * 2)
+        else:
+            # Scale the window towards the target density, without jumping more than 2x at once
+            wanted = blocks * self.target // count
+            self.size = max(self.minSize, min(self.maxSize, self.size * 2, max(self.size // 2, wanted)))
+
+    # Query rejected for matching too many logs
+    def failure(self, blocks):
+        self.size = max(self.minSize, min(self.size, blocks) // 2)
+
+
+# Provider errors meaning that a query matches too many logs (Infura, Alchemy, QuickNode, geth...). The range of such a
+# query is split; any other error (timeout, HTTP 5xx, provider down) is retried as is on another provider.
+TOO_MANY_RESULTS = ("more than", "too many", "response size", "range too large", "range is too large", "block range")
+
+
+def is_too_many_results(error):
+    if error.args and isinstance(error.args[0], dict) and error.args[0].get("code") == -32005:
+        return True
+    message = str(error).lower()
+    return any(pattern in message for pattern in TOO_MANY_RESULTS)
+
+
+# Fetch the logs of `address` (any contract if None) matching `topics` between fromBlock and toBlock (included).
+# Up to `concurrency` queries are in flight at once, assigned to the providers in turn.
+# A range is retried at most maxRetries times after other errors, each time on the next provider.
+# With keep set, only the logs for which keep(log) is true are kept as they arrive, e.g. the logs of a set of pools
+# too large for the address filter of the query.
+# The logs are returned in block order.
+async def getLogsAdaptive(
+    providers, address, topics, fromBlock, toBlock, window=None, concurrency=8, maxRetries=5, keep=None
+):
+    if window is None:
+        window = AdaptiveWindow()
+    if fromBlock > toBlock:
+        return []
+
+    results = {}  # start block of a range -> logs of that range
+    retry = []  # (from, to, attempts, provider index) of the ranges to fetch again, before new ranges
+    cursor = fromBlock
+    requestCount = 0
+
+    def nextRange():
+        nonlocal cursor
+        if retry:
+            return retry.pop()
+        if cursor > toBlock:
+            return None
+        _from = cursor
+        _to = min(toBlock, cursor + window.size - 1)
+        cursor = _to + 1
+        return _from, _to, 0, None
+
+    async def worker():
+        nonlocal requestCount
+        while True:
+            blockRange = nextRange()
+            if blockRange is None:
+                return
+            _from, _to, attempts, providerIndex = blockRange
+            if providerIndex is None:
+                providerIndex = requestCount % len(providers)
+                requestCount += 1
+            try:
+                logFilter = {"topics": topics, "fromBlock": _from, "toBlock": _to}
+                if address is not None:
+                    logFilter["address"] = address
+                # Timed per provider, labelled by its index so that API keys in URLs are not exported
+                with metrics.timer("rpc_seconds", provider=providerIndex, method="eth_getLogs"):
+                    logs = await providers[providerIndex].eth.get_logs(logFilter)
+            except Exception as e:
+                metrics.inc("rpc_errors_total", provider=providerIndex, method="eth_getLogs")
+                nextProvider = (providerIndex + 1) % len(providers)
+                if is_too_many_results(e) and _from < _to:
+                    window.failure(_to - _from + 1)
+                    midBlock = (_from + _to) // 2
+                    retry.append((midBlock + 1, _to, 0, None))
+                    retry.append((_from, midBlock, 0, None))
+                    continue
+                # Other errors, or a single block that cannot be split: try the same range on the next provider
+                if attempts >= maxRetries:
+                    raise
+                retry.append((_from, _to, attempts + 1, nextProvider))
+                continue
+            window.success(_to - _from + 1, len(logs))
+            results[_from] = logs if keep is None else [log for log in logs if keep(log)]
+
+    await asyncio.gather(*[worker() for _ in range(concurrency)])
+
+    # Re-assemble the ranges in block order
+    return [log for start in sorted(results) for log in results[start]]
+
+
+# Convert a raw PairCreated log to the event format used by getPairEvents() / PairIndex.add_events()
+def decode_pair_created(log):
+    topics = log["topics"]
+    data = log["data"]
+    data = data.hex() if isinstance(data, (bytes, bytearray)) else data
+    data = data[2:] if data.startswith("0x") else data
+
+    def topicAddress(topic):
+        topic = topic.hex() if isinstance(topic, (bytes, bytearray)) else topic
+        return to_checksum_address("0x" + topic[-40:])
+
+    return {
+        "args": {
+            "token0": topicAddress(topics[1]),
+            "token1": topicAddress(topics[2]),
+            "pair": to_checksum_address("0x" + data[24:64]),
+        },
+        "blockNumber": to_int(log["blockNumber"]),
+        "logIndex": to_int(log["logIndex"]),
+    }
+
+
+# Fetch the PairCreated events of every factory at the same time.
+# fromBlocks maps a factory name to its first block to scan (e.g. PairIndex.last_block() + 1).
+# windows keeps one AdaptiveWindow per factory; pass the same dict again to reuse the learned sizes.
+# Returns a dict factory name -> list of events in block order.
+async def getPairEventsAll(providers, factories, fromBlocks, toBlock, windows=None, concurrency=8):
+    if windows is None:
+        windows = {}
+    names = list(factories.keys())
+    for name in names:
+        windows.setdefault(name, AdaptiveWindow())
+
+    logLists = await asyncio.gather(
+        *[
+            getLogsAdaptive(
+                providers,
+                factories[name]["factory"],
+                [PAIR_CREATED_TOPIC],
+                fromBlocks.get(name, 0),
+                toBlock,
+                windows[name],
+                concurrency,
+            )
+            for name in names
+        ]
+    )
+    return {name: [decode_pair_created(log) for log in logs] for name, logs in zip(names, logLists)}
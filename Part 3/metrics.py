@@ -0,0 +1,153 @@
+# Lightweight instrumentation: latency histograms per stage, per-provider RPC timers and counters.
+# Everything goes through the module-level `metrics` object. It is disabled by default: timer() then returns a shared
+# no-op context manager and observe()/inc() return immediately, so the instrumented code pays one attribute test.
+# Call metrics.enable() to start recording, and export with prometheus() (text exposition format) or to_json().
+import bisect
+import json
+import math
+import time
+
+# Upper bounds of the histogram buckets, in seconds
+BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, math.inf)
+
+PREFIX = "mevbot_"
+
+
+class Histogram:
+    __slots__ = ("counts", "sum", "count")
+
+    def __init__(self):
+        self.counts = [0] * len(BUCKETS)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(BUCKETS, value)] += 1
+        self.sum += value
+        self.count += 1
+
+
+class _NullTimer:
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+_NULL_TIMER = _NullTimer()
+
+
+class _Timer:
+    __slots__ = ("metrics", "name", "labels", "t0")
+
+    def __init__(self, metrics, name, labels):
+        self.metrics = metrics
+        self.name = name
+        self.labels = labels
+
+    def __enter__(self):
+        self.t0 = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.metrics._observe(self.name, self.labels, time.perf_counter() - self.t0)
+        return False
+
+
+def _labels(labels):
+    return tuple(sorted((key, str(value)) for key, value in labels.items()))
+
+
+def _format_labels(labels, extra=()):
+    pairs = list(labels) + list(extra)
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{key}="{value}"' for key, value in pairs) + "}"
+
+
+class Metrics:
+    def __init__(self, enabled=False):
+        self.enabled = enabled
+        self.histograms = {} # (name, labels) -> Histogram
+        self.counters = {} # (name, labels) -> value
+
+    def enable(self, enabled=True):
+        self.enabled = enabled
+
+    def reset(self):
+        self.histograms = {}
+        self.counters = {}
+
+    def _observe(self, name, labels, value):
+        key = (name, _labels(labels))
+        histogram = self.histograms.get(key)
+        if histogram is None:
+            histogram = self.histograms[key] = Histogram()
+        histogram.observe(value)
+
+    # Record a duration in seconds in the histogram `name`
+    def observe(self, name, value, **labels):
+        if self.enabled:
+            self._observe(name, labels, value)
+
+    def inc(self, name, value=1, **labels):
+        if self.enabled:
+            key = (name, _labels(labels))
+            self.counters[key] = self.counters.get(key, 0) + value
+
+    # Context manager timing its block into the histogram `name`, e.g. with metrics.timer("stage_seconds", stage="scan")
+    def timer(self, name, **labels):
+        if not self.enabled:
+            return _NULL_TIMER
+        return _Timer(self, name, labels)
+
+    # Prometheus text exposition format
+    def prometheus(self):
+        lines = []
+        for name in sorted({name for name, _ in self.histograms}):
+            lines.append(f"# TYPE {PREFIX}{name} histogram")
+            for (histogramName, labels), histogram in sorted(self.histograms.items()):
+                if histogramName != name:
+                    continue
+                cumulative = 0
+                for bound, count in zip(BUCKETS, histogram.counts):
+                    cumulative += count
+                    le = "+Inf" if bound == math.inf else repr(bound)
+                    lines.append(f"{PREFIX}{name}_bucket{_format_labels(labels, [('le', le)])} {cumulative}")
+                lines.append(f"{PREFIX}{name}_sum{_format_labels(labels)} {histogram.sum}")
+                lines.append(f"{PREFIX}{name}_count{_format_labels(labels)} {histogram.count}")
+        for name in sorted({name for name, _ in self.counters}):
+            lines.append(f"# TYPE {PREFIX}{name} counter")
+            for (counterName, labels), value in sorted(self.counters.items()):
+                if counterName == name:
+                    lines.append(f"{PREFIX}{name}{_format_labels(labels)} {value}")
+        return "\n".join(lines) + "\n"
+
+    # Summary as a JSON-serializable dict: count, sum, mean and bucket counts of each histogram, and the counters
+    def to_json(self):
+        histograms = []
+        for (name, labels), histogram in sorted(self.histograms.items()):
+            histograms.append(
+                {
+                    "name": name,
+                    "labels": dict(labels),
+                    "count": histogram.count,
+                    "sum": histogram.sum,
+                    "mean": histogram.sum / histogram.count if histogram.count else None,
+                    "buckets": {("+Inf" if bound == math.inf else repr(bound)): count for bound, count in zip(BUCKETS, histogram.counts)},
+                }
+            )
+        counters = [
+            {"name": name, "labels": dict(labels), "value": value} for (name, labels), value in sorted(self.counters.items())
+        ]
+        return {"histograms": histograms, "counters": counters}
+
+    def save(self, path):
+        with open(path, "w") as f:
+            json.dump(self.to_json(), f, indent=2)
+
+
+metrics = Metrics()
@@ -0,0 +1,256 @@
+# Local JSON-RPC stand-in for benchmarks.
+# Serves synthetic answers over HTTP for the calls used by the bot: getReservesByPairs / getReservesByPairsAsm through
+# eth_call, PairCreated and Sync logs through eth_getLogs, and a few chain-state methods. Latency, failure rate and
+# provider limits are configurable, so the fetch paths can be measured without an Infura quota.
+import asyncio
+import hashlib
+import json
+import random
+
+WETH = "0xC02aaA39b223FE8D0A0e5C4F27eAD9083C756Cc2"
+# Address of the synthetic factory, and of the query contract (any address works for eth_call)
+MOCK_FACTORY = "0x" + "1".zfill(40)
+MOCK_QUERY = "0x" + "2".zfill(40)
+
+# keccak256 of the event signatures, see log_fetcher.py and reserve_store.py
+PAIR_CREATED_TOPIC = "0x0d3648bd0f6ba80134a33ba9275ac585d9d315f0ad8355cddefde31afa28d0e9"
+SYNC_TOPIC = "0x1c411e9a96e071241c2f21f7726b17ae89e3cab4c78be50e062b03a9fffbbad1"
+
+
+def word(value):
+    return f"{value:064x}"
+
+
+# Addresses made of digits only are valid checksum addresses, which keeps web3 happy without computing checksums
+def pool_address(i):
+    return "0x" + str(10**12 + i).zfill(40)
+
+
+def token_address(i):
+    return "0x" + str(2 * 10**12 + i).zfill(40)
+
+
+class MockNode:
+    # poolCount pools are spread over WETH pairs with poolsPerPair pools each, created uniformly over `block` blocks.
+    # latency is added to every HTTP request (seconds), failureRate is the probability that a call returns an error.
+    # maxCallSize is the largest number of pools an eth_call can query (gas limit), logLimit the largest number of logs
+    # an eth_getLogs can return, syncsPerBlock the number of pools whose reserves change in each block.
+    def __init__(
+        self,
+        poolCount=10000,
+        poolsPerPair=4,
+        block=17000000,
+        latency=0.02,
+        failureRate=0.0,
+        maxCallSize=5000,
+        logLimit=10000,
+        syncsPerBlock=50,
+        asmSelector=None,
+        seed=0,
+    ):
+        self.poolCount = poolCount
+        self.poolsPerPair = poolsPerPair
+        self.block = block
+        self.latency = latency
+        self.failureRate = failureRate
+        self.maxCallSize = maxCallSize
+        self.logLimit = logLimit
+        self.syncsPerBlock = syncsPerBlock
+        self.asmSelector = asmSelector # 4-byte selector of getReservesByPairsAsm, as a hex string without 0x
+        self.random = random.Random(seed)
+        self.requestCount = 0
+        self.server = None
+
+        # Pools: index -> (token0, token1, creation block). WETH is token0 of every other pair.
+        self.poolIndex = {}
+        self.pools = []
+        for i in range(poolCount):
+            token = token_address(i // poolsPerPair)
+            pair = (WETH, token) if (i // poolsPerPair) % 2 == 0 else (token, WETH)
+            address = pool_address(i)
+            self.poolIndex[address.lower()] = i
+            self.pools.append((address, pair[0], pair[1], i * block // max(1, poolCount)))
+        # Version of the reserves of each pool, bumped by the Sync logs of mine()
+        self.version = [0] * poolCount
+        self.syncLogs = {} # block -> list of pool indices that emitted a Sync
+
+    # Pools in the pairDataList format of find_opps.py
+    def pairDataList(self):
+        return [
+            {"token0": token0, "token1": token1, "pair": address, "factory": "mock"}
+            for address, token0, token1, _ in self.pools
+        ]
+
+    # Deterministic reserves of a pool, changing with its version. The prices of the pools of a pair are close to
+    # each other, so that the scan finds some opportunities.
+    def reserves(self, i):
+        h = hashlib.blake2b(f"{i // self.poolsPerPair}".encode(), digest_size=8).digest()
+        price = 10 ** (int.from_bytes(h, "big") % 9000 / 1000 - 3)
+        h = hashlib.blake2b(f"{i}-{self.version[i]}".encode(), digest_size=8).digest()
+        noise = int.from_bytes(h, "big")
+        resWeth = 10**18 * (1 + noise % 100000)
+        resToken = int(resWeth * price * (0.98 + (noise >> 20) % 4000 / 100000))
+        token0 = self.pools[i][1]
+        if token0 == WETH:
+            return resWeth, resToken, 1686648623
+        return resToken, resWeth, 1686648623
+
+    # Advance the chain by `blocks` blocks, changing the reserves of syncsPerBlock random pools in each
+    def mine(self, blocks=1):
+        for _ in range(blocks):
+            self.block += 1
+            changed = self.random.sample(range(self.poolCount), min(self.syncsPerBlock, self.poolCount))
+            for i in changed:
+                self.version[i] += 1
+            self.syncLogs[self.block] = changed
+
+    def _log(self, address, topics, data, block, logIndex):
+        return {
+            "address": address,
+            "topics": topics,
+            "data": "0x" + data,
+            "blockNumber": hex(block),
+            "blockHash": "0x" + word(block),
+            "transactionHash": "0x" + word(block * 100000 + logIndex),
+            "transactionIndex": "0x0",
+            "logIndex": hex(logIndex),
+            "removed": False,
+        }
+
+    def eth_call(self, params):
+        data = params[0]["data"]
+        data = data[2:] if data.startswith("0x") else data
+        selector = data[:8]
+        count = int(data[8 + 64 : 8 + 128], 16)
+        if count > self.maxCallSize:
+            raise RpcError(-32000, "out of gas")
+        words = []
+        for k in range(count):
+            address = "0x" + data[8 + 128 + 64 * k + 24 : 8 + 128 + 64 * (k + 1)]
+            i = self.poolIndex.get(address)
+            if i is None:
+                # Like the Asm contract: a failed getReserves() call is flagged in the timestamp word
+                words += [word(0), word(0), "f" * 64]
+            else:
+                words += [word(value) for value in self.reserves(i)]
+        # bytes32[] for the Asm variant, uint256[3][] otherwise
+        length = 3 * count if selector == self.asmSelector else count
+        return "0x" + word(32) + word(length) + "".join(words)
+
+    def eth_getLogs(self, params):
+        query = params[0]
+        fromBlock = int(query.get("fromBlock", "0x0"), 16)
+        toBlock = query.get("toBlock", "latest")
+        toBlock = self.block if toBlock == "latest" else int(toBlock, 16)
+        topics = query.get("topics") or [None]
+        logs = []
+        if topics[0] == PAIR_CREATED_TOPIC:
+            for i, (address, token0, token1, block) in enumerate(self.pools):
+                if fromBlock <= block <= toBlock:
+                    logs.append(
+                        self._log(
+                            MOCK_FACTORY,
+                            [PAIR_CREATED_TOPIC, "0x" + token0[2:].lower().zfill(64), "0x" + token1[2:].lower().zfill(64)],
+                            address[2:].lower().zfill(64) + word(i + 1),
+                            block,
+                            i,
+                        )
+                    )
+        elif topics[0] == SYNC_TOPIC:
+            for block in range(fromBlock, toBlock + 1):
+                for logIndex, i in enumerate(self.syncLogs.get(block, ())):
+                    r0, r1, _ = self.reserves(i)
+                    logs.append(self._log(self.pools[i][0], [SYNC_TOPIC], word(r0) + word(r1), block, logIndex))
+        if len(logs) > self.logLimit:
+            raise RpcError(-32005, f"query returned more than {self.logLimit} results")
+        return logs
+
+    def eth_getBlockByNumber(self, params):
+        block = self.block if params[0] == "latest" else int(params[0], 16)
+        return {
+            "number": hex(block),
+            "hash": "0x" + word(block),
+            "parentHash": "0x" + word(block - 1),
+            "timestamp": hex(1686648623 + 12 * (block - 17000000)),
+            "gasLimit": hex(30000000),
+            "gasUsed": hex(15000000),
+            "baseFeePerGas": hex(20 * 10**9),
+            "transactions": [],
+        }
+
+    def dispatch(self, request):
+        self.requestCount += 1
+        method = request.get("method")
+        params = request.get("params", [])
+        try:
+            if self.failureRate and self.random.random() < self.failureRate:
+                raise RpcError(-32000, "mock failure")
+            if method == "eth_chainId":
+                result = "0x1"
+            elif method == "net_version":
+                result = "1"
+            elif method == "eth_blockNumber":
+                result = hex(self.block)
+            elif method == "eth_gasPrice":
+                result = hex(21 * 10**9)
+            elif method == "eth_maxPriorityFeePerGas":
+                result = hex(10**9)
+            elif method in ("eth_call", "eth_getLogs", "eth_getBlockByNumber"):
+                result = getattr(self, method)(params)
+            else:
+                raise RpcError(-32601, f"method {method} not supported by the mock node")
+        except RpcError as e:
+            return {"jsonrpc": "2.0", "id": request.get("id"), "error": {"code": e.code, "message": e.message}}
+        return {"jsonrpc": "2.0", "id": request.get("id"), "result": result}
+
+    # Minimal HTTP/1.1 server with keep-alive, enough for web3's AsyncHTTPProvider and JSON-RPC batches
+    async def _handle(self, reader, writer):
+        try:
+            while True:
+                requestLine = await reader.readline()
+                if not requestLine:
+                    break
+                length = 0
+                while True:
+                    line = await reader.readline()
+                    if line in (b"\r\n", b"\n", b""):
+                        break
+                    name, _, value = line.decode().partition(":")
+                    if name.strip().lower() == "content-length":
+                        length = int(value.strip())
+                body = json.loads(await reader.readexactly(length))
+                if self.latency:
+                    await asyncio.sleep(self.latency)
+                if isinstance(body, list):
+                    response = [self.dispatch(request) for request in body]
+                else:
+                    response = self.dispatch(body)
+                payload = json.dumps(response).encode()
+                writer.write(
+                    b"HTTP/1.1 200 OK\r\nContent-Type: application/json\r\nConnection: keep-alive\r\n"
+                    + f"Content-Length: {len(payload)}\r\n\r\n".encode()
+                    + payload
+                )
+                await writer.drain()
+        except (ConnectionError, asyncio.IncompleteReadError, asyncio.CancelledError):
+            # Client gone, or the handler cancelled by stop(): close the connection without a traceback
+            pass
+        finally:
+            writer.close()
+
+    # Start listening, returns the URI to give to Web3.HTTPProvider / AsyncHTTPProvider
+    async def start(self, host="127.0.0.1", port=0):
+        self.server = await asyncio.start_server(self._handle, host, port)
+        port = self.server.sockets[0].getsockname()[1]
+        return f"http://{host}:{port}"
+
+    async def stop(self):
+        self.server.close()
+        await self.server.wait_closed()
+
+
+class RpcError(Exception):
+    def __init__(self, code, message):
+        super().__init__(message)
+        self.code = code
+        self.message = message
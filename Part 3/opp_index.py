@@ -0,0 +1,175 @@
+# Incremental index of two-pool opportunities.
+# Every ordered (poolA, poolB) combination of a PairArrays is an entry keyed by (pair, poolA, poolB).
+# When reserves change, only the entries touching the changed pools are recomputed, and a max-heap of net profit
+# gives the best opportunities without re-sorting the whole list.
+# The net profit is the gross profit minus the gas cost of the combination: either a flat cost, or the gas of each
+# combination (e.g. GasModel.combo_gas()) times the gas price.
+import heapq
+
+import numpy as np
+
+from opp_scanner import FEE, evaluate_combinations
+
+
+class OpportunityIndex:
+    # gasCost is the cost of one opportunity in ETH, subtracted from the gross profit to get the net profit.
+    # gas, if given, is the gas of each combination of pair_arrays, and replaces gasCost by gas[combo] * gasPrice / 1e18.
+    # combos restricts the index to a subset of the combinations of pair_arrays (e.g. PoolTiers.combos), all of
+    # them by default.
+    def __init__(self, pair_arrays, gasCost=0.0, fee=FEE, combos=None, gas=None, gasPrice=0):
+        self.arrays = pair_arrays
+        self.fee = fee
+        self.gasCost = gasCost
+        self.gas = gas
+        self.gasPrice = gasPrice
+        self._costs()
+        self._index(np.arange(len(pair_arrays.idx_a), dtype=np.int64) if combos is None else combos)
+
+        # Current entries: (pair, poolA, poolB) -> (input, profit, combination), input and profit in ETH
+        self.entries = {}
+
+        # Max-heap of (-net_profit, key). Entries are not removed when they change: a heap item is stale when its
+        # profit no longer matches self.entries, and is dropped lazily when it reaches the top.
+        self.heap = []
+
+    # Gas cost in ETH of every combination of pair_arrays
+    def _costs(self):
+        if self.gas is None:
+            self.comboCost = np.full(len(self.arrays.idx_a), float(self.gasCost))
+        else:
+            self.comboCost = np.asarray(self.gas, dtype=np.float64) * self.gasPrice / 1e18
+
+    # For each pool, the combinations it is part of (as poolA or poolB), stored in CSR form:
+    # the combinations of pool p are poolCombos[poolOffsets[p]:poolOffsets[p+1]].
+    def _index(self, combos):
+        self.combos = np.asarray(combos, dtype=np.int64)
+        pools = np.concatenate((self.arrays.idx_a[self.combos], self.arrays.idx_b[self.combos]))
+        order = np.argsort(pools, kind="stable")
+        self.poolCombos = np.concatenate((self.combos, self.combos))[order]
+        self.poolOffsets = np.searchsorted(pools[order], np.arange(len(self.arrays.pools) + 1))
+
+    # Recompute the given combinations and push the new values on the heap
+    def _recompute(self, combos):
+        if len(combos) == 0:
+            return
+        idx_a = self.arrays.idx_a[combos]
+        idx_b = self.arrays.idx_b[combos]
+        x, profit, ok = evaluate_combinations(self.arrays.reserves, idx_a, idx_b, self.fee)
+        pairs = self.arrays.pool_pair[idx_a]
+
+        for pair, a, b, amount, gross, valid, combo, cost in zip(
+            pairs.tolist(), idx_a.tolist(), idx_b.tolist(), (x / 1e18).tolist(), (profit / 1e18).tolist(), ok.tolist(),
+            combos.tolist(), self.comboCost[combos].tolist(),
+        ):
+            key = (pair, a, b)
+            if not valid:
+                self.entries.pop(key, None)
+                continue
+            self.entries[key] = (amount, gross, combo)
+            heapq.heappush(self.heap, (cost - gross, key))
+
+        # Rebuild the heap when stale items make up most of it
+        if len(self.heap) > 2 * len(self.entries) + 1024:
+            self._rebuild_heap()
+
+    def _rebuild_heap(self):
+        cost = self.comboCost
+        self.heap = [(cost[combo] - gross, key) for key, (amount, gross, combo) in self.entries.items()]
+        heapq.heapify(self.heap)
+
+    # Evaluate every combination of the index. Call after loading the reserves for the first time.
+    def build(self):
+        self.entries = {}
+        self.heap = []
+        self._recompute(self.combos)
+
+    # Change the combinations of the index, e.g. after PoolTiers.update(). The entries of the combinations left out are
+    # dropped and only the new combinations are evaluated.
+    def set_combos(self, combos):
+        combos = np.asarray(combos, dtype=np.int64)
+        added = np.setdiff1d(combos, self.combos)
+        removed = np.setdiff1d(self.combos, combos)
+        self._index(combos)
+        idx_a = self.arrays.idx_a[removed]
+        idx_b = self.arrays.idx_b[removed]
+        for key in zip(self.arrays.pool_pair[idx_a].tolist(), idx_a.tolist(), idx_b.tolist()):
+            self.entries.pop(key, None)
+        self._recompute(added)
+
+    # Recompute only the combinations that involve one of the dirty pools (indices in pair_arrays.pools).
+    # The reserves of pair_arrays must already be updated. Returns the number of combinations recomputed.
+    def update(self, dirty):
+        if not dirty:
+            return 0
+        dirty = np.fromiter(dirty, dtype=np.int64, count=len(dirty))
+        combos = np.unique(
+            np.concatenate(
+                [self.poolCombos[self.poolOffsets[p]:self.poolOffsets[p + 1]] for p in dirty]
+            )
+        )
+        self._recompute(combos)
+        return len(combos)
+
+    # Change the gas cost of an opportunity to a flat gasCost in ETH. The net profit of every entry changes, so the heap
+    # is rebuilt.
+    def set_gas_cost(self, gasCost):
+        self.gasCost = gasCost
+        self.gas = None
+        self._costs()
+        self._rebuild_heap()
+
+    # Change the gas of each combination (e.g. after GasModel.learn()) and the gas price in Wei
+    def set_gas(self, gas, gasPrice):
+        self.gas = gas
+        self.gasPrice = gasPrice
+        self._costs()
+        self._rebuild_heap()
+
+    # Follow the gas price of the next block. Rebuilding the heap costs a pass over every entry, so it is skipped while
+    # the price stays within tolerance (relative) of the price of the heap: the net profits are then that much off.
+    def set_gas_price(self, gasPrice, tolerance=0.0):
+        if self.gas is None or abs(gasPrice - self.gasPrice) <= tolerance * self.gasPrice:
+            return False
+        self.set_gas(self.gas, gasPrice)
+        return True
+
+    # Drop stale items from the top of the heap
+    def _clean_top(self):
+        heap = self.heap
+        while heap:
+            neg_net, key = heap[0]
+            entry = self.entries.get(key)
+            if entry is not None and self.comboCost[entry[2]] - entry[1] == neg_net:
+                return
+            heapq.heappop(heap)
+
+    # Best opportunity as (key, input, profit, net_profit), or None
+    def best(self):
+        self._clean_top()
+        if not self.heap:
+            return None
+        neg_net, key = self.heap[0]
+        amount, gross, _ = self.entries[key]
+        return key, amount, gross, -neg_net
+
+    # The k best opportunities, by decreasing net profit
+    def top(self, k):
+        result = []
+        popped = []
+        seen = set()
+        while len(result) < k:
+            self._clean_top()
+            if not self.heap:
+                break
+            item = heapq.heappop(self.heap)
+            key = item[1]
+            # The same entry can be pushed twice with an unchanged profit, keep a single copy
+            if key in seen:
+                continue
+            seen.add(key)
+            popped.append(item)
+            amount, gross, _ = self.entries[key]
+            result.append((key, amount, gross, -item[0]))
+        for item in popped:
+            heapq.heappush(self.heap, item)
+        return result
@@ -0,0 +1,202 @@
+# Vectorized scanner for two-pool arbitrage opportunities.
+# The reserves of every pool in pool_dict are stored in NumPy arrays grouped by pair, so that the optimal input and
+# the profit of every ordered (poolA, poolB) combination can be computed in a single pass instead of a Python double loop.
+# On float reserves, the results are bit-identical to the scalar functions of find_opps.py (same order of operations).
+# On the integer reserves returned by getReserves(), the scalar functions multiply the reserves exactly before the first
+# rounding, so the two differ slightly. Near equilibrium the optimal input is the difference of two close terms, so
+# the difference is not small relative to the input, but it stays below 1e-15 of the magnitude of those terms (see
+# reference_tolerance() and test_opp_scanner.py).
+import numpy as np
+
+from metrics import metrics
+from pool_registry import RegistryPools
+
+# Fee of a Uniswap V2 swap
+FEE = 0.003
+
+# Largest accepted difference with the scalar functions on integer reserves, relative to the magnitude of the terms
+REFERENCE_TOLERANCE = 1e-12
+
+# Layout of one opportunity in the result array.
+# "pair" is the index of the pair in PairArrays.pairs, "poolA"/"poolB" are indices in PairArrays.pools.
+# Values are in ETH (1e18 Wei = 1 ETH), like in the opps list of find_opps.py.
+OPP_DTYPE = np.dtype(
+    [
+        ("pair", np.int32),
+        ("poolA", np.int32),
+        ("poolB", np.int32),
+        ("input", np.float64),
+        ("profit", np.float64),
+    ]
+)
+
+
+# Same closed-form helpers as in find_opps.py, written so that they work element-wise on arrays.
+# Output of a single swap
+def swap_output(x, a, b, fee=FEE):
+    return b * (1 - a / (a + x * (1 - fee)))
+
+
+# Gross profit of two successive swaps
+def trade_profit(x, a1, b1, a2, b2, fee=FEE):
+    return swap_output(swap_output(x, a1, b1, fee), b2, a2, fee) - x
+
+
+# Optimal input amount
+def optimal_trade_size(a1, b1, a2, b2, fee=FEE):
+    return (
+        np.sqrt(a1 * b1 * a2 * b2 * (1 - fee) ** 4 * (b1 * (1 - fee) + b2) ** 2)
+        - a1 * b2 * (1 - fee) * (b1 * (1 - fee) + b2)
+    ) / ((1 - fee) * (b1 * (1 - fee) + b2)) ** 2
+
+
+# Accepted differences (input, profit) in Wei with the scalar functions on integer reserves. The input is scaled by the
+# square root term of optimal_trade_size(), the profit by the largest reserve, since both are the difference of terms
+# of that magnitude.
+def reference_tolerance(a1, b1, a2, b2, fee=FEE):
+    inputScale = np.sqrt(a1 * b1 * a2 * b2) / (b1 * (1 - fee) + b2)
+    profitScale = np.maximum(np.maximum(a1, b1), np.maximum(a2, b2))
+    return REFERENCE_TOLERANCE * inputScale, REFERENCE_TOLERANCE * profitScale
+
+
+# List every ordered combination (i, j), i != j, of pools belonging to the same pair.
+# Pools of pair k occupy the slots [offsets[k], offsets[k+1]) of the pool arrays.
+def ordered_pool_pairs(sizes, offsets):
+    idx_a = []
+    idx_b = []
+    # Pairs with the same number of pools share the same combination template, so we only loop over distinct sizes.
+    for size in np.unique(sizes):
+        if size < 2:
+            continue
+        ii, jj = np.nonzero(~np.eye(size, dtype=bool))
+        starts = offsets[:-1][sizes == size]
+        idx_a.append((starts[:, None] + ii[None, :]).ravel())
+        idx_b.append((starts[:, None] + jj[None, :]).ravel())
+
+    if not idx_a:
+        return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64)
+
+    idx_a = np.concatenate(idx_a)
+    idx_b = np.concatenate(idx_b)
+
+    # Restore the order of the original nested loop (pair, then poolA, then poolB)
+    order = np.lexsort((idx_b, idx_a))
+    return idx_a[order], idx_b[order]
+
+
+class PairArrays:
+    # Flat, pair-grouped view of pool_dict.
+    # The pool order is the same as the to_fetch list of find_opps.py, so the output of getReservesParallel can be
+    # loaded directly with set_reserves().
+    def __init__(self, pool_dict, weth):
+        pairs = list(pool_dict.keys())
+        pools = [pool for pool_list in pool_dict.values() for pool in pool_list]
+        sizes = np.array([len(pool_list) for pool_list in pool_dict.values()], dtype=np.int64)
+        weth_first = np.array([pair[0] == weth for pair in pairs], dtype=bool)
+        self._setup(pairs, pools, sizes, weth_first)
+
+    # Same view built from a PoolRegistry (see pool_registry.py): the WETH pairs traded by at least minPools pools,
+    # without creating a dict per pool. self.poolIds maps the pools of this view to registry pool ids, and self.pairIds
+    # its pairs to registry pair indices.
+    @classmethod
+    def from_registry(cls, registry, weth, minPools=2):
+        pairIds, poolIds, sizes = registry.pair_groups(weth, minPools)
+        wethId = registry.token_id(weth)
+        pairs = [
+            (registry.token_address(registry.pairToken0[k]), registry.token_address(registry.pairToken1[k]))
+            for k in pairIds
+        ]
+        self = cls.__new__(cls)
+        self._setup(pairs, RegistryPools(registry, poolIds), sizes.astype(np.int64), registry.pairToken0[pairIds] == wethId)
+        self.poolIds = poolIds
+        self.pairIds = pairIds
+        return self
+
+    def _setup(self, pairs, pools, sizes, weth_first):
+        self.pairs = pairs
+        self.pools = pools
+        self.offsets = np.zeros(len(sizes) + 1, dtype=np.int64)
+        np.cumsum(sizes, out=self.offsets[1:])
+
+        # Index of the pair of each pool
+        self.pool_pair = np.repeat(np.arange(len(sizes), dtype=np.int64), sizes)
+
+        # Whether WETH is token0 of the pool. All the pools of a pair share the same (token0, token1) key.
+        self.weth_is_token0 = weth_first[self.pool_pair]
+
+        # Reserves re-ordered so that WETH is always the first column
+        self.reserves = np.zeros((len(self.pools), 2), dtype=np.float64)
+
+        # Every ordered combination of two distinct pools of the same pair
+        self.idx_a, self.idx_b = ordered_pool_pairs(sizes, self.offsets)
+
+    # Pool addresses in pool order, e.g. the list of pools to fetch with getReservesParallel()
+    def addresses(self):
+        return [pool["pair"] for pool in self.pools]
+
+    # Load reserves in [reserve0, reserve1, blockTimestampLast] format, in pool order.
+    def set_reserves(self, reserveList):
+        self.set_raw_reserves(np.array([r[:2] for r in reserveList], dtype=np.float64).reshape(-1, 2))
+
+    # Load reserves from a (n, 2) array of [reserve0, reserve1], in pool order (e.g. from reserves_decoder.py).
+    def set_raw_reserves(self, raw, start=0):
+        end = start + len(raw)
+        weth_first = self.weth_is_token0[start:end]
+        self.reserves[start:end, 0] = np.where(weth_first, raw[:, 0], raw[:, 1])
+        self.reserves[start:end, 1] = np.where(weth_first, raw[:, 1], raw[:, 0])
+
+    # Load raw [reserve0, reserve1] rows for the pools at the given indices only, e.g. the pools changed in a block
+    def set_raw_reserves_at(self, indices, raw):
+        weth_first = self.weth_is_token0[indices]
+        self.reserves[indices, 0] = np.where(weth_first, raw[:, 0], raw[:, 1])
+        self.reserves[indices, 1] = np.where(weth_first, raw[:, 1], raw[:, 0])
+
+    # Load the reserves of the pools [start, start + len(reserveList)) only, e.g. one chunk of getReservesParallel()
+    def set_reserves_slice(self, start, reserveList):
+        self.set_raw_reserves(np.array([r[:2] for r in reserveList], dtype=np.float64).reshape(-1, 2), start)
+
+
+# Evaluate the ordered pool combinations (idx_a[k], idx_b[k]) on WETH-first reserves.
+# Returns (x, profit, ok) arrays in Wei: ok is False where a reserve is 0 or the optimal input is negative
+# (x and profit are then meaningless).
+def evaluate_combinations(reserves, idx_a, idx_b, fee=FEE):
+    a1 = reserves[idx_a, 0]
+    b1 = reserves[idx_a, 1]
+    a2 = reserves[idx_b, 0]
+    b2 = reserves[idx_b, 1]
+
+    # Skip combinations where one of the reserves is 0 (division by 0)
+    ok = (a1 > 0) & (b1 > 0) & (a2 > 0) & (b2 > 0)
+
+    # Compute value of optimal input through the formula
+    with np.errstate(divide="ignore", invalid="ignore"):
+        x = optimal_trade_size(a1, b1, a2, b2, fee)
+
+        # Compute gross profit in Wei (before gas cost)
+        profit = trade_profit(x, a1, b1, a2, b2, fee)
+
+    # Skip if optimal input is negative (the order of the pools is reversed)
+    ok &= x >= 0
+    return x, profit, ok
+
+
+# Compute the optimal input and the gross profit of every ordered pool combination, or only of the combinations
+# given by index (e.g. PoolTiers.combos, see pool_tiers.py).
+# Returns an array of OPP_DTYPE holding only the combinations with non-negative optimal input.
+def scan_opportunities(arrays, fee=FEE, combos=None):
+    idx_a = arrays.idx_a if combos is None else arrays.idx_a[combos]
+    idx_b = arrays.idx_b if combos is None else arrays.idx_b[combos]
+    with metrics.timer("stage_seconds", stage="scan"):
+        x, profit, ok = evaluate_combinations(arrays.reserves, idx_a, idx_b, fee)
+    idx_a = idx_a[ok]
+    idx_b = idx_b[ok]
+
+    result = np.empty(len(idx_a), dtype=OPP_DTYPE)
+    result["pair"] = arrays.pool_pair[idx_a]
+    result["poolA"] = idx_a
+    result["poolB"] = idx_b
+    result["input"] = x[ok] / 1e18
+    result["profit"] = profit[ok] / 1e18
+    metrics.inc("pools_scanned_total", len(arrays.reserves))
+    metrics.inc("opportunities_found_total", len(result))
+    return result
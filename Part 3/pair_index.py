@@ -0,0 +1,99 @@
+# Persistent index of the PairCreated events of the factories, stored in a SQLite file.
+# The last scanned block is recorded per factory, so that a restart only fetches the blocks mined since the last run,
+# and loading the pool list is a single local query instead of a full scan of the chain.
+import sqlite3
+
+
+class PairIndex:
+    def __init__(self, path="pairs.sqlite"):
+        self.db = sqlite3.connect(path)
+        self.db.executescript(
+            """
+            CREATE TABLE IF NOT EXISTS pairs (
+                pair TEXT PRIMARY KEY,
+                token0 TEXT NOT NULL,
+                token1 TEXT NOT NULL,
+                factory TEXT NOT NULL,
+                block INTEGER NOT NULL,
+                logIndex INTEGER NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS pairsByFactory ON pairs (factory, block, logIndex);
+            CREATE TABLE IF NOT EXISTS scans (
+                factory TEXT PRIMARY KEY,
+                lastBlock INTEGER NOT NULL
+            );
+            """
+        )
+
+    def close(self):
+        self.db.close()
+
+    # Last block scanned for this factory, or -1 if it was never scanned
+    def last_block(self, factoryName):
+        row = self.db.execute("SELECT lastBlock FROM scans WHERE factory = ?", (factoryName,)).fetchone()
+        return -1 if row is None else row[0]
+
+    # Store the PairCreated events found between the last scanned block and toBlock (included).
+    # The events and the new last block are written in the same transaction, so an interrupted run never leaves a gap.
+    def add_events(self, factoryName, events, toBlock):
+        rows = [
+            (
+                e["args"]["pair"],
+                e["args"]["token0"],
+                e["args"]["token1"],
+                factoryName,
+                e["blockNumber"],
+                e["logIndex"],
+            )
+            for e in events
+        ]
+        with self.db:
+            self.db.executemany("INSERT OR REPLACE INTO pairs VALUES (?, ?, ?, ?, ?, ?)", rows)
+            self.db.execute("INSERT OR REPLACE INTO scans VALUES (?, ?)", (factoryName, toBlock))
+
+    # Fetch the new events of every factory up to toBlock and store them.
+    # getEvents(contract, fromBlock, toBlock) is the event fetcher to use, e.g. getPairEvents() of find_opps.py.
+    def update(self, w3, factories, factory_abi, getEvents, toBlock):
+        newCount = 0
+        for factoryName, factoryData in factories.items():
+            fromBlock = self.last_block(factoryName) + 1
+            if fromBlock > toBlock:
+                continue
+            contract = w3.eth.contract(address=factoryData["factory"], abi=factory_abi)
+            events = getEvents(contract, fromBlock, toBlock)
+            self.add_events(factoryName, events, toBlock)
+            newCount += len(events)
+        return newCount
+
+    # Indexed pools in the pairDataList format of find_opps.py, grouped by factory in the order of factoryNames
+    # (all factories if None) and in creation order within a factory.
+    def load(self, factoryNames=None):
+        if factoryNames is None:
+            factoryNames = [row[0] for row in self.db.execute("SELECT DISTINCT factory FROM pairs")]
+        pairDataList = []
+        for factoryName in factoryNames:
+            rows = self.db.execute(
+                "SELECT token0, token1, pair FROM pairs WHERE factory = ? ORDER BY block, logIndex",
+                (factoryName,),
+            )
+            pairDataList.extend(
+                {"token0": token0, "token1": token1, "pair": pair, "factory": factoryName}
+                for token0, token1, pair in rows
+            )
+        return pairDataList
+
+    # Number of indexed pools of the given factories (all factories if None), without loading them
+    def count(self, factoryNames=None):
+        if factoryNames is None:
+            return self.db.execute("SELECT COUNT(*) FROM pairs").fetchone()[0]
+        factoryNames = list(factoryNames)
+        placeholders = ", ".join("?" * len(factoryNames))
+        return self.db.execute(f"SELECT COUNT(*) FROM pairs WHERE factory IN ({placeholders})", factoryNames).fetchone()[0]
+
+    # Number of indexed pools of a factory and block of its newest one (-1 if none). It changes only when pools are
+    # added, unlike last_block(), so it tells whether a registry built from the index is still up to date.
+    def last_pool(self, factoryName):
+        count, block = self.db.execute(
+            "SELECT COUNT(*), COALESCE(MAX(block), -1) FROM pairs WHERE factory = ?", (factoryName,)
+        ).fetchone()
+        return [count, block]
@@ -0,0 +1,151 @@
+# Multi-process opportunity evaluation, sharded by pair.
+# Long-lived worker processes each own a contiguous range of pairs of a PairArrays (see opp_scanner.py). The reserves
+# live in a multiprocessing.shared_memory block, next to the gas cost of each pool: the main process writes the latest
+# reserves once per block and every worker reads them in place, without pickling. Each worker only sends back its local top candidates for the merge.
+# The workers are started with fork where available, so that a script without a __main__ guard is not re-run.
+import multiprocessing
+from multiprocessing import shared_memory
+
+import numpy as np
+
+from opp_scanner import FEE, OPP_DTYPE, evaluate_combinations
+
+# Opportunities returned by the scanner: OPP_DTYPE plus the net profit in ETH
+TOP_DTYPE = np.dtype(OPP_DTYPE.descr + [("net_profit", np.float64)])
+
+
+# Local top-k of a shard, as an array of TOP_DTYPE sorted by decreasing net profit.
+# The net profit is the profit minus gasCost and, if given, the cost in ETH of a swap through each of the two pools.
+def shard_top(reserves, idx_a, idx_b, pool_pair, gasCost, k, fee=FEE, poolCost=None):
+    x, profit, ok = evaluate_combinations(reserves, idx_a, idx_b, fee)
+    if poolCost is not None:
+        gasCost = gasCost + poolCost[idx_a] + poolCost[idx_b]
+    net_profit = np.where(ok, profit / 1e18 - gasCost, -np.inf)
+    k = min(k, int(np.count_nonzero(ok)))
+    if k == 0:
+        return np.empty(0, dtype=TOP_DTYPE)
+    best = np.argpartition(-net_profit, k - 1)[:k]
+    best = best[np.argsort(-net_profit[best])]
+    result = np.empty(k, dtype=TOP_DTYPE)
+    result["pair"] = pool_pair[idx_a[best]]
+    result["poolA"] = idx_a[best]
+    result["poolB"] = idx_b[best]
+    result["input"] = x[best] / 1e18
+    result["profit"] = profit[best] / 1e18
+    result["net_profit"] = net_profit[best]
+    return result
+
+
+# Worker loop. Messages: ("scan", gasCost, k) answered with the local top-k, ("shard", idx_a, idx_b) replacing the
+# combinations of the worker, and None to stop.
+def _worker(conn, shmName, poolCount, idx_a, idx_b, pool_pair, fee):
+    shm = shared_memory.SharedMemory(name=shmName)
+    reserves = np.ndarray((poolCount, 2), dtype=np.float64, buffer=shm.buf)
+    poolCost = np.ndarray(poolCount, dtype=np.float64, buffer=shm.buf, offset=reserves.nbytes)
+    try:
+        while True:
+            message = conn.recv()
+            if message is None:
+                break
+            if message[0] == "shard":
+                _, idx_a, idx_b = message
+                continue
+            _, gasCost, k = message
+            conn.send(shard_top(reserves, idx_a, idx_b, pool_pair, gasCost, k, fee, poolCost))
+    finally:
+        del reserves, poolCost
+        shm.close()
+
+
+class ParallelScanner:
+    # combos restricts the scan to a subset of the combinations of pair_arrays (e.g. PoolTiers.combos), all of them by
+    # default. It must be sorted, like the combinations.
+    # The workers live until close(): write the new reserves with update_reserves() and call scan() on every block.
+    def __init__(self, pair_arrays, workers=None, fee=FEE, combos=None):
+        workers = workers or multiprocessing.cpu_count()
+        self.arrays = pair_arrays
+        poolCount = len(pair_arrays.reserves)
+
+        # Shared reserve buffer, with the same layout as pair_arrays.reserves (WETH first), followed by the gas cost in
+        # ETH of a swap through each pool (zero until set_pool_cost())
+        self.shm = shared_memory.SharedMemory(create=True, size=max(1, poolCount * 3 * 8))
+        self.reserves = np.ndarray((poolCount, 2), dtype=np.float64, buffer=self.shm.buf)
+        self.reserves[:] = pair_arrays.reserves
+        self.poolCost = np.ndarray(poolCount, dtype=np.float64, buffer=self.shm.buf, offset=self.reserves.nbytes)
+        self.poolCost[:] = 0
+
+        context = multiprocessing.get_context("fork" if "fork" in multiprocessing.get_all_start_methods() else None)
+        self.connections = []
+        self.processes = []
+        for idx_a, idx_b in self._shards(combos, workers):
+            parentConn, childConn = context.Pipe()
+            process = context.Process(
+                target=_worker,
+                args=(childConn, self.shm.name, poolCount, idx_a, idx_b, pair_arrays.pool_pair, fee),
+                daemon=True,
+            )
+            process.start()
+            childConn.close()
+            self.connections.append(parentConn)
+            self.processes.append(process)
+
+    # Split the pairs in `count` contiguous shards with about the same number of combinations each (some may be empty).
+    # Combinations are sorted by pair, so a shard is a slice of idx_a / idx_b that never cuts a pair.
+    def _shards(self, combos, count):
+        arrays = self.arrays
+        if combos is None:
+            idx_a, idx_b = arrays.idx_a, arrays.idx_b
+        else:
+            idx_a, idx_b = arrays.idx_a[combos], arrays.idx_b[combos]
+        comboPairs = arrays.pool_pair[idx_a]
+        pairCount = len(arrays.offsets) - 1
+        comboOffsets = np.searchsorted(comboPairs, np.arange(pairCount + 1))
+        targets = np.linspace(0, len(comboPairs), count + 1)
+        bounds = comboOffsets[np.searchsorted(comboOffsets, targets)]
+        bounds[0], bounds[-1] = 0, len(comboPairs)
+        return [(idx_a[start:end].copy(), idx_b[start:end].copy()) for start, end in zip(bounds[:-1], bounds[1:])]
+
+    # Scan other combinations from now on (e.g. after PoolTiers.update()): the shards are recomputed and sent to the
+    # running workers.
+    def set_combos(self, combos):
+        for conn, (idx_a, idx_b) in zip(self.connections, self._shards(combos, len(self.connections))):
+            conn.send(("shard", idx_a, idx_b))
+
+    # Copy the latest reserves of pair_arrays into the shared buffer (or only the given pool indices)
+    def update_reserves(self, dirty=None):
+        if dirty is None:
+            self.reserves[:] = self.arrays.reserves
+        else:
+            dirty = np.fromiter(dirty, dtype=np.int64, count=len(dirty))
+            self.reserves[dirty] = self.arrays.reserves[dirty]
+
+    # Gas cost in ETH of a swap through each pool, e.g. GasModel.pool_gas() times the gas price / 1e18. The cost of an
+    # opportunity is then the cost of its two pools plus the gasCost given to scan().
+    def set_pool_cost(self, poolCost):
+        self.poolCost[:] = poolCost
+
+    # Evaluate every combination on the workers and merge their local top-k.
+    # Returns an array of TOP_DTYPE sorted by decreasing net profit.
+    def scan(self, gasCost=0.0, k=20):
+        for conn in self.connections:
+            conn.send(("scan", gasCost, k))
+        results = [conn.recv() for conn in self.connections]
+        merged = np.concatenate(results) if results else np.empty(0, dtype=TOP_DTYPE)
+        merged = merged[np.argsort(-merged["net_profit"], kind="stable")]
+        return merged[:k]
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    # Stop the workers and free the shared memory
+    def close(self):
+        for conn in self.connections:
+            conn.send(None)
+        for process in self.processes:
+            process.join()
+        del self.reserves, self.poolCost
+        self.shm.close()
+        self.shm.unlink()
@@ -0,0 +1,191 @@
+# Compact, array-backed registry of every pool.
+# Tokens and factories are interned to integer ids, pools are stored in parallel NumPy arrays with their addresses as
+# raw 20-byte values, and pair -> pools / token -> pools indexes are kept in CSR form. Compared to one dict of
+# checksum strings per pool, this divides the memory by an order of magnitude and turns comparisons such as
+# poolA["pair"] == poolB["pair"] or token0 == WETH into integer comparisons.
+# The registry can be saved to a directory of .npy files and memory-mapped back in a few milliseconds.
+import json
+import os
+
+import numpy as np
+from eth_utils import to_checksum_address
+
+
+def address_bytes(address):
+    return bytes.fromhex(address[2:] if address.startswith("0x") else address)
+
+
+def address_string(raw):
+    return to_checksum_address("0x" + bytes(raw).hex())
+
+
+# Build a CSR index: the values of key k are values[order][offsets[k]:offsets[k+1]]
+def csr_index(keys, values, keyCount):
+    order = np.argsort(keys, kind="stable")
+    offsets = np.searchsorted(keys[order], np.arange(keyCount + 1))
+    return values[order], offsets
+
+
+# Derived indexes, saved with the registry so that load() does not sort the pools again
+INDEX_ARRAYS = ("tokenPools", "tokenOffsets", "pairKeys", "pairPools", "pairOffsets")
+
+
+class PoolRegistry:
+    # addresses and tokens are (n, 20) uint8 arrays, token0/token1 index tokens, factory indexes factories (names).
+    # indexes are the INDEX_ARRAYS of a saved registry, computed from the pools when None.
+    def __init__(self, addresses, token0, token1, factory, tokens, factories, indexes=None):
+        self.addresses = addresses
+        self.token0 = token0
+        self.token1 = token1
+        self.factory = factory
+        self.tokens = tokens
+        self.factories = list(factories)
+        self._tokenIds = None
+
+        if indexes is not None:
+            self.tokenPools, self.tokenOffsets, self.pairKeys, self.pairPools, self.pairOffsets = indexes
+        else:
+            # Token -> pools
+            poolIds = np.arange(len(token0), dtype=np.int32)
+            self.tokenPools, self.tokenOffsets = csr_index(
+                np.concatenate((token0, token1)), np.concatenate((poolIds, poolIds)), len(tokens)
+            )
+
+            # Pair -> pools. A pair is identified by its (token0, token1) ids, packed in a single int64 key.
+            keys = token0.astype(np.int64) * len(tokens) + token1
+            order = np.argsort(keys, kind="stable")
+            self.pairKeys, firstIndex = np.unique(keys[order], return_index=True)
+            self.pairPools = poolIds[order]
+            self.pairOffsets = np.append(firstIndex, len(keys))
+        self.pairToken0 = (self.pairKeys // max(1, len(tokens))).astype(np.int32)
+        self.pairToken1 = (self.pairKeys % max(1, len(tokens))).astype(np.int32)
+
+    # Build the registry from the pairDataList of find_opps.py
+    @classmethod
+    def build(cls, pairDataList):
+        tokenIds = {}
+        factoryIds = {}
+        addresses = np.empty((len(pairDataList), 20), dtype=np.uint8)
+        token0 = np.empty(len(pairDataList), dtype=np.int32)
+        token1 = np.empty(len(pairDataList), dtype=np.int32)
+        factory = np.empty(len(pairDataList), dtype=np.int16)
+        for i, pool in enumerate(pairDataList):
+            addresses[i] = np.frombuffer(address_bytes(pool["pair"]), dtype=np.uint8)
+            token0[i] = tokenIds.setdefault(pool["token0"], len(tokenIds))
+            token1[i] = tokenIds.setdefault(pool["token1"], len(tokenIds))
+            factory[i] = factoryIds.setdefault(pool["factory"], len(factoryIds))
+        tokens = np.empty((len(tokenIds), 20), dtype=np.uint8)
+        for token, tokenId in tokenIds.items():
+            tokens[tokenId] = np.frombuffer(address_bytes(token), dtype=np.uint8)
+        return cls(addresses, token0, token1, factory, tokens, factoryIds.keys())
+
+    def __len__(self):
+        return len(self.token0)
+
+    # Id of a token address, or None if no pool trades it
+    def token_id(self, address):
+        if self._tokenIds is None:
+            self._tokenIds = {self.tokens[i].tobytes(): i for i in range(len(self.tokens))}
+        return self._tokenIds.get(address_bytes(address))
+
+    def token_address(self, tokenId):
+        return address_string(self.tokens[tokenId])
+
+    def pool_address(self, poolId):
+        return address_string(self.addresses[poolId])
+
+    # Pool in the pairDataList format, built on demand
+    def pool(self, poolId):
+        return {
+            "token0": self.token_address(self.token0[poolId]),
+            "token1": self.token_address(self.token1[poolId]),
+            "pair": self.pool_address(poolId),
+            "factory": self.factories[self.factory[poolId]],
+        }
+
+    def pools_of_token(self, tokenId):
+        return self.tokenPools[self.tokenOffsets[tokenId]:self.tokenOffsets[tokenId + 1]]
+
+    # Pools trading token0/token1 (ids, in the pool's own token order)
+    def pools_of_pair(self, token0, token1):
+        # Same int64 key as pairKeys: with registry ids (int32), the product overflows past about 46k tokens
+        key = np.int64(token0) * len(self.tokens) + np.int64(token1)
+        k = np.searchsorted(self.pairKeys, key)
+        if k == len(self.pairKeys) or self.pairKeys[k] != key:
+            return self.pairPools[:0]
+        return self.pairPools[self.pairOffsets[k]:self.pairOffsets[k + 1]]
+
+    # Pairs containing `token` that are traded by at least minPools pools.
+    # Returns (pairs, poolIds, sizes): the pair indices, their pools grouped by pair, and the number of pools per pair.
+    def pair_groups(self, token, minPools=2):
+        tokenId = self.token_id(token)
+        sizes = np.diff(self.pairOffsets)
+        if tokenId is None:
+            return np.zeros(0, dtype=np.int64), self.pairPools[:0], sizes[:0]
+        pairs = np.nonzero(
+            ((self.pairToken0 == tokenId) | (self.pairToken1 == tokenId)) & (sizes >= minPools)
+        )[0]
+        sizes = sizes[pairs]
+        # Concatenate the pool slices of the selected pairs without a Python loop
+        starts = np.repeat(self.pairOffsets[pairs] - np.cumsum(sizes) + sizes, sizes)
+        poolIds = self.pairPools[starts + np.arange(sizes.sum())]
+        return pairs, poolIds, sizes
+
+    # source is any JSON value describing what the registry was built from (see saved_source()). It is written last,
+    # so that an interrupted save never looks up to date.
+    def save(self, path, source=None):
+        os.makedirs(path, exist_ok=True)
+        sourcePath = os.path.join(path, "source.json")
+        if os.path.exists(sourcePath):
+            os.remove(sourcePath)
+        for name in ("addresses", "token0", "token1", "factory", "tokens") + INDEX_ARRAYS:
+            np.save(os.path.join(path, name + ".npy"), getattr(self, name))
+        with open(os.path.join(path, "factories.json"), "w") as f:
+            json.dump(self.factories, f)
+        if source is not None:
+            with open(sourcePath, "w") as f:
+                json.dump(source, f)
+
+    # Load a registry saved with save(). With mmap, the arrays are memory-mapped instead of read.
+    # The indexes are read back too, or rebuilt for a registry saved without them.
+    @classmethod
+    def load(cls, path, mmap=True):
+        mode = "r" if mmap else None
+        arrays = [np.load(os.path.join(path, name + ".npy"), mmap_mode=mode)
+                  for name in ("addresses", "token0", "token1", "factory", "tokens")]
+        with open(os.path.join(path, "factories.json"), "r") as f:
+            factories = json.load(f)
+        indexes = None
+        if all(os.path.exists(os.path.join(path, name + ".npy")) for name in INDEX_ARRAYS):
+            indexes = [np.load(os.path.join(path, name + ".npy"), mmap_mode=mode) for name in INDEX_ARRAYS]
+        return cls(*arrays, factories, indexes)
+
+    # Source passed to save() for the registry saved at path, or None if there is none. Used at startup to tell whether
+    # the saved registry is still up to date and can be loaded instead of built again.
+    @staticmethod
+    def saved_source(path):
+        try:
+            with open(os.path.join(path, "source.json"), "r") as f:
+                return json.load(f)
+        except (FileNotFoundError, ValueError):
+            return None
+
+
+# Sequence of pools of a registry, with the same interface as a list of pool dicts (pools[i]["pair"], len(pools))
+class RegistryPools:
+    __slots__ = ("registry", "poolIds")
+
+    def __init__(self, registry, poolIds):
+        self.registry = registry
+        self.poolIds = poolIds
+
+    def __len__(self):
+        return len(self.poolIds)
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            return RegistryPools(self.registry, self.poolIds[i])
+        return self.registry.pool(self.poolIds[i])
+
+    def __iter__(self):
+        return (self.registry.pool(poolId) for poolId in self.poolIds)
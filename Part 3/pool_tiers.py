@@ -0,0 +1,97 @@
+# Pruning index of the pools of a PairArrays (see opp_scanner.py), in hot, warm and cold tiers.
+# Pools are scored by the WETH side of their reserves, by the age of their last Sync (the blockTimestampLast returned
+# by getReserves()) and by tradability (token metadata and simulations). Hot pools are refreshed every block, warm pools
+# every warmInterval blocks and cold pools every coldInterval blocks. Only the combinations of two non-cold, tradable
+# pools are scanned, so dust pools, dead pools and broken tokens no longer cost fetch or scan time.
+# Tiers move slowly: in a block loop, they only need to be recomputed every updateInterval blocks (see stale()).
+import numpy as np
+
+HOT = 0
+WARM = 1
+COLD = 2
+
+
+class PoolTiers:
+    # Liquidity thresholds are in ETH on the WETH side of the pool, ages in seconds since the last Sync
+    def __init__(
+        self,
+        pair_arrays,
+        hotLiquidity=10.0,
+        warmLiquidity=0.5,
+        hotAge=86400,
+        warmAge=30 * 86400,
+        warmInterval=5,
+        coldInterval=100,
+        updateInterval=50,
+    ):
+        self.arrays = pair_arrays
+        self.hotLiquidity = hotLiquidity
+        self.warmLiquidity = warmLiquidity
+        self.hotAge = hotAge
+        self.warmAge = warmAge
+        self.warmInterval = warmInterval
+        self.coldInterval = coldInterval
+        self.updateInterval = updateInterval
+        self.updatedAt = None # Block of the last update(), if given
+
+        poolCount = len(pair_arrays.reserves)
+        self.lastSync = np.zeros(poolCount, dtype=np.int64) # blockTimestampLast of each pool
+        self.tradable = np.ones(poolCount, dtype=bool)
+        self.tier = np.full(poolCount, HOT, dtype=np.int8)
+        self.combos = np.arange(len(pair_arrays.idx_a), dtype=np.int64)
+
+    # Record the blockTimestampLast of the given pools, e.g. from the reserves of getReservesParallel()
+    def observe(self, indices, timestamps):
+        self.lastSync[indices] = timestamps
+
+    # Same from a list in [reserve0, reserve1, blockTimestampLast] format, in pool order
+    def observe_reserves(self, reserveList, start=0):
+        timestamps = np.fromiter((r[2] for r in reserveList), dtype=np.int64, count=len(reserveList))
+        self.lastSync[start : start + len(reserveList)] = timestamps
+
+    # Exclude the pools of tokens that cannot be traded: tokenTradable is indexed by registry token id
+    # (see TokenMetadata.registry_arrays()), for PairArrays built from a registry.
+    def set_token_tradable(self, registry, tokenTradable):
+        pairs = self.arrays.pairIds
+        pairTradable = tokenTradable[registry.pairToken0[pairs]] & tokenTradable[registry.pairToken1[pairs]]
+        self.tradable &= pairTradable[self.arrays.pool_pair]
+
+    # Exclude pools whose trades failed in simulation (see simulator.py)
+    def mark_untradable(self, indices):
+        self.tradable[indices] = False
+
+    # Recompute the tiers from the current reserves of pair_arrays, at the given chain timestamp (and block).
+    # Returns the number of pools in each tier.
+    def update(self, timestamp, block=None):
+        self.updatedAt = block
+        liquidity = self.arrays.reserves[:, 0] / 1e18
+        age = timestamp - self.lastSync
+        tier = np.full(len(liquidity), COLD, dtype=np.int8)
+        tier[(liquidity >= self.warmLiquidity) & (age <= self.warmAge)] = WARM
+        tier[(liquidity >= self.hotLiquidity) & (age <= self.hotAge)] = HOT
+        tier[~self.tradable | (self.arrays.reserves.min(axis=1) <= 0)] = COLD
+        self.tier = tier
+
+        # Combinations worth scanning: both pools out of the cold tier
+        active = tier < COLD
+        self.combos = np.nonzero(active[self.arrays.idx_a] & active[self.arrays.idx_b])[0]
+        return np.bincount(tier, minlength=3)
+
+    # Whether the tiers are due for an update() at `block`
+    def stale(self, block):
+        return self.updatedAt is None or block - self.updatedAt >= self.updateInterval
+
+    # Pools whose reserves should be refreshed at `block`. Warm and cold pools are spread over their interval, so that
+    # the load of each block stays even. With hot=False, the hot pools are left out, e.g. when their Sync logs keep
+    # them up to date.
+    def due(self, block, hot=True):
+        pools = np.arange(len(self.tier))
+        due = self.tier == HOT if hot else np.zeros(len(self.tier), dtype=bool)
+        due |= (self.tier == WARM) & ((pools + block) % self.warmInterval == 0)
+        due |= (self.tier == COLD) & ((pools + block) % self.coldInterval == 0)
+        return np.nonzero(due)[0]
+
+    # Score of each pool for ranking: WETH liquidity in ETH, halved for every hotAge since its last Sync, 0 if untradable
+    def score(self, timestamp):
+        age = np.maximum(0, timestamp - self.lastSync)
+        return self.arrays.reserves[:, 0] / 1e18 * 0.5 ** (age / self.hotAge) * self.tradable
@@ -0,0 +1,164 @@
+# Pool of async web3 providers with health scoring and latency-aware routing.
+# Each request goes to the provider with the best expected latency (measured latency, load and error rate).
+# If it has not answered after a high percentile of that provider's usual latency, the same request is sent to a
+# second provider and the first answer wins (hedged request). Failed requests are retried on other providers.
+import asyncio
+import collections
+
+from metrics import metrics
+
+
+class ProviderStats:
+    # name labels the provider in the metrics (its index in the pool, so that API keys in URLs are not exported)
+    def __init__(self, provider, maxInFlight, name=""):
+        self.provider = provider
+        self.name = name
+        self.maxInFlight = maxInFlight
+        self.semaphore = asyncio.Semaphore(maxInFlight)
+        self.inFlight = 0
+        # Exponential moving averages of the latency (seconds) and of the error rate
+        self.latency = 0.1
+        self.errorRate = 0.0
+        # Recent latencies, for the hedging percentile
+        self.samples = collections.deque(maxlen=200)
+        self.requestCount = 0
+        self.errorCount = 0
+
+    def record_success(self, latency):
+        self.latency = 0.8 * self.latency + 0.2 * latency
+        self.errorRate = 0.9 * self.errorRate
+        self.samples.append(latency)
+        self.requestCount += 1
+
+    def record_error(self):
+        self.errorRate = 0.9 * self.errorRate + 0.1
+        self.requestCount += 1
+        self.errorCount += 1
+
+    # Expected cost of sending one more request to this provider. Lower is better.
+    def score(self):
+        load = (self.inFlight + 1) / self.maxInFlight
+        return self.latency * (1 + load) / max(0.05, 1 - self.errorRate)
+
+    # Latency percentile (0 < q < 1) of the recent requests, or None without enough samples
+    def percentile(self, q):
+        if len(self.samples) < 10:
+            return None
+        ordered = sorted(self.samples)
+        return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+
+class ProviderPool:
+    # providers is a list of Web3(AsyncHTTPProvider(...)) instances, like providersAsync in find_opps.py.
+    def __init__(self, providers, maxInFlight=8, hedgeQuantile=0.95, hedgeDelay=1.0, maxRetries=3):
+        self.stats = [ProviderStats(provider, maxInFlight, str(i)) for i, provider in enumerate(providers)]
+        self.hedgeQuantile = hedgeQuantile
+        self.hedgeDelay = hedgeDelay # Used until a provider has enough latency samples
+        self.maxRetries = maxRetries
+
+    # Best provider, avoiding the ones in exclude when possible
+    def pick(self, exclude=()):
+        candidates = [s for s in self.stats if s not in exclude] or self.stats
+        return min(candidates, key=ProviderStats.score)
+
+    def hedge_delay(self, stats):
+        delay = stats.percentile(self.hedgeQuantile)
+        return self.hedgeDelay if delay is None else delay
+
+    async def _run(self, stats, fn):
+        async with stats.semaphore:
+            loop = asyncio.get_running_loop()
+            t0 = loop.time()
+            try:
+                result = await fn(stats.provider)
+            except asyncio.CancelledError:
+                # Losing side of a hedged request, not the provider's fault
+                raise
+            except Exception:
+                stats.record_error()
+                metrics.inc("rpc_errors_total", provider=stats.name)
+                raise
+            latency = loop.time() - t0
+            stats.record_success(latency)
+            metrics.observe("rpc_seconds", latency, provider=stats.name)
+            return result
+
+    # Start fn(provider) on a provider. Its slot is reserved right away, before anything is awaited, so that the
+    # concurrent calls of one asyncio.gather() see each other in the scores and are spread over the providers.
+    # The slot is released when the task ends, even if it is cancelled before it starts.
+    def _start(self, stats, fn):
+        stats.inFlight += 1
+        task = asyncio.ensure_future(self._run(stats, fn))
+
+        def release(_):
+            stats.inFlight -= 1
+
+        task.add_done_callback(release)
+        return task
+
+    # Run fn(provider) -> awaitable on the best provider, with hedging and retries.
+    async def call(self, fn):
+        tried = set()
+        lastError = None
+        for _ in range(self.maxRetries + 1):
+            primary = self.pick(tried)
+            tried.add(primary)
+            tasks = {self._start(primary, fn)}
+
+            # Hedge: if the primary is slower than usual, send the same request to a second provider
+            done, _ = await asyncio.wait(tasks, timeout=self.hedge_delay(primary))
+            if not done and len(self.stats) > 1:
+                secondary = self.pick(tried)
+                if secondary is not primary:
+                    tried.add(secondary)
+                    tasks.add(self._start(secondary, fn))
+
+            # Return the first successful answer and cancel the other request
+            while tasks:
+                done, tasks = await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None:
+                        for other in tasks:
+                            other.cancel()
+                        return task.result()
+                    lastError = task.exception()
+
+            # Every provider has been tried once, allow them again for the next retries
+            if len(tried) == len(self.stats):
+                tried = set()
+        raise lastError
+
+    # Health summary of each provider
+    def summary(self):
+        return [
+            {
+                "latency": s.latency,
+                "errorRate": s.errorRate,
+                "inFlight": s.inFlight,
+                "requests": s.requestCount,
+                "errors": s.errorCount,
+            }
+            for s in self.stats
+        ]
+
+
+# Same as getReservesParallel(), but the chunks are routed through a ProviderPool instead of round-robin:
+# a slow or failing provider only delays the chunks it was given until they are hedged or retried elsewhere.
+async def getReservesPooled(pairs, pool, queryContractAddress, queryAbi, chunkSize=1000):
+    # Create the contract objects, once per provider
+    contracts = {
+        id(s.provider): s.provider.eth.contract(address=queryContractAddress, abi=queryAbi) for s in pool.stats
+    }
+
+    # Create a list of chunks of pair addresses
+    chunks = [pairs[i : i + chunkSize] for i in range(0, len(pairs), chunkSize)]
+
+    def request(chunk):
+        return lambda provider: contracts[id(provider)].functions.getReservesByPairs(chunk).call()
+
+    # Run the tasks in parallel
+    with metrics.timer("stage_seconds", stage="fetch"):
+        results = await asyncio.gather(*[pool.call(request(chunk)) for chunk in chunks])
+
+    # Flatten the results
+    return [item for sublist in results for item in sublist]
@@ -0,0 +1,121 @@
+# Reserve state kept up to date with the Sync events of the pools.
+# The store is seeded once with the batch query (getReservesParallel), then every new block only requires a single
+# eth_getLogs call: each UniswapV2 pair emits Sync(uint112 reserve0, uint112 reserve1) whenever its reserves change.
+
+# keccak256("Sync(uint112,uint112)")
+SYNC_TOPIC = "0x1c411e9a96e071241c2f21f7726b17ae89e3cab4c78be50e062b03a9fffbbad1"
+
+
+# Convert HexBytes / bytes / hex string values found in logs to a lowercase hex string without 0x prefix
+def to_hex(value):
+    if isinstance(value, (bytes, bytearray)):
+        return bytes(value).hex()
+    value = value.lower()
+    return value[2:] if value.startswith("0x") else value
+
+
+# Block numbers and log indices are ints in web3 logs, and hex strings in raw JSON-RPC logs
+def to_int(value):
+    return int(value, 16) if isinstance(value, str) else int(value)
+
+
+# Decode the data field of a Sync log into (reserve0, reserve1)
+def decode_sync_data(data):
+    data = to_hex(data)
+    return int(data[0:64], 16), int(data[64:128], 16)
+
+
+class ReserveStore:
+    # pairs is the list of pool addresses, in the same order as the to_fetch list passed to getReservesParallel.
+    def __init__(self, pairs):
+        self.pairs = list(pairs)
+        self.index = {to_hex(pair): i for i, pair in enumerate(self.pairs)}
+        # [reserve0, reserve1] of each pool
+        self.reserves = [[0, 0] for _ in self.pairs]
+        # Block of the last Sync applied to each pool
+        self.lastUpdate = [0] * len(self.pairs)
+        # Indices of the pools whose reserves changed since the last call to take_dirty()
+        self.dirty = set()
+        # Last block whose logs have been applied
+        self.block = None
+        # Block window of the Sync log queries, learned across updates
+        self.window = None
+
+    # Initialise the store with the output of getReservesParallel, fetched at block blockNumber.
+    def seed(self, reserveList, blockNumber):
+        for i, r in enumerate(reserveList):
+            self.reserves[i] = [r[0], r[1]]
+            self.lastUpdate[i] = blockNumber
+        self.dirty = set(range(len(self.pairs)))
+        self.block = blockNumber
+
+    # Apply a list of logs (from eth_getLogs or a subscription). Logs of other contracts or events are ignored.
+    # Returns the number of reserves updated.
+    def apply_logs(self, logs):
+        # Only the last Sync of a pool in the batch matters, so sort by position in the chain first.
+        logs = sorted(logs, key=lambda log: (to_int(log["blockNumber"]), to_int(log["logIndex"])))
+        updated = 0
+        for log in logs:
+            # Logs removed by a chain reorganisation are skipped. Re-seed the store after a deep reorg.
+            if log.get("removed"):
+                continue
+            topics = log["topics"]
+            if not topics or to_hex(topics[0]) != SYNC_TOPIC[2:]:
+                continue
+            i = self.index.get(to_hex(log["address"]))
+            if i is None:
+                continue
+            blockNumber = to_int(log["blockNumber"])
+            # Ignore logs that are older than the seed of the store
+            if blockNumber < self.lastUpdate[i]:
+                continue
+            self.reserves[i] = list(decode_sync_data(log["data"]))
+            self.lastUpdate[i] = blockNumber
+            self.dirty.add(i)
+            updated += 1
+        return updated
+
+    # Overwrite the reserves of some pools with values fetched by eth_call at block blockNumber or later (e.g. the pools due
+    # for a refresh, see pool_tiers.py), to repair pools whose Sync logs were missed. Pools whose reserves differ are
+    # marked dirty. Returns their number.
+    def refresh(self, indices, reserveList, blockNumber):
+        changed = 0
+        for i, r in zip(indices, reserveList):
+            if self.reserves[i] != [r[0], r[1]]:
+                self.reserves[i] = [r[0], r[1]]
+                self.dirty.add(i)
+                changed += 1
+            self.lastUpdate[i] = max(self.lastUpdate[i], blockNumber)
+        return changed
+
+    # Return the indices of the pools that changed since the last call, and reset the dirty set.
+    def take_dirty(self):
+        dirty = self.dirty
+        self.dirty = set()
+        return dirty
+
+    # Fetch and apply the Sync logs of the blocks following the last applied block, up to toBlock (included).
+    # The logs are filtered by topic only: passing thousands of addresses in the filter is rejected by most providers,
+    # and the store drops the logs of unknown pools itself.
+    # w3Async is an async provider or a list of them. A single block is one eth_getLogs call; after a downtime, the gap
+    # is fetched with the adaptive fetcher (see log_fetcher.py), split in windows that stay under the log limit of the
+    # provider and retried on errors.
+    # The same logs are applied to the stores in followers (e.g. a store of every pool of the registry), which must
+    # have been seeded at this store's block or later. Their blocks are updated too.
+    async def update(self, w3Async, toBlock=None, followers=()):
+        from log_fetcher import AdaptiveWindow, getLogsAdaptive
+
+        providers = w3Async if isinstance(w3Async, (list, tuple)) else [w3Async]
+        if toBlock is None:
+            toBlock = await providers[0].eth.block_number
+        if self.block is None or toBlock <= self.block:
+            return 0
+        if self.window is None:
+            self.window = AdaptiveWindow(size=100)
+        logs = await getLogsAdaptive(providers, None, [SYNC_TOPIC], self.block + 1, toBlock, self.window)
+        updated = self.apply_logs(logs)
+        self.block = toBlock
+        for store in followers:
+            store.apply_logs(logs)
+            store.block = max(store.block, toBlock)
+        return updated
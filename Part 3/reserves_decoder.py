@@ -0,0 +1,94 @@
+# Fast client for getReservesByPairsAsm() of QueryContractYulAsm.sol.
+# The calldata is built by hand and the flat bytes32[] answer is decoded in bulk with numpy.frombuffer, instead of
+# going through the generic web3 ABI decoder that builds a nested list of Python ints for every pool.
+import asyncio
+
+import numpy as np
+
+from metrics import metrics
+
+# 4-byte selector of getReservesByPairsAsm(address[]), i.e. keccak256("getReservesByPairsAsm(address[])")[:4]
+SELECTOR = bytes.fromhex("08982f1b")
+
+# QueryContractYulAsm.sol sets the blockTimestampLast word to 2^256-1 when the getReserves() call of a pool failed
+FAILED_MARKER = 0xFF
+
+
+# ABI-encode a call to getReservesByPairsAsm(pairs)
+def encode_call(pairs):
+    head = SELECTOR + (32).to_bytes(32, "big") + len(pairs).to_bytes(32, "big")
+    padding = bytes(12)
+    return head + b"".join(padding + bytes.fromhex(pair[2:]) for pair in pairs)
+
+
+# View the returned bytes32[] as a (n, 3, 32) array of bytes: one row per pool, one 32-byte word per value
+def _words(raw):
+    raw = bytes(raw)
+    n = int.from_bytes(raw[32:64], "big") // 3
+    return np.frombuffer(raw, dtype=np.uint8, count=n * 96, offset=64).reshape(n, 3, 32)
+
+
+# Decode the answer into float reserves, for the vectorized scan.
+# Returns (reserves, timestamps, valid): reserves is a (n, 2) float64 array [reserve0, reserve1], timestamps a uint32
+# array and valid is False for the pools whose getReserves() call failed (their reserves are set to 0).
+def decode_reserves(raw):
+    with metrics.timer("stage_seconds", stage="decode"):
+        return _decode_reserves(raw)
+
+
+def _decode_reserves(raw):
+    words = _words(raw)
+    # Reserves are uint112: they span the last 14 bytes of the word. Read them as two big-endian 64-bit halves.
+    hi = np.ascontiguousarray(words[:, :2, 16:24]).view(">u8").reshape(-1, 2)
+    lo = np.ascontiguousarray(words[:, :2, 24:32]).view(">u8").reshape(-1, 2)
+    reserves = hi.astype(np.float64) * 2.0**64 + lo.astype(np.float64)
+    timestamps = np.ascontiguousarray(words[:, 2, 28:32]).view(">u4").reshape(-1).astype(np.uint32)
+    valid = words[:, 2, 0] != FAILED_MARKER
+    reserves[~valid] = 0
+    timestamps[~valid] = 0
+    return reserves, timestamps, valid
+
+
+# Decode the answer into exact integer reserves, in the [reserve0, reserve1, blockTimestampLast] format of
+# getReservesParallel(). Failed pools get None instead of silent zeros.
+def decode_reserves_int(raw):
+    view = memoryview(bytes(raw))
+    n = int.from_bytes(view[32:64], "big") // 3
+    result = []
+    for i in range(n):
+        base = 64 + 96 * i
+        if view[base + 64] == FAILED_MARKER:
+            result.append(None)
+            continue
+        result.append(
+            [
+                int.from_bytes(view[base : base + 32], "big"),
+                int.from_bytes(view[base + 32 : base + 64], "big"),
+                int.from_bytes(view[base + 64 : base + 96], "big"),
+            ]
+        )
+    return result
+
+
+# Call getReservesByPairsAsm() with the given pool addresses and return the raw answer
+async def callReservesAsm(provider, queryContractAddress, pairs):
+    return await provider.eth.call({"to": queryContractAddress, "data": encode_call(pairs)})
+
+
+# Same as getReservesParallel(), for the Asm variant of the query contract.
+# Returns (reserves, timestamps, valid) arrays in the order of pairs, see decode_reserves().
+async def getReservesAsmParallel(pairs, providers, queryContractAddress, chunkSize=1000):
+    # Create a list of chunks of pair addresses
+    chunks = [pairs[i : i + chunkSize] for i in range(0, len(pairs), chunkSize)]
+
+    # Assign each chunk to a provider in a round-robin fashion
+    tasks = [
+        callReservesAsm(providers[i % len(providers)], queryContractAddress, chunk)
+        for i, chunk in enumerate(chunks)
+    ]
+
+    # Run the tasks in parallel and decode every answer in bulk
+    decoded = [decode_reserves(raw) for raw in await asyncio.gather(*tasks)]
+    if not decoded:
+        return np.zeros((0, 2)), np.zeros(0, dtype=np.uint32), np.zeros(0, dtype=bool)
+    return tuple(np.concatenate(parts) for parts in zip(*decoded))
@@ -0,0 +1,251 @@
+# Connection-pooled, batched JSON-RPC transport for the async providers.
+# BatchingProvider is a drop-in replacement of AsyncHTTPProvider:
+#   Web3(BatchingProvider(uri), modules={"eth": (AsyncEth)})
+# so getReservesParallel(), getReservesPooled(), getLogsAdaptive()... use it without any change. The requests made
+# concurrently on a provider (e.g. the eth_call of every chunk gathered by getReservesParallel()) are queued for up to
+# flushDelay seconds and sent together as one JSON-RPC batch array, over a keep-alive session per endpoint, instead of
+# one HTTP round-trip per request. WebSocket ("ws://", "wss://") and IPC (a file path, for a co-located node) endpoints
+# use one persistent connection on which the requests are matched to their answers by id.
+# Responses are parsed with orjson when it is installed.
+# web3 is only imported when BatchingProvider is first used, importing this module stays cheap.
+import asyncio
+import collections
+import itertools
+
+from metrics import metrics
+
+try:
+    import orjson
+
+    def json_dumps(value):
+        return orjson.dumps(value)
+
+    json_loads = orjson.loads
+except ImportError:
+    import json
+
+    def json_dumps(value):
+        return json.dumps(value, separators=(",", ":")).encode()
+
+    json_loads = json.loads
+
+
+# JSON-serializable form of the request parameters built by web3 (HexBytes, bytes, AttributeDict...)
+def _plain(value):
+    if isinstance(value, (bytes, bytearray)):
+        return "0x" + bytes(value).hex()
+    if isinstance(value, dict) or hasattr(value, "items"):
+        return {key: _plain(item) for key, item in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [_plain(item) for item in value]
+    return value
+
+
+class HttpChannel:
+    # One aiohttp session per endpoint, keeping up to maxConnections connections alive
+    def __init__(self, uri, maxConnections=8, timeout=30):
+        self.uri = uri
+        self.maxConnections = maxConnections
+        self.timeout = timeout
+        self.session = None
+
+    async def send(self, payload, dispatch):
+        import aiohttp
+
+        if self.session is None or self.session.closed:
+            self.session = aiohttp.ClientSession(
+                connector=aiohttp.TCPConnector(limit=self.maxConnections, keepalive_timeout=60),
+                timeout=aiohttp.ClientTimeout(total=self.timeout),
+            )
+        async with self.session.post(self.uri, data=payload, headers={"Content-Type": "application/json"}) as response:
+            response.raise_for_status()
+            dispatch(json_loads(await response.read()))
+
+    async def close(self):
+        if self.session is not None:
+            await self.session.close()
+            self.session = None
+
+
+class SocketChannel:
+    # Persistent WebSocket or IPC connection. A reader task hands every message to dispatch(), which matches the
+    # answers to the waiting requests by id. Messages without a pending id (subscriptions) are ignored.
+    def __init__(self, uri):
+        self.uri = uri
+        self.reader = None
+        self.lock = asyncio.Lock()
+
+    async def _connect(self, dispatch):
+        if self.uri.startswith(("ws://", "wss://")):
+            import websockets
+
+            ws = await websockets.connect(self.uri, max_size=None)
+
+            async def read():
+                async for message in ws:
+                    dispatch(json_loads(message))
+
+            write = ws.send
+            close = ws.close
+        else:
+            reader, writer = await asyncio.open_unix_connection(self.uri, limit=2**30)
+
+            # Geth and Erigon end every IPC message with a newline
+            async def read():
+                while line := await reader.readline():
+                    dispatch(json_loads(line))
+
+            async def write(payload):
+                writer.write(payload + b"\n")
+                await writer.drain()
+
+            async def close():
+                writer.close()
+
+        self.write = write
+        self.closeConnection = close
+        self.reader = asyncio.ensure_future(read())
+
+    async def send(self, payload, dispatch):
+        async with self.lock:
+            if self.reader is None or self.reader.done():
+                await self._connect(dispatch)
+        await self.write(payload)
+
+    async def close(self):
+        if self.reader is not None:
+            self.reader.cancel()
+            await self.closeConnection()
+            self.reader = None
+
+
+# Transport of BatchingProvider, combined with web3's AsyncJSONBaseProvider by __getattr__() below
+class _BatchingTransport:
+    # uri is an http(s):// or ws(s):// URI, or the path of the IPC socket of a local node.
+    # At most maxBatch requests are sent in one batch; a batch is sent as soon as it is full, or flushDelay seconds
+    # after its first request.
+    def __init__(self, uri, maxBatch=100, flushDelay=0.002, maxConnections=8, timeout=30):
+        super().__init__()
+        self.endpoint_uri = uri
+        self.maxBatch = maxBatch
+        self.flushDelay = flushDelay
+        self.timeout = timeout
+        if uri.startswith(("http://", "https://")):
+            self.channel = HttpChannel(uri, maxConnections, timeout)
+        else:
+            self.channel = SocketChannel(uri)
+        self.ids = itertools.count()
+        self.queue = []
+        self.waiting = {} # id -> future of the answer
+        self.socketBatches = collections.deque() # ids of the batches sent on a socket, oldest first
+        self.flushHandle = None
+        self.requestCount = 0
+        self.batchCount = 0
+
+    def __str__(self):
+        return f"Batching connection {self.endpoint_uri}"
+
+    async def make_request(self, method, params):
+        loop = asyncio.get_running_loop()
+        requestId = next(self.ids)
+        future = loop.create_future()
+        self.waiting[requestId] = future
+        self.queue.append({"jsonrpc": "2.0", "id": requestId, "method": method, "params": _plain(params or [])})
+        if len(self.queue) >= self.maxBatch:
+            self._flush()
+        elif self.flushHandle is None:
+            self.flushHandle = loop.call_later(self.flushDelay, self._flush)
+        try:
+            return await asyncio.wait_for(future, self.timeout)
+        finally:
+            self.waiting.pop(requestId, None)
+
+    def _flush(self):
+        if self.flushHandle is not None:
+            self.flushHandle.cancel()
+            self.flushHandle = None
+        batch, self.queue = self.queue, []
+        if batch:
+            asyncio.ensure_future(self._send(batch))
+
+    async def _send(self, batch):
+        self.requestCount += len(batch)
+        self.batchCount += 1
+        metrics.inc("rpc_requests_total", len(batch))
+        metrics.inc("rpc_batches_total")
+        # A lone request is sent as is, some endpoints handle batches less efficiently
+        payload = json_dumps(batch if len(batch) > 1 else batch[0])
+        ids = [request["id"] for request in batch]
+        error = None
+        try:
+            if isinstance(self.channel, HttpChannel):
+                await self.channel.send(payload, lambda response: self._dispatch(response, ids))
+            else:
+                self._oldest_socket_batch() # Drop the batches already answered
+                self.socketBatches.append(ids)
+                await self.channel.send(payload, self._dispatch)
+        except Exception as e:
+            error = e
+        if error is None and isinstance(self.channel, HttpChannel):
+            # The answers of an HTTP request are all in its response
+            error = ValueError(f"No answer from {self.endpoint_uri} in the response to the batch")
+        if error is not None:
+            self._fail(ids, error)
+
+    def _fail(self, ids, error):
+        for requestId in ids:
+            future = self.waiting.get(requestId)
+            if future is not None and not future.done():
+                future.set_exception(error)
+
+    # Oldest batch sent on the socket that still has requests waiting for an answer
+    def _oldest_socket_batch(self):
+        while self.socketBatches and all(
+            requestId not in self.waiting or self.waiting[requestId].done() for requestId in self.socketBatches[0]
+        ):
+            self.socketBatches.popleft()
+        return self.socketBatches[0] if self.socketBatches else None
+
+    # Hand the answers of a response (a single answer or a batch array, in any order) to their requests.
+    # A node rejecting a whole batch (invalid request, batch too large, rate limit...) answers with a single error
+    # without id: it is raised in every request of the batch, ids. On a socket, where the responses of the batches are
+    # not told apart, it goes to the oldest batch still waiting.
+    def _dispatch(self, response, ids=None):
+        for answer in response if isinstance(response, list) else [response]:
+            if answer.get("id") is None and "error" in answer:
+                batchIds = ids if ids is not None else self._oldest_socket_batch()
+                if batchIds is not None:
+                    self._fail(batchIds, ValueError(answer["error"]))
+                continue
+            future = self.waiting.get(answer.get("id"))
+            if future is not None and not future.done():
+                future.set_result(answer)
+
+    async def disconnect(self):
+        await self.channel.close()
+
+
+# BatchingProvider is created on first access (from rpc_transport import BatchingProvider), which imports web3
+def _batching_provider_class():
+    provider = globals().get("BatchingProvider")
+    if provider is None:
+        from web3.providers.async_base import AsyncJSONBaseProvider
+
+        provider = type("BatchingProvider", (_BatchingTransport, AsyncJSONBaseProvider), {"__module__": __name__})
+        globals()["BatchingProvider"] = provider
+    return provider
+
+
+def __getattr__(name):
+    if name == "BatchingProvider":
+        return _batching_provider_class()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+
+# Async providers for a list of URIs, as used by providersAsync in find_opps.py
+def batchingProviders(uris, **kwargs):
+    from web3 import Web3
+    from web3.eth import AsyncEth
+
+    BatchingProvider = _batching_provider_class()
+    return [Web3(BatchingProvider(uri, **kwargs), modules={"eth": (AsyncEth)}) for uri in uris]
@@ -0,0 +1,117 @@
+# Pre-trade simulation of the best candidates on a local anvil fork.
+# Each candidate is executed for real by SimulateArb.sol inside an eth_call: the contract code and the balance of the
+# sender are injected with state overrides, so nothing is deployed or signed. The candidates that revert are dropped,
+# and the others come back with their actual output, the gas used by the two swaps, and whether the token took a fee
+# on transfer.
+import asyncio
+import os
+
+import numpy as np
+from web3.exceptions import ContractLogicError
+
+from contract_cache import compile_cached
+from opp_scanner import OPP_DTYPE
+
+# Addresses used in the eth_call only, their code and balance come from the state override
+SIMULATOR_ADDRESS = "0x0000000000000000000000000000000000005151"
+SENDER_ADDRESS = "0x0000000000000000000000000000000000005150"
+SENDER_BALANCE = 10**30
+
+# 4-byte selector of simulate(address,address,address), i.e. keccak256("simulate(address,address,address)")[:4]
+SIMULATE_SELECTOR = bytes.fromhex("a8da65cc")
+
+# Intrinsic gas of a transaction, not measured inside the call
+TX_BASE_GAS = 21000
+
+SIMULATOR_SOURCE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "SimulateArb.sol")
+
+# Result of a simulation: OPP_DTYPE plus the simulated output and profit in ETH, the gas of the transaction and flags
+SIM_DTYPE = np.dtype(
+    OPP_DTYPE.descr
+    + [
+        ("output", np.float64),
+        ("sim_profit", np.float64),
+        ("gas", np.int64),
+        ("fee_on_transfer", bool),
+        ("ok", bool),
+    ]
+)
+
+
+# Compile SimulateArb.sol with solcx, or read it from the cache (see contract_cache.py).
+# Returns the runtime bytecode, which is what the state override expects.
+def compileSimulator(path=SIMULATOR_SOURCE, version="0.8.0"):
+    contract = compile_cached(path, "SimulateArb", ["evm.deployedBytecode"], version)
+    return "0x" + contract["evm"]["deployedBytecode"]["object"]
+
+
+# Whether an eth_call error means the simulated transaction failed: a revert, or running out of the gas limit (which
+# web3 raises as a ValueError holding the JSON-RPC error). Transport errors (timeouts, connection resets) are not.
+def is_execution_failure(error):
+    if isinstance(error, ContractLogicError):
+        return True
+    if isinstance(error, ValueError) and error.args and isinstance(error.args[0], dict):
+        message = str(error.args[0].get("message", "")).lower()
+        return "out of gas" in message or "outofgas" in message
+    return False
+
+
+def encode_simulate(poolA, poolB, token):
+    return SIMULATE_SELECTOR + b"".join(bytes(12) + bytes.fromhex(address[2:]) for address in (poolA, poolB, token))
+
+
+# Run one simulation. Returns (wethOut, tokenOut, tokenReceived, gasUsed), or None if the execution reverted.
+# Any other error is raised, so that an unreachable fork is not mistaken for candidates that all revert.
+async def simulate(provider, runtimeCode, poolA, poolB, token, amountIn, gasLimit=1000000):
+    tx = {
+        "from": SENDER_ADDRESS,
+        "to": SIMULATOR_ADDRESS,
+        "value": amountIn,
+        "gas": gasLimit,
+        "data": encode_simulate(poolA, poolB, token),
+    }
+    overrides = {
+        SIMULATOR_ADDRESS: {"code": runtimeCode},
+        SENDER_ADDRESS: {"balance": SENDER_BALANCE},
+    }
+    try:
+        raw = bytes(await provider.eth.call(tx, "latest", overrides))
+    except (ContractLogicError, ValueError) as e:
+        if not is_execution_failure(e):
+            raise
+        return None
+    if len(raw) < 128:
+        return None
+    return tuple(int.from_bytes(raw[32 * i : 32 * i + 32], "big") for i in range(4))
+
+
+# Simulate the candidates (an array of OPP_DTYPE, e.g. the best positive opportunities) concurrently on the providers
+# of an anvil fork, in a round-robin fashion. Returns an array of SIM_DTYPE in the same order, with ok set to False for
+# the candidates that reverted or lost WETH.
+async def simulate_opportunities(candidates, pair_arrays, weth, providers, runtimeCode, concurrency=16):
+    slots = asyncio.Semaphore(concurrency)
+
+    async def run(i, opp):
+        poolA = pair_arrays.pools[int(opp["poolA"])]
+        poolB = pair_arrays.pools[int(opp["poolB"])]
+        token = poolA["token1"] if poolA["token0"] == weth else poolA["token0"]
+        async with slots:
+            return await simulate(
+                providers[i % len(providers)], runtimeCode, poolA["pair"], poolB["pair"], token, int(opp["input"] * 1e18)
+            )
+
+    results = await asyncio.gather(*[run(i, opp) for i, opp in enumerate(candidates)])
+
+    simulated = np.zeros(len(candidates), dtype=SIM_DTYPE)
+    for name in OPP_DTYPE.names:
+        simulated[name] = candidates[name]
+    for i, result in enumerate(results):
+        if result is None:
+            continue
+        wethOut, tokenOut, tokenReceived, gasUsed = result
+        simulated[i]["output"] = wethOut / 1e18
+        simulated[i]["sim_profit"] = (wethOut - int(candidates[i]["input"] * 1e18)) / 1e18
+        simulated[i]["gas"] = gasUsed + TX_BASE_GAS
+        simulated[i]["fee_on_transfer"] = tokenReceived < tokenOut
+        simulated[i]["ok"] = simulated[i]["sim_profit"] > 0
+    return simulated
@@ -0,0 +1,219 @@
+# Recording of the reserves of every block to a compact binary log, and deterministic replay without any network.
+# A log is a directory holding the pool registry (see pool_registry.py), the registry ids of the recorded pools
+# (pools.npy, in the order of the reserve lists) and reserves.bin, an append-only sequence of frames:
+#   header: block (uint64), kind (uint32, KEYFRAME or DELTA), count (uint32)
+#   KEYFRAME: the reserves of every pool
+#   DELTA: the indices of the pools whose reserves changed since the previous frame (uint32, padded to 8 bytes),
+#          then their new reserves
+# Reserves are stored exactly, as 4 uint64 words per pool: [reserve0 >> 64, reserve0 & (2^64-1), reserve1 >> 64, ...].
+# A keyframe is written every keyframeInterval frames, so that a replay can start anywhere without reading everything.
+# The log is memory-mapped for reading.
+import os
+import time
+
+import numpy as np
+
+from opp_index import OpportunityIndex
+from opp_scanner import FEE
+from pool_registry import PoolRegistry
+
+KEYFRAME = 0
+DELTA = 1
+
+HEADER_DTYPE = np.dtype([("block", "<u8"), ("kind", "<u4"), ("count", "<u4")])
+MASK64 = (1 << 64) - 1
+
+
+# Exact reserves ([reserve0, reserve1, ...] lists of Python ints) -> (n, 4) uint64 words
+def reserves_to_words(reserveList):
+    words = np.empty((len(reserveList), 4), dtype=np.uint64)
+    words[:, 0] = np.fromiter((r[0] >> 64 for r in reserveList), dtype=np.uint64, count=len(reserveList))
+    words[:, 1] = np.fromiter((r[0] & MASK64 for r in reserveList), dtype=np.uint64, count=len(reserveList))
+    words[:, 2] = np.fromiter((r[1] >> 64 for r in reserveList), dtype=np.uint64, count=len(reserveList))
+    words[:, 3] = np.fromiter((r[1] & MASK64 for r in reserveList), dtype=np.uint64, count=len(reserveList))
+    return words
+
+
+# (n, 4) uint64 words -> (n, 2) float64 [reserve0, reserve1], for the vectorized scan
+def words_to_float(words):
+    reserves = np.empty((len(words), 2), dtype=np.float64)
+    reserves[:, 0] = words[:, 0] * 2.0**64 + words[:, 1]
+    reserves[:, 1] = words[:, 2] * 2.0**64 + words[:, 3]
+    return reserves
+
+
+# (n, 4) uint64 words -> exact [reserve0, reserve1] lists, for swap_math.py
+def words_to_int(words):
+    return [[(int(w[0]) << 64) | int(w[1]), (int(w[2]) << 64) | int(w[3])] for w in words]
+
+
+class SnapshotRecorder:
+    # poolIds are the registry ids of the recorded pools, in the order of the reserve lists passed to record()
+    # (pair_arrays.poolIds for the to_fetch list of find_opps.py).
+    # Recording into an existing log appends to it, starting with a keyframe. Its recorded pools must be the same,
+    # otherwise a ValueError is raised: use another directory.
+    def __init__(self, path, registry, poolIds, keyframeInterval=100):
+        poolIds = np.asarray(poolIds, dtype=np.int32)
+        os.makedirs(path, exist_ok=True)
+        if os.path.exists(os.path.join(path, "pools.npy")):
+            savedIds = np.load(os.path.join(path, "pools.npy"))
+            savedRegistry = PoolRegistry.load(os.path.join(path, "registry"), mmap=False)
+            if not np.array_equal(savedIds, poolIds) or not np.array_equal(
+                np.asarray(savedRegistry.addresses)[savedIds], np.asarray(registry.addresses)[poolIds]
+            ):
+                raise ValueError(f"The snapshot log at {path} records other pools")
+        registry.save(os.path.join(path, "registry"))
+        np.save(os.path.join(path, "pools.npy"), poolIds)
+        self.file = open(os.path.join(path, "reserves.bin"), "ab")
+        self.keyframeInterval = keyframeInterval
+        self.current = None
+        self.sinceKeyframe = 0
+        self.bytesWritten = 0
+
+    def _write(self, block, kind, indices, words):
+        header = np.zeros(1, dtype=HEADER_DTYPE)
+        header["block"] = block
+        header["kind"] = kind
+        header["count"] = len(words)
+        parts = [header.tobytes()]
+        if kind == DELTA:
+            indices = np.asarray(indices, dtype="<u4")
+            parts.append(indices.tobytes() + bytes(-indices.nbytes % 8))
+        parts.append(np.ascontiguousarray(words, dtype="<u8").tobytes())
+        for part in parts:
+            self.file.write(part)
+            self.bytesWritten += len(part)
+
+    # Record the reserves of every pool at a block (output of getReservesParallel(), or ReserveStore.reserves).
+    # Only the pools that changed since the previous block are written, except on keyframes.
+    def record(self, block, reserveList):
+        words = reserves_to_words(reserveList)
+        if self.current is None or self.sinceKeyframe + 1 >= self.keyframeInterval:
+            self._write(block, KEYFRAME, None, words)
+            self.sinceKeyframe = 0
+        else:
+            changed = np.nonzero(np.any(words != self.current, axis=1))[0]
+            self._write(block, DELTA, changed, words[changed])
+            self.sinceKeyframe += 1
+        self.current = words
+
+    # Same as record() when the changed pools are already known, e.g. the dirty set of a ReserveStore.
+    # Avoids converting the reserves of every pool.
+    def record_dirty(self, block, reserveList, dirty):
+        if self.current is None or self.sinceKeyframe + 1 >= self.keyframeInterval:
+            self.record(block, reserveList)
+            return
+        changed = np.array(sorted(dirty), dtype=np.int64)
+        words = reserves_to_words([reserveList[i] for i in changed])
+        self.current[changed] = words
+        self._write(block, DELTA, changed, words)
+        self.sinceKeyframe += 1
+
+    def close(self):
+        self.file.close()
+
+
+class SnapshotLog:
+    def __init__(self, path, mmap=True):
+        self.registry = PoolRegistry.load(os.path.join(path, "registry"), mmap=mmap)
+        self.poolIds = np.load(os.path.join(path, "pools.npy"))
+        data_path = os.path.join(path, "reserves.bin")
+        size = os.path.getsize(data_path)
+        self.data = np.memmap(data_path, dtype=np.uint8, mode="r") if size else np.zeros(0, dtype=np.uint8)
+
+        # Index of the frames: block, kind, count and offset of the header
+        blocks, kinds, counts, offsets = [], [], [], []
+        offset = 0
+        while offset + HEADER_DTYPE.itemsize <= len(self.data):
+            header = self.data[offset : offset + HEADER_DTYPE.itemsize].view(HEADER_DTYPE)[0]
+            kind, count = int(header["kind"]), int(header["count"])
+            frameSize = HEADER_DTYPE.itemsize + 32 * count
+            if kind == DELTA:
+                frameSize += (4 * count + 7) // 8 * 8
+            if offset + frameSize > len(self.data):
+                break # Truncated last frame, e.g. the recorder was killed
+            blocks.append(int(header["block"]))
+            kinds.append(kind)
+            counts.append(count)
+            offsets.append(offset)
+            offset += frameSize
+        self.blocks = np.array(blocks, dtype=np.int64)
+        self.kinds = np.array(kinds, dtype=np.int8)
+        self.counts = np.array(counts, dtype=np.int64)
+        self.offsets = np.array(offsets, dtype=np.int64)
+
+    def __len__(self):
+        return len(self.blocks)
+
+    # (indices, words) of frame f. indices is None for a keyframe.
+    def frame(self, f):
+        start = int(self.offsets[f]) + HEADER_DTYPE.itemsize
+        count = int(self.counts[f])
+        indices = None
+        if self.kinds[f] == DELTA:
+            indices = self.data[start : start + 4 * count].view("<u4").astype(np.int64)
+            start += (4 * count + 7) // 8 * 8
+        words = self.data[start : start + 32 * count].view("<u8").reshape(count, 4)
+        return indices, words
+
+    # Replay the frames from the first block >= fromBlock (starting at the keyframe before it).
+    # Yields (block, words, changed): words is the (n, 4) state of every pool, updated in place, and changed the
+    # indices of the pools that changed at this block (None when every pool must be considered).
+    def replay(self, fromBlock=None, toBlock=None):
+        start = 0
+        if fromBlock is not None:
+            keyframes = np.nonzero((self.kinds == KEYFRAME) & (self.blocks <= fromBlock))[0]
+            start = int(keyframes[-1]) if len(keyframes) else 0
+        state = None
+        first = True
+        for f in range(start, len(self.blocks)):
+            block = int(self.blocks[f])
+            if toBlock is not None and block > toBlock:
+                break
+            indices, words = self.frame(f)
+            if indices is None:
+                state = np.array(words)
+            elif state is None:
+                continue # No keyframe yet
+            else:
+                state[indices] = words
+            if fromBlock is None or block >= fromBlock:
+                # The first block yielded carries the whole state
+                yield block, state, None if first else indices
+                first = False
+
+
+# Feed a snapshot log into the opportunity engine at full speed, without network: reserves are loaded into
+# pair_arrays (whose pools must be the recorded ones) and an OpportunityIndex is updated incrementally.
+# Returns (best, stats): the best opportunity of each block as (block, key, input, profit, net_profit) and throughput
+# statistics.
+def replay_log(log, pair_arrays, gasCost=0.0, fromBlock=None, toBlock=None, fee=FEE):
+    if not np.array_equal(np.asarray(pair_arrays.poolIds), log.poolIds):
+        raise ValueError("pair_arrays does not hold the pools of the snapshot log")
+    opp_index = OpportunityIndex(pair_arrays, gasCost, fee)
+    best = []
+    blockCount = poolUpdates = recomputed = 0
+    t0 = time.perf_counter()
+    for block, words, changed in log.replay(fromBlock, toBlock):
+        if changed is None:
+            pair_arrays.set_raw_reserves(words_to_float(words))
+            opp_index.build()
+            poolUpdates += len(words)
+            recomputed += len(pair_arrays.idx_a)
+        else:
+            pair_arrays.set_raw_reserves_at(changed, words_to_float(words[changed]))
+            recomputed += opp_index.update(changed.tolist())
+            poolUpdates += len(changed)
+        blockCount += 1
+        top = opp_index.best()
+        if top is not None:
+            best.append((block,) + top)
+    elapsed = time.perf_counter() - t0
+    stats = {
+        "blocks": blockCount,
+        "seconds": elapsed,
+        "blocks_per_second": blockCount / elapsed if elapsed else None,
+        "pool_updates": poolUpdates,
+        "combinations_evaluated": recomputed,
+    }
+    return best, stats
@@ -0,0 +1,131 @@
+# Streaming opportunity pipeline.
+# Reserve chunks are handed to the opportunity evaluator as soon as they come back, instead of waiting for the whole
+# getReservesParallel() gather. A pair is evaluated as soon as the reserves of all its pools are known, and a running
+# top-K of net profit is available at any moment. The fetch stage never runs more than maxInFlight chunks ahead of
+# the evaluator (backpressure), so memory stays flat whatever the number of pools.
+import asyncio
+import heapq
+
+import numpy as np
+
+from opp_scanner import FEE, evaluate_combinations
+
+
+# Async generator of (start, reserves) for consecutive chunks of pairs, in completion order.
+# fetchChunk(chunk) is a coroutine function returning the reserves of the pool addresses in chunk.
+# A new chunk is only requested when the consumer has taken one, so at most maxInFlight chunks are fetched or waiting.
+async def streamReserves(pairs, fetchChunk, chunkSize=1000, maxInFlight=8):
+    queue = asyncio.Queue()
+    slots = asyncio.Semaphore(maxInFlight)
+    tasks = []
+
+    async def fetch(start, chunk):
+        try:
+            result = await fetchChunk(chunk)
+        except Exception as e:
+            result = e
+        await queue.put((start, result))
+
+    async def producer():
+        for start in range(0, len(pairs), chunkSize):
+            await slots.acquire() # Released when the consumer takes a result
+            tasks.append(asyncio.ensure_future(fetch(start, pairs[start : start + chunkSize])))
+
+    chunkCount = (len(pairs) + chunkSize - 1) // chunkSize
+    producerTask = asyncio.ensure_future(producer())
+    try:
+        for _ in range(chunkCount):
+            start, result = await queue.get()
+            slots.release()
+            if isinstance(result, Exception):
+                raise result
+            yield start, result
+    finally:
+        producerTask.cancel()
+        for task in tasks:
+            task.cancel()
+
+
+# fetchChunk() for streamReserves(), routing each chunk through a ProviderPool (see provider_pool.py)
+def reservesChunkFetcher(pool, queryContractAddress, queryAbi):
+    contracts = {
+        id(s.provider): s.provider.eth.contract(address=queryContractAddress, abi=queryAbi) for s in pool.stats
+    }
+
+    async def fetchChunk(chunk):
+        return await pool.call(lambda provider: contracts[id(provider)].functions.getReservesByPairs(chunk).call())
+
+    return fetchChunk
+
+
+# Running top-K of opportunities by net profit, kept in a min-heap of size K
+class TopK:
+    def __init__(self, k):
+        self.k = k
+        self.heap = []
+
+    # Lowest net profit that still enters the top-K
+    def threshold(self):
+        return self.heap[0][0] if len(self.heap) == self.k else -np.inf
+
+    def push(self, net_profit, item):
+        if len(self.heap) < self.k:
+            heapq.heappush(self.heap, (net_profit, item))
+        elif net_profit > self.heap[0][0]:
+            heapq.heapreplace(self.heap, (net_profit, item))
+
+    # Current top-K as (net_profit, item), by decreasing net profit
+    def snapshot(self):
+        return sorted(self.heap, key=lambda entry: entry[0], reverse=True)
+
+
+class StreamingScanner:
+    # Evaluates the opportunities of a PairArrays (see opp_scanner.py) pair by pair, as the reserves arrive.
+    # gasCost is the cost of one opportunity in ETH.
+    def __init__(self, pair_arrays, topK=20, gasCost=0.0, fee=FEE):
+        self.arrays = pair_arrays
+        self.gasCost = gasCost
+        self.fee = fee
+        self.best = TopK(topK)
+        self.sizes = np.diff(pair_arrays.offsets)
+        self.loaded = np.zeros(len(self.sizes), dtype=np.int64) # Pools with known reserves, per pair
+        self.poolCount = 0
+        self.opportunityCount = 0
+
+        # Combinations are sorted by poolA, hence by pair: those of pair k are [comboOffsets[k], comboOffsets[k+1])
+        self.comboOffsets = np.searchsorted(
+            pair_arrays.pool_pair[pair_arrays.idx_a], np.arange(len(self.sizes) + 1)
+        )
+
+    # Load the reserves of the pools [start, start + len(reserveChunk)) and evaluate the pairs that became complete.
+    # Returns the number of pairs evaluated.
+    def add_chunk(self, start, reserveChunk):
+        end = start + len(reserveChunk)
+        self.arrays.set_reserves_slice(start, reserveChunk)
+        self.poolCount += len(reserveChunk)
+
+        pairs = self.arrays.pool_pair[start:end]
+        np.add.at(self.loaded, pairs, 1)
+        complete = np.unique(pairs)
+        complete = complete[self.loaded[complete] == self.sizes[complete]]
+        if len(complete) == 0:
+            return 0
+
+        combos = np.concatenate(
+            [np.arange(self.comboOffsets[k], self.comboOffsets[k + 1]) for k in complete]
+        )
+        idx_a = self.arrays.idx_a[combos]
+        idx_b = self.arrays.idx_b[combos]
+        x, profit, ok = evaluate_combinations(self.arrays.reserves, idx_a, idx_b, self.fee)
+        net_profit = profit / 1e18 - self.gasCost
+        self.opportunityCount += int(np.count_nonzero(ok))
+
+        # Only the combinations above the current top-K threshold go through the heap
+        candidates = np.nonzero(ok & (net_profit > self.best.threshold()))[0]
+        for c in candidates.tolist():
+            self.best.push(float(net_profit[c]), (int(idx_a[c]), int(idx_b[c]), float(x[c] / 1e18), float(profit[c] / 1e18)))
+        return len(complete)
+
+    # Current best opportunities as (net_profit, (poolA, poolB, input, profit)), values in ETH
+    def top(self):
+        return self.best.snapshot()
@@ -0,0 +1,112 @@
+# Exact integer swap math, reproducing UniswapV2Pair / UniswapV2Library to the wei.
+# All amounts are Python ints in Wei (or in the smallest unit of the token), so there is no rounding besides the
+# integer divisions performed by the pair contract itself.
+import math
+
+# The pair contract takes a 0.3% fee: amountIn is multiplied by 997 / 1000
+FEE_NUMERATOR = 997
+FEE_DENOMINATOR = 1000
+
+
+# Same as UniswapV2Library.getAmountOut()
+def get_amount_out(amount_in, reserve_in, reserve_out):
+    if amount_in <= 0 or reserve_in <= 0 or reserve_out <= 0:
+        return 0
+    amount_in_with_fee = amount_in * FEE_NUMERATOR
+    numerator = amount_in_with_fee * reserve_out
+    denominator = reserve_in * FEE_DENOMINATOR + amount_in_with_fee
+    return numerator // denominator
+
+
+# Same as UniswapV2Library.getAmountIn(): smallest input that yields amount_out
+def get_amount_in(amount_out, reserve_in, reserve_out):
+    if amount_out <= 0 or reserve_in <= 0 or amount_out >= reserve_out:
+        return 0
+    numerator = reserve_in * amount_out * FEE_DENOMINATOR
+    denominator = (reserve_out - amount_out) * FEE_NUMERATOR
+    return numerator // denominator + 1
+
+
+# Exact output of the two successive swaps: WETH -> token in pool A, then token -> WETH in pool B.
+# Reserves are given with WETH first: (a1, b1) for pool A and (a2, b2) for pool B.
+def trade_output(x, a1, b1, a2, b2):
+    return get_amount_out(get_amount_out(x, a1, b1), b2, a2)
+
+
+# Exact gross profit in Wei of the two successive swaps
+def trade_profit(x, a1, b1, a2, b2):
+    return trade_output(x, a1, b1, a2, b2) - x
+
+
+# Optimal input amount, computed with integer square root.
+# With g = 997/1000, the closed-form formula of find_opps.py simplifies to
+#   x = (g * sqrt(a1*b1*a2*b2) - a1*b2) / (g * (g*b1 + b2))
+# Multiplying numerator and denominator by 1000^2 keeps everything in integers.
+# Returns 0 when there is no profitable input in this direction.
+def optimal_trade_size(a1, b1, a2, b2):
+    if a1 <= 0 or b1 <= 0 or a2 <= 0 or b2 <= 0:
+        return 0
+    root = math.isqrt(a1 * b1 * a2 * b2 * FEE_NUMERATOR * FEE_NUMERATOR)
+    numerator = root * FEE_DENOMINATOR - a1 * b2 * FEE_DENOMINATOR * FEE_DENOMINATOR
+    if numerator <= 0:
+        return 0
+    denominator = FEE_NUMERATOR * (b1 * FEE_NUMERATOR + b2 * FEE_DENOMINATOR)
+    return numerator // denominator
+
+
+# Optimal input and exact profit of a single opportunity, as (amountIn, amountOut, profit)
+def evaluate(a1, b1, a2, b2):
+    x = optimal_trade_size(a1, b1, a2, b2)
+    if x == 0:
+        return 0, 0, 0
+    out = trade_output(x, a1, b1, a2, b2)
+    return x, out, out - x
+
+
+# Batch API: evaluate every (poolA, poolB) combination of a PairArrays (see opp_scanner.py) with the exact math.
+# reserveList is the raw output of getReservesParallel, in the pool order of pair_arrays.
+# If candidates is given (array of pool index pairs, e.g. from scan_opportunities()), only those are evaluated.
+# Returns a list of (poolA, poolB, amountIn, amountOut, profit) tuples with a positive exact profit, in Wei.
+def scan_opportunities_exact(pair_arrays, reserveList, candidates=None):
+    if candidates is None:
+        idx_a = pair_arrays.idx_a.tolist()
+        idx_b = pair_arrays.idx_b.tolist()
+    else:
+        idx_a = [int(i) for i in candidates["poolA"]]
+        idx_b = [int(i) for i in candidates["poolB"]]
+
+    # Orient the integer reserves once per pool, WETH first
+    weth_first = pair_arrays.weth_is_token0.tolist()
+    oriented = [
+        (r[0], r[1]) if first else (r[1], r[0])
+        for r, first in zip(reserveList, weth_first)
+    ]
+
+    # Bind the hot-path helpers to local names, this loop runs for every combination in pool_dict.
+    isqrt = math.isqrt
+    g = FEE_NUMERATOR
+    d = FEE_DENOMINATOR
+    results = []
+    append = results.append
+    for i, j in zip(idx_a, idx_b):
+        a1, b1 = oriented[i]
+        a2, b2 = oriented[j]
+        if not (a1 and b1 and a2 and b2):
+            continue
+
+        # Optimal input (inlined optimal_trade_size)
+        numerator = isqrt(a1 * b1 * a2 * b2 * g * g) * d - a1 * b2 * d * d
+        if numerator <= 0:
+            continue
+        x = numerator // (g * (b1 * g + b2 * d))
+        if x <= 0:
+            continue
+
+        # Exact swap outputs (inlined get_amount_out)
+        x_fee = x * g
+        out1 = x_fee * b1 // (a1 * d + x_fee)
+        out1_fee = out1 * g
+        out2 = out1_fee * a2 // (b2 * d + out1_fee)
+        if out2 > x:
+            append((i, j, x, out2, out2 - x))
+    return results
@@ -0,0 +1,33 @@
+# backtest() over an archive of the Sync logs of the mock node, with forked and with spawned workers.
+# Run with: python -m pytest "Part 3"
+import multiprocessing
+
+import backtester
+from log_archive import LogArchive
+from mock_node import SYNC_TOPIC, WETH, MockNode
+from opp_scanner import PairArrays
+
+
+def archived_node(path):
+    node = MockNode(poolCount=200, syncsPerBlock=20)
+    pool_dict = {}
+    for pool in node.pairDataList():
+        pool_dict.setdefault((pool["token0"], pool["token1"]), []).append(pool)
+    pair_arrays = PairArrays(pool_dict, WETH)
+    archive = LogArchive.create(path, pair_arrays.addresses(), node.block, [node.reserves(i) for i in range(node.poolCount)])
+    fromBlock = node.block + 1
+    node.mine(30)
+    logs = node.eth_getLogs([{"fromBlock": hex(fromBlock), "toBlock": hex(node.block), "topics": [SYNC_TOPIC]}])
+    archive.add_chunk(fromBlock, node.block, logs, [])
+    return archive, pair_arrays
+
+
+def test_spawned_workers_get_the_context(tmp_path, monkeypatch):
+    archive, pair_arrays = archived_node(str(tmp_path))
+    forked = backtester.backtest(archive.path, pair_arrays, archive.baseBlock + 1, archive.lastBlock, workers=2)
+    assert forked["blocks"] == 30 and forked["trades"] > 0
+
+    getContext = multiprocessing.get_context
+    monkeypatch.setattr(backtester.multiprocessing, "get_context", lambda method=None: getContext("spawn"))
+    spawned = backtester.backtest(archive.path, pair_arrays, archive.baseBlock + 1, archive.lastBlock, workers=2)
+    assert spawned == forked
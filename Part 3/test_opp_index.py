@@ -0,0 +1,38 @@
+# OpportunityIndex ranked by the gas of each combination, against scan_opportunities.
+# Run with: python -m pytest "Part 3"
+import numpy as np
+
+from opp_index import OpportunityIndex
+from opp_scanner import scan_opportunities
+from test_parallel_scanner import random_arrays
+
+
+def ranking(arrays, gas, gasPrice):
+    opps = scan_opportunities(arrays)
+    combos = {(a, b): c for c, (a, b) in enumerate(zip(arrays.idx_a.tolist(), arrays.idx_b.tolist()))}
+    net = [(profit - gas[combos[(a, b)]] * gasPrice / 1e18, a, b) for a, b, profit in zip(
+        opps["poolA"].tolist(), opps["poolB"].tolist(), opps["profit"].tolist()
+    )]
+    return sorted(net, reverse=True)
+
+
+def test_net_profit_uses_the_gas_of_each_combination():
+    arrays = random_arrays()
+    gas = np.random.default_rng(0).uniform(80000, 400000, len(arrays.idx_a))
+    index = OpportunityIndex(arrays, gas=gas, gasPrice=30 * 10**9)
+    index.build()
+    expected = ranking(arrays, gas, 30 * 10**9)
+    top = index.top(10)
+    assert [(key[1], key[2]) for key, _, _, _ in top] == [(a, b) for _, a, b in expected[:10]]
+    assert np.allclose([net for _, _, _, net in top], [net for net, _, _ in expected[:10]])
+
+    # Within the tolerance, the heap keeps its price
+    assert not index.set_gas_price(31 * 10**9, tolerance=0.05)
+    assert index.set_gas_price(300 * 10**9, tolerance=0.05)
+    expected = ranking(arrays, gas, 300 * 10**9)
+    assert [(key[1], key[2]) for key, _, _, _ in index.top(10)] == [(a, b) for _, a, b in expected[:10]]
+
+    arrays.reserves[7] *= 1.3
+    index.update([7])
+    expected = ranking(arrays, gas, 300 * 10**9)
+    assert index.best()[3] == expected[0][0] or np.isclose(index.best()[3], expected[0][0])
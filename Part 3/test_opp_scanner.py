@@ -0,0 +1,52 @@
+# Check the vectorized scan against the scalar functions of find_opps.py, on integer reserves.
+# Run with: python -m pytest "Part 3"
+import math
+import random
+
+import numpy as np
+
+from opp_scanner import evaluate_combinations, reference_tolerance
+
+
+# Scalar functions of find_opps.py
+def swap_output(x, a, b, fee=0.003):
+    return b * (1 - a/(a + x*(1-fee)))
+
+def trade_profit(x, reserves1, reserves2, fee=0.003):
+    a1, b1 = reserves1
+    a2, b2 = reserves2
+    return swap_output(swap_output(x, a1, b1, fee), b2, a2, fee) - x
+
+def optimal_trade_size(reserves1, reserves2, fee=0.003):
+    a1, b1 = reserves1
+    a2, b2 = reserves2
+    return (math.sqrt(a1*b1*a2*b2*(1-fee)**4 * (b1*(1-fee)+b2)**2) - a1*b2*(1-fee)*(b1*(1-fee)+b2)) / ((1-fee) * (b1*(1-fee) + b2))**2
+
+
+# Pairs of pools with random depths and prices. The price of the second pool is that of the first times the fee of
+# both swaps, off by a gap ranging from 1e-12 (near equilibrium, after an arbitrage) to 10%, in either direction.
+def random_pools(count, seed=0):
+    rng = random.Random(seed)
+    pools = []
+    for _ in range(count):
+        price = 10 ** rng.uniform(-6, 6)
+        gap = 1 + rng.choice((1, -1)) * 10 ** rng.uniform(-12, -1)
+        a1 = rng.randrange(10**15, 10**24)
+        a2 = rng.randrange(10**15, 10**24)
+        pools.append((a1, int(a1 * price), a2, int(a2 * price * 0.997**2 / gap)))
+    return pools
+
+
+def test_scan_matches_scalar_functions():
+    pools = random_pools(5000)
+    reserves = np.array([p[:2] for p in pools] + [p[2:] for p in pools], dtype=np.float64)
+    idx_a = np.arange(len(pools))
+    x, profit, ok = evaluate_combinations(reserves, idx_a, idx_a + len(pools))
+    assert ok.sum() > 1000
+
+    for k in np.nonzero(ok)[0].tolist():
+        a1, b1, a2, b2 = pools[k]
+        expected = optimal_trade_size((a1, b1), (a2, b2))
+        inputTolerance, profitTolerance = reference_tolerance(*reserves[k], *reserves[k + len(pools)])
+        assert abs(x[k] - expected) <= inputTolerance
+        assert abs(profit[k] - trade_profit(expected, (a1, b1), (a2, b2))) <= profitTolerance
@@ -0,0 +1,61 @@
+# ParallelScanner against scan_opportunities, across reserve updates and re-sharding.
+# Run with: python -m pytest "Part 3"
+import random
+
+import numpy as np
+
+from opp_scanner import PairArrays, scan_opportunities
+from parallel_scanner import ParallelScanner
+
+WETH = "0x" + "0" * 40
+
+
+def random_arrays(pairCount=50, poolsPerPair=3, seed=0):
+    rng = random.Random(seed)
+    pool_dict = {
+        (WETH, f"0x{i + 1:040x}"): [{"pair": f"0x{1000 + i*poolsPerPair + j:040x}"} for j in range(poolsPerPair)]
+        for i in range(pairCount)
+    }
+    arrays = PairArrays(pool_dict, WETH)
+    arrays.reserves[:] = [[rng.uniform(1e19, 1e21), rng.uniform(1e19, 1e21)] for _ in range(len(arrays.reserves))]
+    return arrays
+
+
+def found(opps):
+    return sorted(zip(opps["poolA"].tolist(), opps["poolB"].tolist()))
+
+
+def test_scanner_follows_reserves_and_combos():
+    arrays = random_arrays()
+    count = len(arrays.idx_a)
+    combos = np.arange(0, count, 2)
+    scanner = ParallelScanner(arrays, workers=4, combos=combos)
+    try:
+        assert found(scanner.scan(k=count)) == found(scan_opportunities(arrays, combos=combos))
+
+        arrays.reserves[5] *= 1.5
+        scanner.update_reserves({5})
+        combos = np.arange(count // 2)
+        scanner.set_combos(combos)
+        assert found(scanner.scan(k=count)) == found(scan_opportunities(arrays, combos=combos))
+
+        scanner.set_combos(np.arange(0))
+        assert len(scanner.scan(k=count)) == 0
+        scanner.set_combos(None)
+        assert found(scanner.scan(k=count)) == found(scan_opportunities(arrays))
+    finally:
+        scanner.close()
+
+
+def test_scanner_subtracts_the_pool_costs():
+    arrays = random_arrays()
+    poolCost = np.random.default_rng(1).uniform(0, 0.5, len(arrays.reserves))
+    scanner = ParallelScanner(arrays, workers=3)
+    try:
+        scanner.set_pool_cost(poolCost)
+        opps = scan_opportunities(arrays)
+        net = opps["profit"] - poolCost[opps["poolA"]] - poolCost[opps["poolB"]]
+        top = scanner.scan(gasCost=0.01, k=5)
+        assert np.allclose(top["net_profit"], np.sort(net)[::-1][:5] - 0.01)
+    finally:
+        scanner.close()
@@ -0,0 +1,92 @@
+# ReserveStore against the Sync logs of the mock node (mock_node.py), served without HTTP.
+# Run with: python -m pytest "Part 3"
+import asyncio
+
+from mock_node import SYNC_TOPIC, MockNode
+from reserve_store import ReserveStore
+
+
+# Async provider answering from the mock node, with the log filters encoded as in JSON-RPC
+class NodeProvider:
+    def __init__(self, node):
+        self.eth = self
+        self.node = node
+        self.getLogsCount = 0
+
+    @property
+    async def block_number(self):
+        return self.node.block
+
+    async def get_logs(self, logFilter):
+        self.getLogsCount += 1
+        query = dict(logFilter, fromBlock=hex(logFilter["fromBlock"]), toBlock=hex(logFilter["toBlock"]))
+        return self.node.eth_getLogs([query])
+
+
+def seeded_store(node):
+    store = ReserveStore([pool["pair"] for pool in node.pairDataList()])
+    store.seed([node.reserves(i) for i in range(node.poolCount)], node.block)
+    return store
+
+
+def test_seed_marks_every_pool_dirty():
+    node = MockNode(poolCount=100)
+    store = seeded_store(node)
+    assert store.take_dirty() == set(range(100))
+    assert store.take_dirty() == set()
+    assert store.reserves[7] == list(node.reserves(7)[:2])
+
+
+def test_update_applies_the_sync_logs_of_new_blocks():
+    node = MockNode(poolCount=1000, syncsPerBlock=20)
+    store = seeded_store(node)
+    store.take_dirty()
+    node.mine(5)
+    changed = set(i for block in range(node.block - 4, node.block + 1) for i in node.syncLogs[block])
+
+    updated = asyncio.run(store.update(NodeProvider(node)))
+    assert updated == 100
+    assert store.block == node.block
+    assert store.take_dirty() == changed
+    assert all(store.reserves[i] == list(node.reserves(i)[:2]) for i in range(node.poolCount))
+
+    # Nothing new
+    assert asyncio.run(store.update(NodeProvider(node))) == 0
+    assert store.take_dirty() == set()
+
+
+def test_update_splits_a_gap_over_the_log_limit():
+    node = MockNode(poolCount=1000, syncsPerBlock=50, logLimit=120)
+    store = seeded_store(node)
+    node.mine(40)
+    provider = NodeProvider(node)
+    assert asyncio.run(store.update(provider)) == 40 * 50
+    assert provider.getLogsCount > 1
+    assert all(store.reserves[i] == list(node.reserves(i)[:2]) for i in range(node.poolCount))
+
+
+def test_removed_and_stale_logs_are_ignored():
+    node = MockNode(poolCount=10)
+    store = seeded_store(node)
+    store.take_dirty()
+    address = node.pools[3][0]
+    data = "0x" + f"{5:064x}{6:064x}"
+    removed = {"address": address, "topics": [SYNC_TOPIC], "data": data, "blockNumber": hex(node.block + 1),
+               "logIndex": "0x0", "removed": True}
+    stale = dict(removed, blockNumber=hex(node.block - 1), removed=False)
+    assert store.apply_logs([removed, stale]) == 0
+    assert store.take_dirty() == set()
+
+
+def test_followers_get_the_same_logs():
+    node = MockNode(poolCount=200, syncsPerBlock=30)
+    pools = [pool["pair"] for pool in node.pairDataList()]
+    store = ReserveStore(pools[:50])
+    store.seed([node.reserves(i) for i in range(50)], node.block)
+    follower = seeded_store(node)
+    follower.take_dirty()
+    node.mine(3)
+    asyncio.run(store.update(NodeProvider(node), followers=[follower]))
+    assert follower.block == node.block
+    assert follower.take_dirty() == set(i for block in range(node.block - 2, node.block + 1) for i in node.syncLogs[block])
+    assert all(follower.reserves[i] == list(node.reserves(i)[:2]) for i in range(node.poolCount))
@@ -0,0 +1,63 @@
+# simulate() and simulate_opportunities() against a fake fork: reverts drop the candidate, transport errors are raised.
+# Run with: python -m pytest "Part 3"
+import asyncio
+
+import numpy as np
+import pytest
+from web3.exceptions import ContractLogicError
+
+from opp_scanner import OPP_DTYPE
+from simulator import SIMULATOR_ADDRESS, simulate, simulate_opportunities
+
+WETH = "0x" + "0" * 39 + "1"
+TOKEN = "0x" + "0" * 39 + "2"
+
+
+# eth_call of a fork where simulate() returns 1.1 times the input, unless the value matches one of the failures
+class FakeFork:
+    def __init__(self, failures=None):
+        self.eth = self
+        self.failures = failures or {}
+
+    async def call(self, tx, block, overrides):
+        assert SIMULATOR_ADDRESS in overrides
+        failure = self.failures.get(tx["value"])
+        if failure is not None:
+            raise failure
+        words = (tx["value"] * 11 // 10, 10**18, 10**18, 150000)
+        return b"".join(word.to_bytes(32, "big") for word in words)
+
+
+def candidates(inputs):
+    opps = np.zeros(len(inputs), dtype=OPP_DTYPE)
+    opps["poolA"] = 0
+    opps["poolB"] = 1
+    opps["input"] = inputs
+    return opps
+
+
+class Arrays:
+    pools = [
+        {"pair": "0x" + "a" * 40, "token0": WETH, "token1": TOKEN},
+        {"pair": "0x" + "b" * 40, "token0": WETH, "token1": TOKEN},
+    ]
+
+
+def test_reverts_drop_the_candidate():
+    fork = FakeFork({
+        2 * 10**18: ContractLogicError("execution reverted: UniswapV2: K"),
+        3 * 10**18: ValueError({"code": -32000, "message": "EVM error OutOfGas"}),
+    })
+    assert asyncio.run(simulate(fork, "0x00", *[pool["pair"] for pool in Arrays.pools], TOKEN, 10**18))[0] == 11 * 10**17
+    simulated = asyncio.run(simulate_opportunities(candidates([1.0, 2.0, 3.0]), Arrays, WETH, [fork], "0x00"))
+    assert simulated["ok"].tolist() == [True, False, False]
+    assert simulated["gas"][0] == 150000 + 21000
+
+
+def test_transport_errors_are_raised():
+    fork = FakeFork({2 * 10**18: ConnectionResetError("connection reset")})
+    with pytest.raises(ConnectionResetError):
+        asyncio.run(simulate_opportunities(candidates([1.0, 2.0]), Arrays, WETH, [fork], "0x00"))
+    fork = FakeFork({2 * 10**18: ValueError({"code": -32603, "message": "header not found"})})
+    with pytest.raises(ValueError):
+        asyncio.run(simulate_opportunities(candidates([1.0, 2.0]), Arrays, WETH, [fork], "0x00"))
@@ -0,0 +1,65 @@
+# TokenMetadata.refresh() against a fake Multicall3, with tokens that make the whole aggregate3() call fail.
+# Run with: python -m pytest "Part 3"
+import asyncio
+
+import pytest
+
+from token_metadata import DECIMALS_SELECTOR, TokenMetadata
+
+
+# Multicall3 answering 18 decimals and "ABC" for every token, except that a chunk with a bad token runs out of gas and
+# a chunk with a token on a down endpoint fails in transport
+class FakeMulticall:
+    def __init__(self, bad=(), down=()):
+        self.eth = self
+        self.functions = self
+        self.bad = set(bad)
+        self.down = set(down)
+        self.callCount = 0
+
+    def contract(self, address, abi):
+        return self
+
+    def aggregate3(self, calls):
+        return self._Call(self, calls)
+
+    class _Call:
+        def __init__(self, multicall, calls):
+            self.multicall = multicall
+            self.calls = calls
+
+        async def call(self):
+            self.multicall.callCount += 1
+            targets = {target.lower() for target, _, _ in self.calls}
+            if self.multicall.bad & targets:
+                raise ValueError({"code": -32000, "message": "out of gas"})
+            if self.multicall.down & targets:
+                raise ConnectionError("endpoint down")
+            return [
+                (True, (18).to_bytes(32, "big") if selector == DECIMALS_SELECTOR else b"ABC".ljust(32, b"\x00"))
+                for _, _, selector in self.calls
+            ]
+
+
+TOKENS = [f"0x{i + 1:040x}" for i in range(40)]
+
+
+def test_bad_tokens_are_isolated(tmp_path):
+    metadata = TokenMetadata(str(tmp_path / "tokens.sqlite"))
+    multicall = FakeMulticall(bad=[TOKENS[3], TOKENS[17]])
+    assert asyncio.run(metadata.refresh(TOKENS, [multicall], chunkSize=10)) == 40
+    assert metadata.decimals[TOKENS[3]] is None and metadata.decimals[TOKENS[17]] is None
+    assert metadata.decimals[TOKENS[4]] == 18 and metadata.symbols[TOKENS[4]] == "ABC"
+    assert metadata.missing(TOKENS) == []
+
+
+def test_transport_errors_keep_the_other_chunks(tmp_path):
+    metadata = TokenMetadata(str(tmp_path / "tokens.sqlite"))
+    multicall = FakeMulticall(down=[TOKENS[35]])
+    with pytest.raises(ConnectionError):
+        asyncio.run(metadata.refresh(TOKENS, [multicall], chunkSize=10))
+    assert metadata.missing(TOKENS) == TOKENS[30:]
+
+    multicall.down.clear()
+    assert asyncio.run(metadata.refresh(TOKENS, [multicall], chunkSize=10)) == 10
+    assert metadata.missing(TOKENS) == []
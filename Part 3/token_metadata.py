@@ -0,0 +1,198 @@
+# Token metadata (decimals, symbol, fee-on-transfer flag) fetched in batch and cached on disk.
+# decimals() and symbol() of thousands of tokens are read in a handful of eth_call requests through Multicall3's
+# aggregate3(), which keeps going when a token reverts. Only tokens missing from the cache are fetched, so the hot
+# path (valuation, filtering) never needs an RPC round-trip.
+# aggregate3() has no gas cap per call: a token that burns all the gas makes the whole eth_call fail. Such a chunk is
+# split in two until the token is isolated, and stored with unknown metadata.
+# A fee-on-transfer token cannot be recognised from a view call: the flag stays unknown (None) until the simulation
+# stage records it with set_fee_on_transfer().
+import asyncio
+import sqlite3
+
+import numpy as np
+from eth_utils import to_checksum_address
+from web3.exceptions import ContractLogicError
+
+# Multicall3, deployed at the same address on mainnet and most EVM chains
+MULTICALL3_ADDRESS = "0xcA11bde05977b3631167028862bE2a173976CA11"
+multicallAbi = [{"inputs": [
+            {
+                "components": [
+                    {"internalType": "address", "name": "target", "type": "address"},
+                    {"internalType": "bool", "name": "allowFailure", "type": "bool"},
+                    {"internalType": "bytes", "name": "callData", "type": "bytes"},
+                ],
+                "internalType": "struct Multicall3.Call3[]",
+                "name": "calls",
+                "type": "tuple[]",
+            }
+        ],
+        "name": "aggregate3",
+        "outputs": [
+            {
+                "components": [
+                    {"internalType": "bool", "name": "success", "type": "bool"},
+                    {"internalType": "bytes", "name": "returnData", "type": "bytes"},
+                ],
+                "internalType": "struct Multicall3.Result[]",
+                "name": "returnData",
+                "type": "tuple[]",
+            }
+        ],
+        "stateMutability": "payable",
+        "type": "function"}]
+
+DECIMALS_SELECTOR = bytes.fromhex("313ce567") # decimals()
+SYMBOL_SELECTOR = bytes.fromhex("95d89b41") # symbol()
+
+# Errors of an eth_call that failed on the node (revert, out of gas), as opposed to transport errors. web3 raises the
+# JSON-RPC error responses as ValueError.
+EXECUTION_ERRORS = (ContractLogicError, ValueError)
+
+
+def decode_uint(data):
+    return int.from_bytes(data[:32], "big") if len(data) >= 32 else None
+
+
+# symbol() returns a string for most tokens, and a bytes32 for a few old ones (e.g. MKR)
+def decode_symbol(data):
+    try:
+        if len(data) == 32:
+            return data.rstrip(b"\x00").decode("utf-8", "replace")
+        if len(data) >= 64:
+            offset = int.from_bytes(data[:32], "big")
+            length = int.from_bytes(data[offset : offset + 32], "big")
+            return data[offset + 32 : offset + 32 + length].decode("utf-8", "replace")
+    except (ValueError, IndexError):
+        pass
+    return None
+
+
+# asyncio.gather() that lets every coroutine finish before raising the first error, so that no chunk is left behind
+async def gather_all(coroutines):
+    results = await asyncio.gather(*coroutines, return_exceptions=True)
+    for result in results:
+        if isinstance(result, BaseException):
+            raise result
+    return results
+
+
+class TokenMetadata:
+    def __init__(self, path="tokens.sqlite"):
+        self.db = sqlite3.connect(path)
+        self.db.execute(
+            """
+            CREATE TABLE IF NOT EXISTS tokens (
+                token TEXT PRIMARY KEY,
+                decimals INTEGER,
+                symbol TEXT,
+                feeOnTransfer INTEGER
+            )
+            """
+        )
+        # In-memory copy for the hot path, keyed by lowercase address
+        self.decimals = {}
+        self.symbols = {}
+        self.feeOnTransfer = {}
+        for token, decimals, symbol, feeOnTransfer in self.db.execute("SELECT * FROM tokens"):
+            self.decimals[token] = decimals
+            self.symbols[token] = symbol
+            self.feeOnTransfer[token] = None if feeOnTransfer is None else bool(feeOnTransfer)
+
+    def close(self):
+        self.db.close()
+
+    def __contains__(self, token):
+        return token.lower() in self.decimals
+
+    # Tokens among `tokens` that are not cached yet
+    def missing(self, tokens):
+        return [token for token in tokens if token.lower() not in self.decimals]
+
+    def store(self, rows):
+        with self.db:
+            self.db.executemany("INSERT OR REPLACE INTO tokens VALUES (?, ?, ?, ?)", rows)
+        for token, decimals, symbol, feeOnTransfer in rows:
+            self.decimals[token] = decimals
+            self.symbols[token] = symbol
+            self.feeOnTransfer[token] = None if feeOnTransfer is None else bool(feeOnTransfer)
+
+    # Record the result of a transfer simulation for a token
+    def set_fee_on_transfer(self, token, feeOnTransfer):
+        token = token.lower()
+        with self.db:
+            self.db.execute("UPDATE tokens SET feeOnTransfer = ? WHERE token = ?", (int(feeOnTransfer), token))
+        self.feeOnTransfer[token] = bool(feeOnTransfer)
+
+    # Fetch decimals() and symbol() of the tokens that are not cached yet, chunkSize tokens per eth_call,
+    # spread over the providers in a round-robin fashion. Returns the number of tokens fetched.
+    # Each chunk is stored as soon as it completes. A chunk whose eth_call fails on the node is split in two and retried,
+    # a single token that still fails is stored with unknown metadata. Transport errors are raised once every other
+    # chunk is done, and the tokens of their chunk are fetched again by the next refresh.
+    async def refresh(self, tokens, providers, chunkSize=500):
+        tokens = self.missing(tokens)
+        if not tokens:
+            return 0
+        contracts = [provider.eth.contract(address=MULTICALL3_ADDRESS, abi=multicallAbi) for provider in providers]
+
+        async def fetch(i, chunk):
+            calls = []
+            for token in chunk:
+                target = to_checksum_address(token)
+                calls.append((target, True, DECIMALS_SELECTOR))
+                calls.append((target, True, SYMBOL_SELECTOR))
+            try:
+                results = await contracts[i % len(contracts)].functions.aggregate3(calls).call()
+            except EXECUTION_ERRORS:
+                if len(chunk) == 1:
+                    self.store([(chunk[0].lower(), None, None, None)])
+                    return 1
+                half = len(chunk) // 2
+                return sum(await gather_all([fetch(i, chunk[:half]), fetch(i + 1, chunk[half:])]))
+            rows = []
+            for k, token in enumerate(chunk):
+                decimalsOk, decimalsData = results[2 * k]
+                symbolOk, symbolData = results[2 * k + 1]
+                decimals = decode_uint(decimalsData) if decimalsOk else None
+                # Tokens without a valid decimals() are kept with NULL decimals, so that they are not fetched again
+                if decimals is not None and decimals > 255:
+                    decimals = None
+                symbol = decode_symbol(symbolData) if symbolOk else None
+                rows.append((token.lower(), decimals, symbol, None))
+            self.store(rows)
+            return len(rows)
+
+        chunks = [tokens[i : i + chunkSize] for i in range(0, len(tokens), chunkSize)]
+        return sum(await gather_all([fetch(i, chunk) for i, chunk in enumerate(chunks)]))
+
+    # Amount in the smallest unit of the token -> amount in token units, or None if decimals are unknown
+    def to_units(self, token, amount):
+        decimals = self.decimals.get(token.lower())
+        return None if decimals is None else amount / 10**decimals
+
+    # Whether a token can be traded by the bot: known decimals and not a known fee-on-transfer token
+    def tradable(self, token):
+        token = token.lower()
+        return self.decimals.get(token) is not None and not self.feeOnTransfer.get(token)
+
+    # Price of 1 ETH in units of `token`, from the raw reserves of a WETH/token pool
+    def eth_price(self, token, wethReserve, tokenReserve):
+        units = self.to_units(token, tokenReserve)
+        return None if units is None or wethReserve == 0 else units / (wethReserve / 1e18)
+
+    # Decimals (-1 if unknown) and tradable flag of every token of a PoolRegistry (see pool_registry.py), indexed by
+    # token id, for vectorized valuation and filtering
+    def registry_arrays(self, registry):
+        decimals = np.full(len(registry.tokens), -1, dtype=np.int16)
+        tradable = np.zeros(len(registry.tokens), dtype=bool)
+        for tokenId, token in enumerate(registry_tokens(registry)):
+            tokenDecimals = self.decimals.get(token)
+            if tokenDecimals is not None:
+                decimals[tokenId] = tokenDecimals
+                tradable[tokenId] = not self.feeOnTransfer.get(token)
+        return decimals, tradable
+
+
+# Lowercase addresses of the tokens of a PoolRegistry, without the cost of checksumming them
+def registry_tokens(registry):
+    return ["0x" + raw.hex() for raw in map(bytes, registry.tokens)]